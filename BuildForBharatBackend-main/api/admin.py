@@ -1,3 +1,51 @@
 from django.contrib import admin
+from django.http import FileResponse, Http404
+from django.urls import path, reverse
+from django.utils.html import format_html_join
 
-# Register your models here.
+from . import models, profiling
+
+
+@admin.register(models.RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = ('created_on', 'method', 'path', 'status_code', 'duration_ms', 'profiler', 'samples',
+                    'requested_by', 'files')
+    list_filter = ('profiler', 'method', 'route')
+    search_fields = ('path', 'route')
+    readonly_fields = [field.name for field in models.RequestProfile._meta.fields] + ['files']
+    date_hierarchy = 'created_on'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.display(description='Output')
+    def files(self, obj):
+        links = [('svg', 'flamegraph'), ('collapsed', 'collapsed')]
+        if obj.profiler == models.RequestProfile.PROFILER_CPROFILE:
+            links.append(('prof', 'pstats'))
+        return format_html_join(' / ', '<a href="{}">{}</a>', (
+            (reverse('admin:api_requestprofile_file', args=[obj.pk, extension]), label) for extension, label in links))
+
+    def get_urls(self):
+        return [
+            path('<int:pk>/<str:extension>/', self.admin_site.admin_view(self.file_view),
+                 name='api_requestprofile_file'),
+        ] + super().get_urls()
+
+    def file_view(self, request, pk, extension):
+        if extension not in ('svg', 'collapsed', 'prof') or not self.has_view_permission(request):
+            raise Http404
+        profile = self.get_object(request, pk)
+        if profile is None:
+            raise Http404
+        try:
+            file = open(profiling.file_path(profile, extension), 'rb')
+        except FileNotFoundError:
+            raise Http404
+        if extension == 'svg':
+            return FileResponse(file, content_type='image/svg+xml')
+        # collapsed stacks for speedscope or flamegraph.pl, pstats for snakeviz or `python -m pstats`
+        return FileResponse(file, as_attachment=True, filename=f'{profile.name}.{extension}')
@@ -0,0 +1,15 @@
+from django.urls import path
+from . import async_views
+
+# served in place of the matching api/urls.py routes by the ASGI application
+urlpatterns = [
+    # """ Authentication """,
+    path('register', async_views.AsyncUserRegisterView.as_view()),
+    path('login', async_views.AsyncUserLoginView.as_view()),
+
+    # """ Retrieve Data """
+    path('user-details', async_views.AsyncUserDetailsView.as_view()),
+    path('business-details', async_views.AsyncGetBusinessView.as_view()),
+    path('seller-details', async_views.AsyncSellerDetailsView.as_view()),
+    path('home', async_views.AsyncHomeView.as_view()),
+]
@@ -0,0 +1,161 @@
+import json
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.views import View
+
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+
+from . import hashers
+from . import models
+from . import readmodel
+from . import responsecache
+from . import serializers
+from .authentication import CachedJWTAuthentication, invalidate_user
+from .throttling import Limiter
+from .views import get_tokens_for_user
+
+
+def request_data(request):
+    """json or form body as a dict"""
+    if request.content_type == 'application/json':
+        try:
+            return json.loads(request.body or b'{}')
+        except ValueError:
+            return {}
+    return request.POST
+
+
+def failed_messages(errors):
+    messages: dict = {}
+    for key, value in dict(errors).items():
+        messages[key] = value[0]
+    return JsonResponse(data={'messages': messages, 'status': {'msg': 'failed', 'code': 220}})
+
+
+class AsyncAPIView(View):
+    """
+    Base for the async views served by the ASGI application. Like DRF's APIView
+    these are token authenticated, so they are exempt from CSRF checks. With
+    `authentication_required` the JWT is checked before the handler runs and
+    `request.user` / `request.auth` are set. A `throttle_scope` applies the same
+    THROTTLES policies as the sync views, before any handler work.
+    """
+    authentication_required = False
+    throttle_scope = None
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        view.csrf_exempt = True
+        return view
+
+    async def dispatch(self, request, *args, **kwargs):
+        if self.authentication_required:
+            authenticator = CachedJWTAuthentication()
+            try:
+                result = await authenticator.aauthenticate(request)
+            except AuthenticationFailed as exc:
+                return JsonResponse(exc.detail if isinstance(exc.detail, dict) else {'detail': exc.detail},
+                                    status=exc.status_code,
+                                    headers={'WWW-Authenticate': authenticator.authenticate_header(request)})
+            if result is None:
+                return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401,
+                                    headers={'WWW-Authenticate': authenticator.authenticate_header(request)})
+            request.user, request.auth = result
+        if self.throttle_scope is not None:
+            request.throttle_data = request_data(request)
+            wait = await Limiter(self.throttle_scope).ahit(request)
+            if wait is not None:
+                return JsonResponse({'detail': f'Request was throttled. Expected available in {wait} seconds.'},
+                                    status=429, headers={'Retry-After': str(wait)})
+        return await super().dispatch(request, *args, **kwargs)
+
+
+class AsyncUserRegisterView(AsyncAPIView):
+    """register with the password hash computed on the hasher pool"""
+    throttle_scope = 'register'
+
+    async def post(self, request, *args, **kwargs):
+        serializer = serializers.UserRegisterSerializer(data=request_data(request))
+        if not await sync_to_async(serializer.is_valid)():
+            return failed_messages(serializer.errors)
+        encoded_password = await hashers.amake_password(serializer.validated_data['password'])
+        user = await sync_to_async(serializer.save)(encoded_password=encoded_password)
+        token = await sync_to_async(get_tokens_for_user)(user)
+        return JsonResponse({'token': token, 'message': 'Registration Successful.',
+                             'status': {'code': 200, 'msg': 'success'}}, status=200)
+
+
+class AsyncUserLoginView(AsyncAPIView):
+    """login with the password check (and any policy re-hash) on the hasher pool"""
+    throttle_scope = 'login'
+
+    async def post(self, request, *args, **kwargs):
+        serializer = serializers.UserLoginSerializer(data=request_data(request))
+        if not serializer.is_valid():
+            return failed_messages(serializer.errors)
+        email = serializer.validated_data.get('email')
+        password = serializer.validated_data.get('password')
+
+        user = await models.User.objects.filter(email=email).afirst()
+        if user is None:
+            # same cost as a real check, so unknown emails can't be told apart by timing
+            await hashers.amake_password(password)
+            is_correct, must_update = False, False
+        else:
+            is_correct, must_update = await hashers.averify(password, user.password)
+
+        if not is_correct or not user.is_active:
+            return JsonResponse({'message': 'Username or Password is not Valid',
+                                 'status': {'msg': 'success', 'code': 230}}, status=404)
+
+        if must_update:
+            user.password = await hashers.amake_password(password)
+            await models.User.objects.filter(pk=user.pk).aupdate(password=user.password)
+            invalidate_user(user.pk)
+        token = await sync_to_async(get_tokens_for_user)(user)
+        return JsonResponse({'token': token, 'message': 'Login Successful.',
+                             'status': {'msg': 'success', 'code': 200}}, status=200)
+
+
+class AsyncUserDetailsView(AsyncAPIView):
+    authentication_required = True
+
+    @responsecache.aper_user('user-details')
+    async def get(self, request, *args, **kwargs):
+        profile = await readmodel.aget_profile(request.user.id)
+        return JsonResponse(data={'user': profile['user'], 'message': 'Successfully retrieved.',
+                                  'status': {'code': 200, 'msg': 'success'}})
+
+
+class AsyncSellerDetailsView(AsyncAPIView):
+    authentication_required = True
+
+    @responsecache.aper_user('seller-details')
+    async def get(self, request, *args, **kwargs):
+        profile = await readmodel.aget_profile(request.user.id)
+        if profile['seller_gst'] is None:
+            return JsonResponse({'detail': 'Not found.'}, status=404)
+        return JsonResponse(data={'seller_gst': profile['seller_gst'], 'message': 'Successfully retrieved.',
+                                  'status': {'code': 200, 'msg': 'success'}})
+
+
+class AsyncGetBusinessView(AsyncAPIView):
+    authentication_required = True
+
+    @responsecache.aper_user('business-details')
+    async def get(self, request, *args, **kwargs):
+        profile = await readmodel.aget_profile(request.user.id)
+        if profile['business'] is None:
+            return JsonResponse({'detail': 'Not found.'}, status=404)
+        return JsonResponse(data={'business': profile['business'], 'message': 'Successfully retrieved.',
+                                  'status': {'code': 200, 'msg': 'success'}})
+
+
+class AsyncHomeView(AsyncAPIView):
+    authentication_required = True
+
+    async def get(self, request, *args, **kwargs):
+        return JsonResponse(data={'message': 'You are authenticated', 'username': request.user.username},
+                            status=200)
@@ -0,0 +1,205 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from . import models
+
+DEFAULTS = {
+    'CACHE_ALIAS': 'default',
+    'KEY_PREFIX': 'auth-user',
+    'TIMEOUT': 300,             # seconds in the shared cache
+    'LOCAL_MAXSIZE': 1024,      # entries in the per-process LRU
+    'LOCAL_TTL': 30,            # seconds, bounds staleness of other processes' writes
+}
+
+# what permissions, views and mails read from request.user. never the password hash
+FIELDS = ('id', 'name', 'email', 'contact_number', 'is_active', 'is_staff', 'is_superuser')
+
+stats = {'local_hits': 0, 'shared_hits': 0, 'misses': 0}
+_stats_lock = threading.Lock()
+
+
+def user_cache_settings():
+    return {**DEFAULTS, **getattr(settings, 'AUTH_USER_CACHE', {})}
+
+
+class LRUCache:
+    """small thread safe LRU with a per entry time to live"""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+_conf = user_cache_settings()
+local_cache = LRUCache(_conf['LOCAL_MAXSIZE'], _conf['LOCAL_TTL'])
+
+
+def _record(key):
+    with _stats_lock:
+        stats[key] += 1
+
+
+def _cache_key(user_id):
+    return f'{user_cache_settings()["KEY_PREFIX"]}:{user_id}'
+
+
+def _payload(user):
+    """the cached form of `user`: FIELDS, and with CHECK_REVOKE_TOKEN the digest tokens carry"""
+    payload = {'db': user._state.db, 'fields': {field.attname: getattr(user, field.attname)
+                                                for field in models.User._meta.concrete_fields
+                                                if field.attname in FIELDS}}
+    if getattr(api_settings, 'CHECK_REVOKE_TOKEN', False):
+        from rest_framework_simplejwt.utils import get_md5_hash_password
+        payload['revoke'] = get_md5_hash_password(user.password)
+    return payload
+
+
+def _user(payload):
+    """a User with only FIELDS loaded, anything else is deferred"""
+    fields = payload['fields']
+    user = models.User.from_db(payload['db'], list(fields), list(fields.values()))
+    user._revoke_hash = payload.get('revoke')
+    return user
+
+
+def get_user(user_id):
+    """
+    Return the user, looking in the per-process LRU, then the shared cache and
+    only then in the database. Every caller gets its own instance, so views
+    may mutate it freely.
+    """
+    conf = user_cache_settings()
+    key = _cache_key(user_id)
+    payload = local_cache.get(key)
+    if payload is not None:
+        _record('local_hits')
+        return _user(payload)
+
+    shared = caches[conf['CACHE_ALIAS']]
+    payload = shared.get(key)
+    if payload is not None:
+        _record('shared_hits')
+    else:
+        _record('misses')
+        payload = _payload(models.User.objects.get(**{api_settings.USER_ID_FIELD: user_id}))
+        shared.set(key, payload, conf['TIMEOUT'])
+    local_cache.set(key, payload)
+    return _user(payload)
+
+
+async def aget_user(user_id):
+    """async get_user: the database is only reached through the async ORM"""
+    conf = user_cache_settings()
+    key = _cache_key(user_id)
+    payload = local_cache.get(key)
+    if payload is not None:
+        _record('local_hits')
+        return _user(payload)
+
+    shared = caches[conf['CACHE_ALIAS']]
+    payload = await shared.aget(key)
+    if payload is not None:
+        _record('shared_hits')
+    else:
+        _record('misses')
+        payload = _payload(await models.User.objects.aget(**{api_settings.USER_ID_FIELD: user_id}))
+        await shared.aset(key, payload, conf['TIMEOUT'])
+    local_cache.set(key, payload)
+    return _user(payload)
+
+
+def invalidate_user(user_id):
+    key = _cache_key(user_id)
+    local_cache.delete(key)
+    caches[user_cache_settings()['CACHE_ALIAS']].delete(key)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that resolves the `user_id` claim through the user cache
+    instead of querying the `User` table on every request. `aauthenticate` does
+    the same for the async views.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user = get_user(self.get_user_id(validated_token))
+        except self.user_model.DoesNotExist:
+            raise AuthenticationFailed(_('User not found'), code='user_not_found')
+        return self.check_user(user, validated_token)
+
+    async def aauthenticate(self, request):
+        """authenticate() for async views, returns (user, token) or None"""
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        try:
+            user = await aget_user(self.get_user_id(validated_token))
+        except self.user_model.DoesNotExist:
+            raise AuthenticationFailed(_('User not found'), code='user_not_found')
+        return self.check_user(user, validated_token), validated_token
+
+    @staticmethod
+    def get_user_id(validated_token):
+        try:
+            return validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+    @staticmethod
+    def check_user(user, validated_token):
+        if not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+
+        if getattr(api_settings, 'CHECK_REVOKE_TOKEN', False):
+            from rest_framework_simplejwt.utils import get_md5_hash_password
+            # the cached digest, user.password is deferred
+            expected = getattr(user, '_revoke_hash', None) or get_md5_hash_password(user.password)
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != expected:
+                raise AuthenticationFailed(_("The user's password has been changed."), code='password_changed')
+
+        return user
@@ -0,0 +1,183 @@
+import csv
+import io
+import json
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.core.validators import EmailValidator
+from django.db import IntegrityError, transaction
+
+from . import models
+from .util import validate_contact_number, validate_name
+
+FIELDS = ('name', 'email', 'contact_number')
+MAX_REPORTED_ERRORS = 1000
+
+validate_email = EmailValidator()
+
+
+def read_rows(file, format='csv'):
+    """
+    Yield (line number, row dict) from a binary file, one row at a time. `format`
+    is 'csv' (with a header row) or 'ndjson' (one JSON object per line).
+    """
+    text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    if format == 'csv':
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, row
+    elif format == 'ndjson':
+        for line_number, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield line_number, row if isinstance(row, dict) else {'__error__': 'Not a JSON object.'}
+    else:
+        raise ValueError(f'unknown import format {format!r}')
+
+
+def clean_row(row):
+    """(values, None) for a valid row, (None, {field: message}) otherwise"""
+    if '__error__' in row:
+        return None, {'row': row['__error__']}
+    values = {field: str(row.get(field) or '').strip() for field in FIELDS}
+    values['email'] = values['email'].lower()
+    errors = {}
+    for field, validate in (('name', validate_name), ('email', validate_email),
+                            ('contact_number', validate_contact_number)):
+        if not values[field]:
+            errors[field] = 'This field is required.'
+            continue
+        try:
+            validate(values[field])
+        except ValidationError as exc:
+            errors[field] = exc.messages[0]
+    # longer than the column is a DataError on mysql, and fails the whole chunk
+    for field in FIELDS:
+        max_length = models.User._meta.get_field(field).max_length
+        if len(values[field]) > max_length:
+            errors.setdefault(field, f'Ensure this field has no more than {max_length} characters.')
+    return (None, errors) if errors else (values, None)
+
+
+class ImportResult:
+
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.failed = 0
+
+    def as_dict(self):
+        return {'rows': self.rows, 'created': self.created, 'failed': self.failed}
+
+
+def _new_user(values):
+    # imported sellers have no password until they set one
+    return models.User(name=values['name'], email=values['email'], contact_number=values['contact_number'],
+                       password=make_password(None))
+
+
+def _insert_chunk(chunk, report):
+    """insert the valid rows of one chunk with two bulk inserts, returns the new user ids"""
+    from .signals import profile_changed
+
+    emails = {values['email'] for _, values in chunk}
+    numbers = {values['contact_number'] for _, values in chunk}
+    taken_emails = set(models.User.objects.filter(email__in=emails).values_list('email', flat=True))
+    taken_numbers = set(models.User.objects.filter(contact_number__in=numbers)
+                        .values_list('contact_number', flat=True))
+
+    rows = []
+    for line_number, values in chunk:
+        errors = {}
+        if values['email'] in taken_emails:
+            errors['email'] = 'This email is already in use.'
+        if values['contact_number'] in taken_numbers:
+            errors['contact_number'] = 'This contact number is already in use.'
+        if errors:
+            report(line_number, errors)
+            continue
+        # later duplicates inside the same chunk are reported against the first one
+        taken_emails.add(values['email'])
+        taken_numbers.add(values['contact_number'])
+        rows.append((line_number, values))
+    if not rows:
+        return []
+
+    try:
+        with transaction.atomic():
+            models.User.objects.bulk_create([_new_user(values) for _, values in rows])
+            # mysql doesn't return primary keys from bulk inserts, so they are read back
+            ids = list(models.User.objects.filter(email__in=[values['email'] for _, values in rows])
+                       .values_list('id', flat=True))
+            models.UserDetails.objects.bulk_create([models.UserDetails(user_id=user_id, is_seller=True)
+                                                    for user_id in ids])
+            # bulk inserts send no post_save, the profile snapshot, search entry and cached responses are ours
+            for user_id in ids:
+                profile_changed(user_id)
+        return ids
+    except IntegrityError:
+        # a concurrent registration took one of the emails or numbers: fall back to one row at a time
+        return _insert_rows(rows, report)
+
+
+def _insert_rows(rows, report):
+    ids = []
+    for line_number, values in rows:
+        try:
+            with transaction.atomic():
+                user = _new_user(values)
+                user.save()
+                models.UserDetails.objects.create(user_id=user.id, is_seller=True)
+        except IntegrityError as exc:
+            report(line_number, {'row': str(exc)})
+        else:
+            ids.append(user.id)
+    return ids
+
+
+def import_sellers(rows, chunk_size=500, report=None, on_created=None):
+    """
+    Validate and insert sellers from an iterable of (line number, row dict).
+    Rows are consumed `chunk_size` at a time, so memory stays flat whatever the
+    size of the file. `report(line_number, errors)` receives every rejected row
+    and `on_created(user_ids)` the ids of each inserted chunk.
+    """
+    result = ImportResult()
+
+    def failed(line_number, errors):
+        result.failed += 1
+        if report is not None:
+            report(line_number, errors)
+
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, chunk_size))
+        if not batch:
+            return result
+        result.rows += len(batch)
+        chunk = []
+        for line_number, row in batch:
+            values, errors = clean_row(row)
+            if errors:
+                failed(line_number, errors)
+            else:
+                chunk.append((line_number, values))
+        if chunk:
+            ids = _insert_chunk(chunk, failed)
+            result.created += len(ids)
+            if ids and on_created is not None:
+                on_created(ids)
+
+
+def notify(user_ids):
+    """issue and queue an email verification otp to each imported seller"""
+    from . import otp
+    from .mailservice import SendMail
+
+    for user in models.User.objects.filter(id__in=user_ids).only('id', 'name', 'email'):
+        SendMail.send_otp(user, otp.issue('email', user.id), 'email')
@@ -0,0 +1,11 @@
+from django.db.backends.mysql import base
+
+from ..pool import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    """django's MySQL backend with pooled connections, ENGINE = 'api.db.mysql'"""
+
+    def ping_connection(self, connection):
+        # a protocol level ping, no query round trip through the parser
+        connection.ping()
@@ -0,0 +1,253 @@
+import os
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.db.utils import OperationalError
+
+DEFAULTS = {
+    'MIN_SIZE': 2,                  # connections opened up front and kept when idle
+    'MAX_SIZE': 20,                 # per process, including connections in use
+    'TIMEOUT': 5,                   # seconds a checkout waits for a free connection
+    'MAX_LIFETIME': 1800,           # seconds before a connection is replaced
+    'IDLE_TIMEOUT': 300,            # seconds an idle connection above MIN_SIZE is kept
+    'PRE_PING': True,               # check a connection before handing it out
+}
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def pool_settings(settings_dict):
+    """DATABASE_POOL overridden by the database's own POOL entry"""
+    return {**DEFAULTS, **getattr(settings, 'DATABASE_POOL', {}), **settings_dict.get('POOL', {})}
+
+
+class PoolTimeout(OperationalError):
+    pass
+
+
+class ConnectionPool:
+    """
+    A thread safe pool of raw DB-API connections. `connect()` opens a new one,
+    `ping(connection)` raises when it is no longer usable. Idle connections are
+    reused most recently returned first, so the ones above MIN_SIZE go idle
+    and get closed after IDLE_TIMEOUT.
+    """
+
+    def __init__(self, connect, ping, min_size=2, max_size=20, timeout=5, max_lifetime=1800, idle_timeout=300,
+                 pre_ping=True):
+        self.connect = connect
+        self.ping = ping
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.idle_timeout = idle_timeout
+        self.pre_ping = pre_ping
+        self._lock = threading.Condition()
+        self._idle = deque()        # (connection, opened at, returned at)
+        self._opened = {}           # id(connection) -> opened at, for connections in use
+        self._size = 0
+        self._waiting = 0
+        self._stats = {'checkouts': 0, 'timeouts': 0, 'opened': 0, 'closed': 0, 'ping_failures': 0,
+                       'wait_seconds': 0.0, 'max_wait_seconds': 0.0}
+
+    def fill(self):
+        """open connections until MIN_SIZE are pooled"""
+        while True:
+            with self._lock:
+                if self._size >= self.min_size:
+                    return
+                self._size += 1
+            connection = self._open()
+            with self._lock:
+                self._idle.append((connection, self._opened.pop(id(connection)), time.monotonic()))
+                self._lock.notify()
+
+    def checkout(self):
+        start = time.monotonic()
+        deadline = start + self.timeout
+        while True:
+            connection, opened = self._take(deadline)
+            if connection is None:
+                # a slot was reserved for a new connection
+                connection = self._open()
+                break
+            if not self.pre_ping or self._healthy(connection):
+                break
+            self._discard(connection)
+        waited = time.monotonic() - start
+        with self._lock:
+            if opened is not None:
+                self._opened[id(connection)] = opened
+            self._stats['checkouts'] += 1
+            self._stats['wait_seconds'] += waited
+            self._stats['max_wait_seconds'] = max(self._stats['max_wait_seconds'], waited)
+        return connection
+
+    def checkin(self, connection, discard=False):
+        """give back a connection from `checkout`, closing it when it is broken or too old"""
+        now = time.monotonic()
+        with self._lock:
+            opened = self._opened.pop(id(connection), None)
+            if opened is None:
+                # checked out of a pool that has been closed since
+                self._close(connection)
+            elif discard or now - opened >= self.max_lifetime:
+                self._size -= 1
+                self._close(connection)
+            else:
+                self._idle.append((connection, opened, now))
+                self._close_idle(now)
+            self._lock.notify()
+
+    def _take(self, deadline):
+        """an idle (connection, opened at), or (None, None) after reserving a slot for a new one"""
+        with self._lock:
+            while True:
+                while self._idle:
+                    connection, opened, _ = self._idle.pop()
+                    if time.monotonic() - opened < self.max_lifetime:
+                        return connection, opened
+                    self._size -= 1
+                    self._close(connection)
+                if self._size < self.max_size:
+                    self._size += 1
+                    return None, None
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeout(f'No database connection became free within {self.timeout}s '
+                                      f'({self.max_size} in use).')
+                self._waiting += 1
+                try:
+                    self._lock.wait(remaining)
+                finally:
+                    self._waiting -= 1
+
+    def _open(self):
+        try:
+            connection = self.connect()
+        except BaseException:
+            with self._lock:
+                self._size -= 1
+                self._lock.notify()
+            raise
+        with self._lock:
+            self._opened[id(connection)] = time.monotonic()
+            self._stats['opened'] += 1
+        return connection
+
+    def _healthy(self, connection):
+        try:
+            self.ping(connection)
+            return True
+        except Exception:
+            with self._lock:
+                self._stats['ping_failures'] += 1
+            return False
+
+    def _discard(self, connection):
+        with self._lock:
+            self._size -= 1
+            self._close(connection)
+            self._lock.notify()
+
+    def _close_idle(self, now):
+        # called with the lock held, the longest idle are at the left end
+        while self._size > self.min_size and self._idle and now - self._idle[0][2] >= self.idle_timeout:
+            connection, _, _ = self._idle.popleft()
+            self._size -= 1
+            self._close(connection)
+
+    def _close(self, connection):
+        # called with the lock held
+        self._stats['closed'] += 1
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def close(self):
+        """close the idle connections, the ones in use are closed when given back"""
+        with self._lock:
+            while self._idle:
+                connection, _, _ = self._idle.pop()
+                self._size -= 1
+                self._close(connection)
+
+    def stats(self):
+        with self._lock:
+            return {'size': self._size, 'idle': len(self._idle), 'in_use': self._size - len(self._idle),
+                    'waiting': self._waiting, **self._stats}
+
+
+def get_pool(alias, connect, ping, settings_dict):
+    """the process' pool for `alias`, a forked worker gets its own"""
+    key = (alias, os.getpid())
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                conf = pool_settings(settings_dict)
+                pool = ConnectionPool(connect, ping, min_size=conf['MIN_SIZE'], max_size=conf['MAX_SIZE'],
+                                      timeout=conf['TIMEOUT'], max_lifetime=conf['MAX_LIFETIME'],
+                                      idle_timeout=conf['IDLE_TIMEOUT'], pre_ping=conf['PRE_PING'])
+                for stale in [other for other in _pools if other[0] == alias]:
+                    del _pools[stale]
+                _pools[key] = pool
+                pool.fill()
+    return pool
+
+
+def stats():
+    """{alias: pool stats} of this process"""
+    pid = os.getpid()
+    return {alias: pool.stats() for (alias, owner), pool in list(_pools.items()) if owner == pid}
+
+
+def close_all():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+
+
+class PooledDatabaseWrapperMixin:
+    """
+    Mixed into a backend's DatabaseWrapper: new connections are checked out of
+    the alias' pool and closing gives them back. With CONN_MAX_AGE = 0 every
+    request, WSGI thread or ASGI, borrows a connection for its duration only.
+    """
+
+    def ping_connection(self, connection):
+        cursor = connection.cursor()
+        try:
+            cursor.execute('SELECT 1')
+        finally:
+            cursor.close()
+
+    def pool_enabled(self):
+        return True
+
+    def _connection_pool(self, conn_params):
+        return get_pool(self.alias, lambda: super(PooledDatabaseWrapperMixin, self).get_new_connection(conn_params),
+                        self.ping_connection, self.settings_dict)
+
+    def get_new_connection(self, conn_params):
+        if not self.pool_enabled():
+            return super().get_new_connection(conn_params)
+        return self._connection_pool(conn_params).checkout()
+
+    def _close(self):
+        if self.connection is None or not self.pool_enabled():
+            return super()._close()
+        pool = _pools.get((self.alias, os.getpid()))
+        if pool is None:
+            # the pool was closed since this connection was checked out
+            return super()._close()
+        # a connection left inside a transaction can't be handed to another request
+        pool.checkin(self.connection, discard=self.in_atomic_block or not self.get_autocommit())
@@ -0,0 +1,21 @@
+from django.db.backends.sqlite3 import base
+
+from ..pool import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    """
+    django's SQLite backend with pooled connections, ENGINE = 'api.db.sqlite3'.
+    A stand-in for exercising the pool locally, in-memory databases aren't pooled.
+    """
+    # a transaction holds the database's only write lock from its first statement, so
+    # work that must commit separately can't use a second connection, see sellerids
+    single_writer = True
+
+    def pool_enabled(self):
+        return not self.is_in_memory_db()
+
+    def _start_transaction_under_autocommit(self):
+        # take the write lock up front: concurrent writers then wait for the busy timeout
+        # instead of failing with "database is locked" when a read lock can't be upgraded
+        self.cursor().execute('BEGIN IMMEDIATE')
@@ -2,8 +2,10 @@ from datetime import datetime
 
 
 def gst_certificate_path(instance, filename):
-    return f'thumb/categories/{datetime.now().year}/{datetime.now().month}/{datetime.now().day}/{instance}-{filename}'
+    now = datetime.now()
+    return f'thumb/categories/{now.year}/{now.month}/{now.day}/{instance}-{filename}'
 
 
 def business_profile_pic_path(instance, filename):
-    return f'business/pic/{datetime.now().year}/{datetime.now().month}/{datetime.now().day}/{instance}-{filename}'
+    now = datetime.now()
+    return f'business/pic/{now.year}/{now.month}/{now.day}/{instance}-{filename}'
@@ -0,0 +1,100 @@
+import os
+import re
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+
+from .registry import Registry, build
+
+DEFAULTS = {
+    'PATH': os.path.join(settings.BASE_DIR, 'data', 'gst_registry.bin'),
+    'CHECK_INTERVAL': 60,       # seconds between checks for a replaced snapshot
+}
+
+GSTIN_RE = re.compile(r'^[0-9]{2}[A-Z]{5}[0-9]{4}[A-Z][1-9A-Z]Z[0-9A-Z]$')
+CHARSET = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+CHAR_VALUES = {char: value for value, char in enumerate(CHARSET)}
+
+STATE_CODES = {
+    '01': 'Jammu and Kashmir', '02': 'Himachal Pradesh', '03': 'Punjab', '04': 'Chandigarh',
+    '05': 'Uttarakhand', '06': 'Haryana', '07': 'Delhi', '08': 'Rajasthan', '09': 'Uttar Pradesh',
+    '10': 'Bihar', '11': 'Sikkim', '12': 'Arunachal Pradesh', '13': 'Nagaland', '14': 'Manipur',
+    '15': 'Mizoram', '16': 'Tripura', '17': 'Meghalaya', '18': 'Assam', '19': 'West Bengal',
+    '20': 'Jharkhand', '21': 'Odisha', '22': 'Chhattisgarh', '23': 'Madhya Pradesh', '24': 'Gujarat',
+    '26': 'Dadra and Nagar Haveli and Daman and Diu', '27': 'Maharashtra', '28': 'Andhra Pradesh (old)',
+    '29': 'Karnataka', '30': 'Goa', '31': 'Lakshadweep', '32': 'Kerala', '33': 'Tamil Nadu',
+    '34': 'Puducherry', '35': 'Andaman and Nicobar Islands', '36': 'Telangana', '37': 'Andhra Pradesh',
+    '38': 'Ladakh', '97': 'Other Territory', '99': 'Centre Jurisdiction',
+}
+
+# registry record fields, in file order
+FIELDS = ('legal_name', 'trade_name', 'status')
+KEY_SIZE = 15
+RECORD_SIZE = 256
+STATUS_ACTIVE = 'Active'
+
+
+def gst_registry_settings():
+    return {**DEFAULTS, **getattr(settings, 'GST_REGISTRY', {})}
+
+
+def check_digit(gstin):
+    """mod 36 check character of the first 14 characters of a GSTIN"""
+    total = 0
+    for position, char in enumerate(gstin[:14]):
+        product = CHAR_VALUES[char] * (2 if position % 2 else 1)
+        total += product // 36 + product % 36
+    return CHARSET[(36 - total % 36) % 36]
+
+
+def validate(gstin):
+    """return the normalized GSTIN, raise ValidationError when it can't be a real one"""
+    gstin = (gstin or '').strip().upper()
+    if not GSTIN_RE.match(gstin):
+        raise ValidationError('Enter a valid 15 character GST number.')
+    if gstin[:2] not in STATE_CODES:
+        raise ValidationError('GST number has an unknown state code.')
+    if check_digit(gstin) != gstin[14]:
+        raise ValidationError('GST number check digit does not match.')
+    return gstin
+
+
+_conf = gst_registry_settings()
+registry = Registry(_conf['PATH'], _conf['CHECK_INTERVAL'])
+
+
+def normalize_status(status):
+    """the registry's spelling of a status, 'ACTIVE ' and 'active' are 'Active'"""
+    return ' '.join(status.split()).capitalize()
+
+
+def lookup(gstin):
+    """the registry snapshot entry of a validated GSTIN as a dict, None when it isn't listed"""
+    fields = registry.get(gstin)
+    if fields is None:
+        return None
+    entry = dict(zip(FIELDS, fields + [''] * (len(FIELDS) - len(fields))))
+    # snapshots built before statuses were normalized
+    entry['status'] = normalize_status(entry['status'])
+    return entry
+
+
+def build_registry(path, rows):
+    """
+    Write a registry snapshot from (gstin, legal_name, trade_name, status) rows,
+    statuses normalized. Invalid GSTINs are skipped; returns (written, skipped).
+    """
+    skipped = 0
+
+    def records():
+        nonlocal skipped
+        for gstin, *fields in rows:
+            if len(fields) >= len(FIELDS):
+                fields[FIELDS.index('status')] = normalize_status(fields[FIELDS.index('status')])
+            try:
+                yield validate(gstin), fields
+            except ValidationError:
+                skipped += 1
+
+    written = build(path, records(), KEY_SIZE, RECORD_SIZE)
+    return written, skipped
@@ -0,0 +1,88 @@
+import asyncio
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import (PBKDF2PasswordHasher, get_hasher, identify_hasher, is_password_usable,
+                                         make_password)
+from django.utils.crypto import constant_time_compare
+
+from . import metrics
+
+DEFAULTS = {
+    'ITERATIONS': None,         # None keeps Django's default work factor
+    'EXECUTOR': 'thread',       # 'thread' (hashlib releases the GIL) or 'process'
+    'WORKERS': 4,
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def hasher_policy():
+    return {**DEFAULTS, **getattr(settings, 'PASSWORD_HASHER_POLICY', {})}
+
+
+class PolicyPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """
+    PBKDF2 with the iteration count taken from PASSWORD_HASHER_POLICY. Hashes made
+    with any other count report `must_update`, so they are re-hashed on the next
+    successful login.
+    """
+
+    @property
+    def iterations(self):
+        return hasher_policy()['ITERATIONS'] or PBKDF2PasswordHasher.iterations
+
+    def encode(self, password, salt, iterations=None):
+        with metrics.timed('password_hash_duration_seconds', operation='encode'):
+            return super().encode(password, salt, iterations)
+
+    def verify(self, password, encoded):
+        # PBKDF2PasswordHasher.verify, hashing through the parent so it isn't also timed as an encode
+        with metrics.timed('password_hash_duration_seconds', operation='verify'):
+            decoded = self.decode(encoded)
+            return constant_time_compare(encoded, super().encode(password, decoded['salt'], decoded['iterations']))
+
+
+def verify(password, encoded):
+    """return (is_correct, must_update) for `password` against the stored hash"""
+    if password is None or not is_password_usable(encoded):
+        return False, False
+    try:
+        hasher = identify_hasher(encoded)
+    except ValueError:
+        return False, False
+    preferred = get_hasher('default')
+    hasher_changed = hasher.algorithm != preferred.algorithm
+    must_update = hasher_changed or preferred.must_update(encoded)
+    is_correct = hasher.verify(password, encoded)
+    if not is_correct and not hasher_changed and must_update:
+        # keep failed logins as slow as successful ones
+        hasher.harden_runtime(password, encoded)
+    return is_correct, must_update
+
+
+def _setup_worker():
+    import django
+    django.setup()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            policy = hasher_policy()
+            if policy['EXECUTOR'] == 'process':
+                _executor = ProcessPoolExecutor(max_workers=policy['WORKERS'], initializer=_setup_worker)
+            else:
+                _executor = ThreadPoolExecutor(max_workers=policy['WORKERS'], thread_name_prefix='password-hasher')
+        return _executor
+
+
+async def averify(password, encoded):
+    return await asyncio.get_running_loop().run_in_executor(get_executor(), verify, password, encoded)
+
+
+async def amake_password(password):
+    return await asyncio.get_running_loop().run_in_executor(get_executor(), make_password, password)
@@ -0,0 +1,85 @@
+import os
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+
+from .registry import Registry, build
+
+DEFAULTS = {
+    'PATH': os.path.join(settings.BASE_DIR, 'data', 'ifsc_directory.bin'),
+    'CHECK_INTERVAL': 60,       # seconds between checks for a replaced directory file
+    'CACHE_SIZE': 4096,         # recently looked up codes kept decoded per process
+}
+
+IFSC_RE = re.compile(r'^[A-Z]{4}0[A-Z0-9]{6}$')
+
+# directory record fields, in file order
+FIELDS = ('bank', 'branch', 'city')
+KEY_SIZE = 11
+RECORD_SIZE = 128
+
+
+def ifsc_settings():
+    return {**DEFAULTS, **getattr(settings, 'IFSC_DIRECTORY', {})}
+
+
+_conf = ifsc_settings()
+directory = Registry(_conf['PATH'], _conf['CHECK_INTERVAL'])
+
+
+def normalize(code):
+    return (code or '').strip().upper()
+
+
+@lru_cache(maxsize=_conf['CACHE_SIZE'])
+def _lookup(code, identity):
+    # `identity` is the open directory file's, so a replaced file never serves stale entries
+    fields = directory.get(code)
+    return None if fields is None else tuple(fields + [''] * (len(FIELDS) - len(fields)))
+
+
+def lookup(code):
+    """bank, branch and city of an IFSC, None when it is malformed or not in the directory"""
+    code = normalize(code)
+    if not IFSC_RE.match(code):
+        return None
+    state = directory.state()
+    if state is None:
+        return None
+    fields = _lookup(code, state[4])
+    return None if fields is None else dict(zip(FIELDS, fields))
+
+
+def validate(code):
+    """
+    Return the normalized IFSC, raise ValidationError when it is malformed or,
+    with a directory installed, not listed in it.
+    """
+    code = normalize(code)
+    if not IFSC_RE.match(code):
+        raise ValidationError('Enter a valid 11 character IFSC code.')
+    if directory.state() is not None and lookup(code) is None:
+        raise ValidationError('IFSC code not found.')
+    return code
+
+
+def build_directory(path, rows):
+    """
+    Write the directory file from (ifsc, bank, branch, city) rows. Malformed
+    codes are skipped; returns (written, skipped).
+    """
+    skipped = 0
+
+    def records():
+        nonlocal skipped
+        for code, *fields in rows:
+            code = normalize(code)
+            if IFSC_RE.match(code):
+                yield code, fields
+            else:
+                skipped += 1
+
+    written = build(path, records(), KEY_SIZE, RECORD_SIZE)
+    return written, skipped
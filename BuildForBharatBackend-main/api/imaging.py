@@ -0,0 +1,144 @@
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'SIZES': {                      # variant name -> bounding box in pixels
+        'thumb': (240, 240),
+        'display': (1080, 1080),
+    },
+    'QUALITY': 80,
+    'WORKERS': 2,
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def image_settings():
+    return {**DEFAULTS, **getattr(settings, 'IMAGE_VARIANTS', {})}
+
+
+def variant_name(name, variant):
+    """storage name of a variant, derived from the original so it needs no extra columns"""
+    stem, _ = os.path.splitext(name)
+    return f'variants/{stem}__{variant}.jpg'
+
+
+def variant_storage():
+    return default_storage
+
+
+def variant_urls(field_file):
+    """
+    URLs of the original and every generated variant. Variants that are not
+    ready yet fall back to the original.
+    """
+    if not field_file:
+        return None
+    original = field_file.url
+    storage = variant_storage()
+    urls = {'original': original}
+    for variant in image_settings()['SIZES']:
+        name = variant_name(field_file.name, variant)
+        urls[variant] = storage.url(name) if storage.exists(name) else original
+    return urls
+
+
+def is_image(name):
+    """whether pillow can read files named like `name`, PDF certificates for one get no variants"""
+    from PIL import Image
+
+    return Image.registered_extensions().get(os.path.splitext(name)[1].lower()) in Image.OPEN
+
+
+def generate_variants(field_file):
+    """write a downscaled JPEG per configured size, largest first, and return their names"""
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    from .storage import ContentAddressedStorage
+
+    conf = image_settings()
+    storage = variant_storage()
+    names = [variant_name(field_file.name, variant) for variant in conf['SIZES']]
+    if isinstance(field_file.storage, ContentAddressedStorage) and all(storage.exists(name) for name in names):
+        # a content addressed original never changes, so a duplicate upload reuses its variants
+        return names
+    sizes = sorted(conf['SIZES'].items(), key=lambda item: item[1][0] * item[1][1], reverse=True)
+    names = []
+    with field_file.storage.open(field_file.name, 'rb') as source:
+        try:
+            image = Image.open(source)
+        except UnidentifiedImageError:
+            # an image extension on something else, it is served as is
+            return []
+        # lets the JPEG decoder skip straight to a reduced scale for big camera images
+        image.draft('RGB', sizes[0][1])
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        for variant, size in sizes:
+            image.thumbnail(size, Image.LANCZOS)
+            buffer = io.BytesIO()
+            image.save(buffer, 'JPEG', quality=conf['QUALITY'], optimize=True, progressive=True)
+            name = variant_name(field_file.name, variant)
+            if storage.exists(name):
+                storage.delete(name)
+            names.append(storage.save(name, ContentFile(buffer.getvalue())))
+    return names
+
+
+def process(model_label, pk, field_name):
+    """worker task: build the variants of one image field, then refresh the owner's profile"""
+    from .signals import profile_changed
+
+    try:
+        instance = apps.get_model(model_label).objects.filter(pk=pk).first()
+        if instance is None or not getattr(instance, field_name):
+            return
+        generate_variants(getattr(instance, field_name))
+        profile_changed(instance.user_id)
+    except Exception:
+        logger.exception('image variants failed for %s %s.%s', model_label, pk, field_name)
+
+
+def _run_worker(model_label, pk, field_name):
+    try:
+        process(model_label, pk, field_name)
+    finally:
+        connections.close_all()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=image_settings()['WORKERS'], thread_name_prefix='imaging')
+        return _executor
+
+
+def wait():
+    """let the scheduled variants finish and stop the workers, the next schedule starts new ones"""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+
+def schedule_variants(instance, field_name):
+    """generate variants for `instance.<field_name>` on the worker pool once the upload is committed"""
+    if not is_image(getattr(instance, field_name).name):
+        return
+    label = instance._meta.label
+    transaction.on_commit(lambda: get_executor().submit(_run_worker, label, instance.pk, field_name))
@@ -0,0 +1,118 @@
+import math
+import random
+
+from .gstin import check_digit
+
+
+def percentile(samples, fraction):
+    """nearest-rank percentile of an already sorted list"""
+    if not samples:
+        return None
+    return samples[min(len(samples) - 1, max(math.ceil(fraction * len(samples)) - 1, 0))]
+
+
+def summarize(latencies, elapsed=None, errors=0):
+    """
+    Latency percentiles (milliseconds) for one run, and its throughput when
+    `elapsed` is the wall time the latencies were all measured in. A share of
+    a mixed run has no throughput of its own.
+    """
+    samples = sorted(latencies)
+    summary = {'requests': len(samples), 'errors': errors}
+    if elapsed is not None:
+        summary['throughput'] = round(len(samples) / elapsed, 2) if elapsed else None
+    summary.update({
+        'p50_ms': round(percentile(samples, 0.50) * 1000, 3) if samples else None,
+        'p95_ms': round(percentile(samples, 0.95) * 1000, 3) if samples else None,
+        'p99_ms': round(percentile(samples, 0.99) * 1000, 3) if samples else None,
+    })
+    return summary
+
+
+GIVEN_NAMES = (
+    'aarav aditya akash amit anand anil anita arjun asha ashok bharat chetan deepak dinesh divya gaurav geeta '
+    'harish hemant isha jagdish jaya kamal kavita kiran krishna lakshmi mahesh manoj meena mohan mukesh naresh '
+    'neha nikhil pankaj pooja prakash pradeep priya rahul rajesh rakesh ramesh ravi rekha rohit sachin sanjay '
+    'santosh sarita shanti shiv sita sunil suresh swati usha vijay vikram vinod yogesh'
+).split()
+SURNAMES = (
+    'agarwal ahmed bansal bhat chauhan chopra das desai dubey gandhi ghosh goyal gupta iyer jain joshi kapoor '
+    'khan kulkarni kumar malhotra mehta menon mishra nair pandey patel pillai rao reddy saxena sethi shah sharma '
+    'shetty singh sinha srivastava thakur tiwari trivedi verma yadav'
+).split()
+TRADES = (
+    'agencies associates brothers collections creations distributors enterprises exports garments handicrafts '
+    'impex industries jewellers mart sales stores suppliers textiles traders trading udyog ventures'
+).split()
+GOODS = (
+    'agro ayurvedic bamboo brass cotton crafts dairy electricals fabrics foods footwear furniture grains herbal '
+    'khadi leather organic pickles pottery sarees silk spices steel sweets tea toys'
+).split()
+PLACES = (
+    'agra ahmedabad bengaluru bhopal chennai delhi goa guwahati hyderabad indore jaipur kanpur kochi kolkata '
+    'lucknow ludhiana madurai mumbai mysuru nagpur nashik patna pune raipur ranchi surat varanasi'
+).split()
+SYLLABLES = 'ka ri sh ma vi ra ni tha de va lo ku su pa ya ga na ji ro mi'.split()
+
+
+def fake_sellers(count, seed=0):
+    """
+    Yield `count` dicts of plausible seller names: name, trade_name,
+    legal_name, business_name and store_name. Deterministic for a seed.
+    """
+    rng = random.Random(seed)
+    for number in range(count):
+        person = f'{rng.choice(GIVEN_NAMES)} {rng.choice(SURNAMES)}'
+        # invented brand words make the vocabulary grow with the data, like real trade names do
+        brand = ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+        trade_name = rng.choice((f'{brand} {rng.choice(TRADES)}', f'{person.split()[1]} {rng.choice(TRADES)}',
+                                 f'{rng.choice(PLACES)} {rng.choice(GOODS)} {rng.choice(TRADES)}'))
+        yield {
+            'name': person.title(),
+            'trade_name': trade_name.title(),
+            'legal_name': rng.choice((f'{trade_name} Private Limited', f'{person} Proprietor', f'{trade_name} LLP'))
+            .title(),
+            'business_name': trade_name.title(),
+            'store_name': f'{rng.choice((brand, person.split()[0]))} {rng.choice(GOODS)} {rng.choice(PLACES)}'.title(),
+        }
+
+
+def fake_queries(sellers, count, seed=0):
+    """typeahead queries cut from the given sellers' names, a fifth of them with a typo"""
+    rng = random.Random(seed)
+    for _ in range(count):
+        seller = rng.choice(sellers)
+        words = seller[rng.choice(('trade_name', 'legal_name', 'business_name', 'store_name'))].lower().split()
+        query = words[:rng.randint(1, len(words))]
+        query[-1] = query[-1][:rng.randint(2, len(query[-1]))]
+        if rng.random() < 0.2 and len(query[0]) > 4:
+            position = rng.randrange(1, len(query[0]) - 1)
+            query[0] = query[0][:position] + query[0][position + 1] + query[0][position] + query[0][position + 2:]
+        yield ' '.join(query)
+
+
+def fake_gstin(number):
+    """a well formed GSTIN, with a valid check digit, that is different for every number"""
+    letters = ''
+    for _ in range(5):
+        number, index = divmod(number, 26)
+        letters += chr(ord('A') + index)
+    body = f'27{letters}{number % 10000:04d}A1Z'
+    return body + check_digit(body)
+
+
+def fake_onboarding(number, seed=0):
+    """the form fields of one seller's onboarding, for the onboarding benchmark"""
+    seller = next(fake_sellers(1, seed * 1000003 + number))
+    given, surname = seller['name'].split()
+    return {
+        'register': {'name': f'{given} {surname}', 'email': f'bench{number}@example.com',
+                     'contact_number': f'9{number:09d}', 'password': f'bench-pass-{number}'},
+        'gst-details': {'trade-name': seller['trade_name'], 'legal-name': seller['legal_name'],
+                        'gst-no': fake_gstin(number), 'gst-type': 'Regular',
+                        'business_address': f'{number} Market Road, {seller["store_name"].split()[-1]}'},
+        'business-profile': {'upload-file': 0, 'business-name': seller['business_name'],
+                             'business-address': f'{number} Market Road', 'business-email': f'store{number}@example.com',
+                             'business-contact_number': f'8{number:09d}', 'business-shipping_method': 'Self'},
+        'bank-details': {'acc-holder-name': seller['name'], 'acc-number': f'{number:012d}', 'ifsc': 'SBIN0000001'},
+    }
@@ -1,20 +1,15 @@
-import math
-import random
-
 from django.conf import settings
-from django.core.mail import send_mail
+
+from . import otp as otp_store
+from . import outbox
 
 
 class SendMail:
 
     @staticmethod
     def generate_otp():
-        num_str = '0123456789'
-        OTP = ""
-        length = len(num_str)
-        for i in range(5):
-            OTP += num_str[math.floor(random.random() * length)]
-        return OTP
+        # codes are issued and stored by api.otp.issue
+        return otp_store.generate_code()
 
     @staticmethod
     def send_otp(user, otp, of):
@@ -29,4 +24,5 @@ class SendMail:
 
         email_from = settings.EMAIL_HOST_USER
         recipient_list = [user.email, ]
-        send_mail(subject, message, email_from, recipient_list)
+        # delivered by the outbox workers once the caller's transaction commits
+        return outbox.enqueue(subject, message, email_from, recipient_list)
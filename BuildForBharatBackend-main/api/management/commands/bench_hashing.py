@@ -0,0 +1,57 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.hashers import check_password, make_password
+from django.core.management.base import BaseCommand
+
+from api import hashers
+
+
+class Command(BaseCommand):
+    help = 'Measure password checks per second on the request thread versus the async hasher pool.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=40)
+        parser.add_argument('--concurrency', type=int, default=16, help='Concurrent logins in flight.')
+
+    def handle(self, *args, **options):
+        logins = options['logins']
+        encoded = make_password('bench-password')
+        policy = hashers.hasher_policy()
+        cores = os.cpu_count() or 1
+        self.stdout.write(f'hasher: {encoded.split("$")[0]} x {encoded.split("$")[1]} iterations, '
+                          f'pool: {policy["EXECUTOR"]} x {policy["WORKERS"]}, cpus: {cores}')
+
+        # before: every login hashes on the worker thread that serves it
+        start = time.perf_counter()
+        for _ in range(logins):
+            check_password('bench-password', encoded)
+        sync_rate = logins / (time.perf_counter() - start)
+        self.stdout.write(f'request thread: {sync_rate:.1f} logins/s on one thread')
+
+        # before, threaded server: several request threads hashing side by side
+        with ThreadPoolExecutor(max_workers=policy['WORKERS']) as pool:
+            start = time.perf_counter()
+            list(pool.map(lambda _: check_password('bench-password', encoded), range(logins)))
+            threaded_rate = logins / (time.perf_counter() - start)
+        self.stdout.write(f'{policy["WORKERS"]} request threads: {threaded_rate:.1f} logins/s')
+
+        # after: one event loop with `concurrency` logins awaiting the hasher pool
+        async def run():
+            semaphore = asyncio.Semaphore(options['concurrency'])
+
+            async def login():
+                async with semaphore:
+                    await hashers.averify('bench-password', encoded)
+
+            await hashers.averify('bench-password', encoded)    # start the pool outside the timing
+            start = time.perf_counter()
+            await asyncio.gather(*(login() for _ in range(logins)))
+            return logins / (time.perf_counter() - start)
+
+        pool_rate = asyncio.run(run())
+        used = min(policy['WORKERS'], cores)
+        self.stdout.write(f'async + hasher pool: {pool_rate:.1f} logins/s, '
+                          f'{pool_rate / used:.1f} logins/s per core over {used} cores')
@@ -0,0 +1,60 @@
+import os
+import random
+import string
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from api import ifsc
+from api.registry import Registry
+
+
+class Command(BaseCommand):
+    help = 'Measure IFSC directory cold load and lookup times on a synthetic directory.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--codes', type=int, default=180000, help='Roughly the size of the RBI list.')
+        parser.add_argument('--lookups', type=int, default=100000)
+
+    def handle(self, *args, **options):
+        banks = [''.join(random.choices(string.ascii_uppercase, k=4)) for _ in range(1500)]
+        codes = sorted({f'{random.choice(banks)}0{random.randrange(16 ** 6):06X}' for _ in range(options['codes'])})
+        rows = ((code, f'{code[:4]} Bank Limited', f'Branch {i}', 'Pune') for i, code in enumerate(codes))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'ifsc_directory.bin')
+            start = time.perf_counter()
+            written, _ = ifsc.build_directory(path, rows)
+            self.stdout.write(f'built {written} codes, {os.path.getsize(path) / 1e6:.1f} MB '
+                              f'in {time.perf_counter() - start:.2f}s')
+
+            installed, ifsc.directory = ifsc.directory, Registry(path)
+            ifsc._lookup.cache_clear()
+            start = time.perf_counter()
+            ifsc.lookup(codes[0])
+            self.stdout.write(f'cold load (first lookup): {(time.perf_counter() - start) * 1e3:.3f} ms')
+
+            sample = random.choices(codes, k=options['lookups'])
+            start = time.perf_counter()
+            for code in sample:
+                ifsc.directory.get(code)
+            self.line('binary search on the mmap', start, len(sample))
+
+            hot = sample[:ifsc.ifsc_settings()['CACHE_SIZE']]
+            for code in hot:
+                ifsc.lookup(code)
+            start = time.perf_counter()
+            for i in range(len(sample)):
+                ifsc.lookup(hot[i % len(hot)])
+            self.line('lookup(), cached', start, len(sample))
+
+            start = time.perf_counter()
+            for i in range(len(sample)):
+                ifsc._lookup(hot[i % len(hot)], ifsc.directory.state()[4])
+            self.line('decoded entry cache alone', start, len(sample))
+            ifsc.directory.state()[0].close()
+            ifsc.directory = installed
+            ifsc._lookup.cache_clear()
+
+    def line(self, label, start, count):
+        self.stdout.write(f'{label}: {(time.perf_counter() - start) / count * 1e6:.2f} us/lookup')
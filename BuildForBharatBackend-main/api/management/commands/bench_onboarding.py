@@ -0,0 +1,219 @@
+import io
+import json
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from contextlib import redirect_stdout
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import Client, override_settings
+
+from api import imaging, models, outbox
+from api.db import pool
+from api.loadtest import fake_onboarding, summarize
+from api.queryinspector import record_queries
+
+READS = ['user-details', 'seller-details', 'business-details']
+STEPS = ['register', 'verify/otp', 'upload/gst-certificate', 'update/gst-details', 'update/business-profile',
+         'create/bank-details', *READS]
+OTP_RE = re.compile(r'otp is (\d+)')
+
+
+def certificate(number):
+    """a small jpeg that differs per seller, so uploads aren't deduplicated"""
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.new('RGB', (640, 480), (number % 256, number // 256 % 256, 120)).save(buffer, 'JPEG')
+    buffer.name = f'certificate-{number}.jpg'
+    buffer.seek(0)
+    return buffer
+
+
+def body(response):
+    content = b''.join(response.streaming_content) if response.streaming else response.content
+    try:
+        return json.loads(content or b'{}')
+    except ValueError:
+        return {}
+
+
+class Command(BaseCommand):
+    help = ('End-to-end benchmark of seller onboarding against a fresh SQLite database and the locmem email '
+            'backend: register, verify/otp, upload/gst-certificate, update/gst-details, update/business-profile, '
+            'create/bank-details, then the read endpoints. Prints the flow throughput, and latency percentiles and '
+            'queries per request for every endpoint as JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sellers', type=int, default=200, help='Onboarding flows to run.')
+        parser.add_argument('--concurrency', type=int, default=8, help='Flows running at the same time.')
+        parser.add_argument('--reads', type=int, default=3, help='Rounds of the read endpoints after onboarding.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--hash-iterations', type=int,
+                            help='PBKDF2 iterations for register; the default keeps the configured policy.')
+        parser.add_argument('--keep-throttles', action='store_true',
+                            help='Apply the THROTTLES policies, which block most flows from one client address.')
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout.')
+
+    def handle(self, *args, **options):
+        directory = tempfile.mkdtemp(prefix='bench-onboarding-')
+        overrides = {
+            'EMAIL_BACKEND': 'django.core.mail.backends.locmem.EmailBackend',
+            'MEDIA_ROOT': os.path.join(directory, 'media'),
+            'DATABASE_REPLICAS': {'REPLICAS': {}},
+            'QUERY_INSPECTOR': {**getattr(settings, 'QUERY_INSPECTOR', {}), 'ENABLED': False},
+            'ALLOWED_HOSTS': ['testserver'],
+        }
+        if options['hash_iterations']:
+            overrides['PASSWORD_HASHER_POLICY'] = {**getattr(settings, 'PASSWORD_HASHER_POLICY', {}),
+                                                   'ITERATIONS': options['hash_iterations']}
+        if not options['keep_throttles']:
+            overrides['THROTTLES'] = {**getattr(settings, 'THROTTLES', {}), 'POLICIES': {}}
+        saved = connections.settings
+        try:
+            self.use_database(os.path.join(directory, 'bench.sqlite3'))
+            # the register serializer prints what it validates
+            with override_settings(**overrides), redirect_stdout(io.StringIO()):
+                for cache in caches.all():
+                    cache.clear()
+                report = self.run(options)
+        finally:
+            outbox.wait()
+            imaging.wait()
+            pool.close_all()
+            connections.close_all()
+            connections.settings = saved
+            self.drop_connections()
+            shutil.rmtree(directory, ignore_errors=True)
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+    @staticmethod
+    def use_database(path):
+        """point the default alias at a new SQLite file with the project's schema, pooled like MySQL is"""
+        connections.close_all()
+        connections.settings = connections.configure_settings(
+            {'default': {'ENGINE': 'api.db.sqlite3', 'NAME': path, 'OPTIONS': {'timeout': 30}}})
+        Command.drop_connections()
+        call_command('migrate', run_syncdb=True, verbosity=0)
+        with connections['default'].cursor() as cursor:
+            # concurrent readers don't block the writer
+            cursor.execute('PRAGMA journal_mode=WAL')
+        connections.close_all()
+
+    @staticmethod
+    def drop_connections():
+        # this thread's connection objects, so the next query connects with the current settings
+        for alias in list(connections.settings):
+            try:
+                del connections[alias]
+            except AttributeError:
+                pass
+
+    def run(self, options):
+        samples = defaultdict(list)     # step -> [(seconds, queries, failed)]
+        flows, lock = [], threading.Lock()
+
+        def onboard(number):
+            try:
+                started = time.perf_counter()
+                results = self.onboard(number, options)
+                with lock:
+                    for step, result in results:
+                        samples[step].append(result)
+                    if len(results) == len(STEPS) - len(READS) + len(READS) * options['reads']:
+                        flows.append(time.perf_counter() - started)
+            finally:
+                connections.close_all()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            list(executor.map(onboard, range(options['sellers'])))
+        elapsed = time.perf_counter() - start
+        # mail and image variants the flows left to the background workers
+        outbox.wait()
+        imaging.wait()
+        background = time.perf_counter() - start - elapsed
+
+        endpoints = {}
+        for step in STEPS:
+            latencies = [seconds for seconds, _, _ in samples[step]]
+            queries = [count for _, count, _ in samples[step]]
+            # the steps interleave, so only the whole run has a throughput
+            endpoints[step] = {
+                **summarize(latencies, errors=sum(failed for _, _, failed in samples[step])),
+                'queries_per_request': round(sum(queries) / len(queries), 2) if queries else None,
+                'max_queries': max(queries, default=None),
+            }
+        return {
+            'revision': self.revision(),
+            'options': {name: options[name] for name in ('sellers', 'concurrency', 'reads', 'seed', 'hash_iterations',
+                                                         'keep_throttles')},
+            'elapsed_s': round(elapsed, 3),
+            'background_s': round(background, 3),
+            # completed onboardings, each timed from register to its last read
+            'flows': summarize(flows, elapsed, options['sellers'] - len(flows)),
+            'endpoints': endpoints,
+            'db_pool': pool.stats().get('default'),
+        }
+
+    def onboard(self, number, options):
+        """run one seller's flow, [(step, (seconds, queries, failed))], stopping at the first failure"""
+        data = fake_onboarding(number, options['seed'])
+        client = Client()
+        results = []
+
+        def call(step, method, payload=None, **extra):
+            with record_queries(capture_stack=False) as recorder:
+                started = time.perf_counter()
+                response = getattr(client, method)(f'/api/{step}', payload, **extra)
+                seconds = time.perf_counter() - started
+            # what a server does once the response is sent, with CONN_MAX_AGE = 0
+            connections.close_all()
+            content = body(response)
+            failed = response.status_code >= 400 or content.get('status', {}).get('code', 200) != 200
+            results.append((step, (seconds, recorder.count, failed)))
+            return None if failed else content
+
+        content = call('register', 'post', data['register'])
+        if content is None:
+            return results
+        client.defaults['HTTP_AUTHORIZATION'] = f'Bearer {content["token"]["access"]}'
+        # the code from the verification mail, as the app's user would read it
+        message = (models.EmailOutbox.objects.filter(recipients=[data['register']['email']])
+                   .order_by('-id').values_list('message', flat=True).first())
+        match = OTP_RE.search(message or '')
+        if match is None or call('verify/otp', 'post', {'of': 'email', 'otp': match.group(1)}) is None:
+            return results
+        for step, payload in (('upload/gst-certificate', {'gst-certificate': certificate(number)}),
+                              ('update/gst-details', data['gst-details']),
+                              ('update/business-profile', data['business-profile']),
+                              ('create/bank-details', data['bank-details'])):
+            if call(step, 'post', payload) is None:
+                return results
+        for _ in range(options['reads']):
+            for step in READS:
+                call(step, 'get')
+        return results
+
+    @staticmethod
+    def revision():
+        try:
+            return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True,
+                                  text=True, timeout=5).stdout.strip() or None
+        except (OSError, subprocess.SubprocessError):
+            return None
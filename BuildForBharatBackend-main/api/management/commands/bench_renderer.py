@@ -0,0 +1,66 @@
+import json
+import timeit
+
+from django.core.management.base import BaseCommand
+from rest_framework.exceptions import ErrorDetail
+from rest_framework.utils.serializer_helpers import ReturnDict, ReturnList
+
+from api import renderers
+
+
+class LegacyUserRenderer(renderers.renderers.JSONRenderer):
+    """the renderer as it was before the single pass encoder, kept for comparison"""
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if 'ErrorDetail' in str(data):
+            return json.dumps({'errors': data})
+        return json.dumps(data)
+
+
+def bank_details(count):
+    return ReturnList([{'acc_holder_name': f'Account Holder {i}', 'acc_number': f'{10 ** 11 + i}',
+                        'ifsc': f'SBIN000{i % 10000:04d}'} for i in range(count)], serializer=None)
+
+
+def business(banks):
+    data = ReturnDict({'name': 'Sharma General Store', 'store_name': 'Sharma Kirana',
+                       'address': {'line1': '12, MG Road', 'city': 'Pune', 'state': 'Maharashtra', 'pin': '411001'},
+                       'email_address': 'store@example.com', 'phone_number': '9876543210',
+                       'shipping_method': 'self'}, serializer=None)
+    data['bank_details'] = bank_details(banks)
+    return {'business': data, 'message': 'Successfully retrieved.', 'status': {'code': 200, 'msg': 'success'}}
+
+
+class Command(BaseCommand):
+    help = 'Compare the single pass UserRenderer with the previous str() scanning renderer.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--number', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        payloads = {
+            'business, 2 banks': business(2),
+            'business, 50 banks': business(50),
+            'business list, 200 x 5 banks': {'businesses': [business(5) for _ in range(200)]},
+            'validation errors': {'messages': {'email': ErrorDetail('This email is already in use.', 'unique'),
+                                               'name': ErrorDetail('Enter a valid name.', 'invalid')},
+                                  'status': {'msg': 'failed', 'code': 220}},
+        }
+        implementations = [('legacy', LegacyUserRenderer()), ('current', renderers.UserRenderer())]
+        orjson = renderers.orjson
+        self.stdout.write(f'orjson: {"yes" if orjson else "no"}')
+        for label, payload in payloads.items():
+            number = max(options['number'] // (100 if 'list' in label else 1), 10)
+            timings = {}
+            for name, renderer in implementations:
+                timings[name] = min(timeit.repeat(lambda: renderer.render(payload), number=number, repeat=3))
+            if orjson is not None:
+                renderers.orjson = None
+                timings['current, stdlib'] = min(timeit.repeat(lambda: implementations[1][1].render(payload),
+                                                               number=number, repeat=3))
+                renderers.orjson = orjson
+            baseline = timings['legacy']
+            results = ', '.join(f'{name} {seconds / number * 1e6:.1f} us ({baseline / seconds:.1f}x)'
+                                for name, seconds in timings.items())
+            self.stdout.write(f'{label}: {results}')
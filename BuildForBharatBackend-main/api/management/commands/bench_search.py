@@ -0,0 +1,65 @@
+import gc
+import resource
+import time
+
+from django.core.management.base import BaseCommand
+
+from api import search
+from api.loadtest import fake_queries, fake_sellers, summarize
+
+
+class Command(BaseCommand):
+    help = ('Measure seller search latency. By default on an in-memory index of generated sellers, '
+            'with --database through the configured backend against the rows of generate_search_dataset.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000000)
+        parser.add_argument('--queries', type=int, default=2000)
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--database', action='store_true')
+
+    def handle(self, *args, **options):
+        conf = search.search_settings()
+        if options['database']:
+            sellers = [{'trade_name': trade_name or '', 'legal_name': legal_name or '', 'business_name': name or '',
+                        'store_name': store_name or ''}
+                       for trade_name, legal_name, name, store_name in
+                       search.models.SellerGST.objects.values_list(
+                           'trade_name', 'legal_name', 'user__user_business__name',
+                           'user__user_business__store_name')[:10000]]
+            start = time.perf_counter()
+            search.search_sellers('warm up', options['limit'])
+            self.stdout.write(f'{conf["BACKEND"]}: first search {time.perf_counter() - start:.2f}s')
+
+            def run(query):
+                return search.search_sellers(query, options['limit'])
+        else:
+            rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            start = time.perf_counter()
+            sellers = []
+
+            def documents():
+                for number, seller in enumerate(fake_sellers(options['rows'], options['seed'])):
+                    if number < 10000:
+                        sellers.append(seller)
+                    yield number, search.words(' '.join(seller[field] for field in (
+                        'trade_name', 'legal_name', 'business_name', 'store_name')))
+
+            index = search.WordIndex.build(documents())
+            gc.freeze()     # as InMemoryBackend does
+            self.stdout.write(f'indexed {len(index)} sellers, {len(index.vocabulary)} words in '
+                              f'{time.perf_counter() - start:.1f}s, peak RSS grew by '
+                              f'{(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss) / 1024:.0f} MB')
+
+            def run(query):
+                return index.search(search.words(query), options['limit'], conf['MAX_EXPANSIONS'])
+
+        latencies, empty = [], 0
+        start = time.perf_counter()
+        for query in fake_queries(sellers, options['queries'], options['seed']):
+            began = time.perf_counter()
+            empty += not run(query)
+            latencies.append(time.perf_counter() - began)
+        result = summarize(latencies, time.perf_counter() - start)
+        self.stdout.write(f'{result}, {empty} queries without results')
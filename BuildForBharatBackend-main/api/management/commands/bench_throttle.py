@@ -0,0 +1,64 @@
+import time
+
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from django.test.utils import override_settings
+from rest_framework.throttling import SimpleRateThrottle
+
+from api.throttling import Limiter, throttle_settings
+
+
+class HistoryThrottle(SimpleRateThrottle):
+    """DRF's stock throttle, which keeps a list of request timestamps per identity"""
+    rate = '1000000/min'
+
+    def get_cache_key(self, request, view):
+        return f'bench-history:{self.get_ident(request)}'
+
+
+class Command(BaseCommand):
+    help = 'Measure the per request overhead of the sliding window throttle.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=20000)
+        parser.add_argument('--identities', type=int, default=100)
+
+    def handle(self, *args, **options):
+        total = options['requests']
+        factory = RequestFactory()
+        requests = [factory.post('/api/login', {'email': f'user{i}@example.com'}, REMOTE_ADDR=f'10.0.{i // 250}.{i % 250}')
+                    for i in range(options['identities'])]
+        conf = throttle_settings()
+        cache = caches[conf['CACHE_ALIAS']]
+        self.stdout.write(f'cache: {type(cache).__name__}, {total} requests over {len(requests)} identities')
+
+        allow_all = {'bench': [{'KEY': 'ip', 'RATE': f'{total}/min'}, {'KEY': 'email', 'RATE': f'{total}/min'}]}
+        with override_settings(THROTTLES={**conf, 'POLICIES': allow_all}):
+            cache.clear()
+            self.report('sliding window, allowed', Limiter('bench'), requests, total)
+
+        block_all = {'bench': [{'KEY': 'ip', 'RATE': '1/day'}, {'KEY': 'email', 'RATE': '1/day'}]}
+        with override_settings(THROTTLES={**conf, 'POLICIES': block_all}):
+            cache.clear()
+            limiter = Limiter('bench')
+            for request in requests:
+                limiter.hit(request)
+            self.report('sliding window, rejected', limiter, requests, total)
+
+        cache.clear()
+        throttle = HistoryThrottle()
+        start = time.perf_counter()
+        for i in range(total):
+            throttle.allow_request(requests[i % len(requests)], None)
+        self.line('drf timestamp history, allowed', total, time.perf_counter() - start)
+        cache.clear()
+
+    def report(self, label, limiter, requests, total):
+        start = time.perf_counter()
+        for i in range(total):
+            limiter.hit(requests[i % len(requests)])
+        self.line(label, total, time.perf_counter() - start)
+
+    def line(self, label, total, elapsed):
+        self.stdout.write(f'{label}: {elapsed / total * 1e6:.1f} us/request')
@@ -0,0 +1,22 @@
+import csv
+
+from django.core.management.base import BaseCommand
+
+from api.gstin import build_registry, gst_registry_settings
+
+
+class Command(BaseCommand):
+    help = ('Build the memory mapped GSTIN registry snapshot from a CSV with '
+            'gstin,legal_name,trade_name,status columns.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('source')
+        parser.add_argument('--output', help='Defaults to GST_REGISTRY["PATH"].')
+
+    def handle(self, *args, **options):
+        output = options['output'] or gst_registry_settings()['PATH']
+        with open(options['source'], newline='', encoding='utf-8-sig') as source:
+            rows = ((row['gstin'], row.get('legal_name'), row.get('trade_name'), row.get('status'))
+                    for row in csv.DictReader(source))
+            written, skipped = build_registry(output, rows)
+        self.stdout.write(f'wrote {written} GSTINs to {output}, skipped {skipped} invalid')
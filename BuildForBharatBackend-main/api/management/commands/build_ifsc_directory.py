@@ -0,0 +1,22 @@
+import csv
+
+from django.core.management.base import BaseCommand
+
+from api.ifsc import build_directory, ifsc_settings
+
+
+class Command(BaseCommand):
+    help = 'Build the memory mapped IFSC directory from a CSV with IFSC,BANK,BRANCH,CITY columns.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('source')
+        parser.add_argument('--output', help='Defaults to IFSC_DIRECTORY["PATH"].')
+
+    def handle(self, *args, **options):
+        output = options['output'] or ifsc_settings()['PATH']
+        with open(options['source'], newline='', encoding='utf-8-sig') as source:
+            rows = ({(key or '').strip().upper(): value for key, value in row.items()}
+                    for row in csv.DictReader(source))
+            written, skipped = build_directory(output, ((row.get('IFSC'), row.get('BANK'), row.get('BRANCH'),
+                                                         row.get('CITY')) for row in rows))
+        self.stdout.write(f'wrote {written} IFSC codes to {output}, skipped {skipped} malformed')
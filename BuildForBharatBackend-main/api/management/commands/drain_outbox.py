@@ -0,0 +1,46 @@
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from api import outbox
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued emails from the outbox.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=outbox.outbox_settings()['WORKERS'])
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--loop', action='store_true', help='Keep polling the outbox instead of exiting.')
+        parser.add_argument('--interval', type=float, default=2.0, help='Seconds to sleep when the outbox is empty.')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'queue depth: {outbox.queue_depth()}')
+        totals = []
+
+        def work():
+            sent = 0
+            try:
+                while True:
+                    delivered = outbox.drain(batch_size=options['batch_size'])
+                    sent += delivered
+                    if not options['loop']:
+                        break
+                    if not delivered:
+                        time.sleep(options['interval'])
+            finally:
+                totals.append(sent)
+                connections.close_all()
+
+        threads = [threading.Thread(target=work, name=f'drain-outbox-{i}', daemon=True)
+                   for i in range(max(options['workers'], 1))]
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                thread.join()
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(f'sent: {sum(totals)}, queue depth: {outbox.queue_depth()}, stats: {outbox.stats}')
@@ -0,0 +1,28 @@
+from datetime import timedelta
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.storage import collect_garbage, recount, stored_file_fields, upload_storage
+
+
+class Command(BaseCommand):
+    help = 'Delete content addressed media blobs that are no longer referenced by any upload field.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace', type=float, default=24,
+                            help='Hours an unreferenced blob is kept, covering uploads still in flight.')
+        parser.add_argument('--recount', action='store_true',
+                            help='Recompute reference counts from the database first. Run it while uploads are quiet.')
+
+    def handle(self, *args, **options):
+        storage = upload_storage()
+        if options['recount']:
+            models_and_fields = [(model, stored_file_fields(model)) for model in apps.get_app_config('api').get_models()]
+            changed = recount([(model, fields) for model, fields in models_and_fields if fields])
+            self.stdout.write(f'corrected {changed} reference counts')
+
+        older_than = timezone.now() - timedelta(hours=options['grace'])
+        removed = collect_garbage(storage, older_than)
+        self.stdout.write(f'removed {len(removed)} blobs')
@@ -0,0 +1,47 @@
+import time
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api import models
+from api.loadtest import fake_sellers
+
+
+class Command(BaseCommand):
+    help = 'Insert generated sellers (user, seller gst and business rows) to benchmark search against.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000000)
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        # nobody logs in as a generated seller
+        password = make_password(None)
+        offset = models.User.objects.count()
+        sellers = enumerate(fake_sellers(options['rows'], options['seed']), start=offset)
+        start, created = time.perf_counter(), 0
+        while True:
+            chunk = list(islice(sellers, options['chunk_size']))
+            if not chunk:
+                break
+            emails = [f'search-{number}@example.com' for number, _ in chunk]
+            with transaction.atomic():
+                models.User.objects.bulk_create([
+                    models.User(name=seller['name'], email=email, contact_number=f'5{number:09}', password=password)
+                    for email, (number, seller) in zip(emails, chunk)])
+                # mysql doesn't return primary keys from bulk inserts
+                ids = dict(models.User.objects.filter(email__in=emails).values_list('email', 'id'))
+                user_ids = [ids[email] for email in emails]
+                models.UserDetails.objects.bulk_create([models.UserDetails(user_id=user_id, is_seller=True)
+                                                        for user_id in user_ids])
+                models.SellerGST.objects.bulk_create([
+                    models.SellerGST(user_id=user_id, trade_name=seller['trade_name'], legal_name=seller['legal_name'],
+                                     gst_type='Regular') for user_id, (_, seller) in zip(user_ids, chunk)])
+                models.Business.objects.bulk_create([
+                    models.Business(user_id=user_id, name=seller['business_name'], store_name=seller['store_name'])
+                    for user_id, (_, seller) in zip(user_ids, chunk)])
+            created += len(chunk)
+        self.stdout.write(f'inserted {created} sellers in {time.perf_counter() - start:.1f}s')
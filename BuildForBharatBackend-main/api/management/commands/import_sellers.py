@@ -0,0 +1,44 @@
+import csv
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.bulkimport import import_sellers, notify, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Import sellers from a CSV (name,email,contact_number header) or NDJSON file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'ndjson'],
+                            help='Defaults to the file extension, csv when it is neither.')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Rows per bulk insert.')
+        parser.add_argument('--report', help='Write rejected rows with their errors to this CSV file.')
+        parser.add_argument('--notify', action='store_true',
+                            help='Queue an email verification otp to every imported seller.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or ('ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'csv')
+        if not os.path.exists(path):
+            raise CommandError(f'{path} does not exist')
+
+        report_file = open(options['report'], 'w', newline='') if options['report'] else None
+        writer = csv.writer(report_file) if report_file else None
+        if writer:
+            writer.writerow(['line', 'field', 'error'])
+
+        def report(line_number, errors):
+            if writer:
+                for field, message in errors.items():
+                    writer.writerow([line_number, field, message])
+
+        try:
+            with open(path, 'rb') as file:
+                result = import_sellers(read_rows(file, file_format), chunk_size=options['chunk_size'],
+                                        report=report, on_created=notify if options['notify'] else None)
+        finally:
+            if report_file:
+                report_file.close()
+        self.stdout.write(f'{result.rows} rows: {result.created} created, {result.failed} rejected')
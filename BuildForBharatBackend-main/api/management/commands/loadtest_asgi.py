@@ -0,0 +1,122 @@
+import asyncio
+import http.client
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client, override_settings
+
+from api import models
+from api.loadtest import summarize
+from api.readmodel import rebuild_profile
+from api.views import get_tokens_for_user
+
+ENDPOINTS = ['/api/user-details', '/api/seller-details', '/api/business-details']
+
+
+class Command(BaseCommand):
+    help = ('Closed-loop load test of the read endpoints, sync views under WSGI against async views under ASGI. '
+            'Runs in-process unless --wsgi-url / --asgi-url point at running servers.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--wsgi-url', help='e.g. http://127.0.0.1:8000 (gunicorn)')
+        parser.add_argument('--asgi-url', help='e.g. http://127.0.0.1:8001 (uvicorn)')
+        parser.add_argument('--email', default='loadtest@example.com')
+
+    def handle(self, *args, **options):
+        token = self.bench_user(options['email'])
+        headers = {'Authorization': f'Bearer {token}'}
+        results = {}
+        if options['wsgi_url'] or options['asgi_url']:
+            for name in ('wsgi', 'asgi'):
+                if options[f'{name}_url']:
+                    results[name] = self.run_http(options[f'{name}_url'], token, options)
+        else:
+            results['wsgi'] = self.run_threads(Client(headers=headers), options)
+            with override_settings(ROOT_URLCONF='bharatBackend_proj.asgi_urls'):
+                results['asgi'] = asyncio.run(self.run_async(AsyncClient(), headers, options))
+        self.stdout.write(json.dumps(results, indent=2))
+
+    @staticmethod
+    def bench_user(email):
+        user = models.User.objects.filter(email=email).first()
+        if user is None:
+            user = models.User.objects.create_user(name='Load Test', email=email, contact_number='9999999999',
+                                                   password=None)
+        models.UserDetails.objects.get_or_create(user=user)
+        models.SellerGST.objects.get_or_create(user=user, defaults={'seller_id': f'LOADTEST00U{user.id}',
+                                                                     'trade_name': 'Load Test'})
+        business, created = models.Business.objects.get_or_create(user=user, defaults={'name': 'Load Test Store'})
+        if created:
+            models.BanksDetails.objects.create(business=business, acc_holder_name='Load Test',
+                                               acc_number='000000000000', ifsc='SBIN0000001')
+        rebuild_profile(user.id)
+        return get_tokens_for_user(user)['access']
+
+    @staticmethod
+    def run_threads(client, options):
+        """wsgi: one request per thread at a time, like a threaded wsgi server"""
+        latencies, errors, lock = [], [0], threading.Lock()
+
+        def worker(index):
+            start = time.perf_counter()
+            response = client.get(ENDPOINTS[index % len(ENDPOINTS)])
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                errors[0] += response.status_code != 200
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            list(pool.map(worker, range(options['requests'])))
+        return summarize(latencies, time.perf_counter() - start, errors[0])
+
+    @staticmethod
+    async def run_async(client, headers, options):
+        """asgi: `concurrency` requests in flight on one event loop"""
+        latencies, errors = [], [0]
+        semaphore = asyncio.Semaphore(options['concurrency'])
+
+        async def request(index):
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.get(ENDPOINTS[index % len(ENDPOINTS)], headers=headers)
+                latencies.append(time.perf_counter() - start)
+                errors[0] += response.status_code != 200
+
+        start = time.perf_counter()
+        await asyncio.gather(*(request(index) for index in range(options['requests'])))
+        return summarize(latencies, time.perf_counter() - start, errors[0])
+
+    @staticmethod
+    def run_http(base_url, token, options):
+        """keep-alive http clients against a running server"""
+        url = urlsplit(base_url)
+        per_client = max(options['requests'] // options['concurrency'], 1)
+        latencies, errors, lock = [], [0], threading.Lock()
+
+        def client(index):
+            connection = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=30)
+            try:
+                for number in range(per_client):
+                    start = time.perf_counter()
+                    connection.request('GET', ENDPOINTS[(index + number) % len(ENDPOINTS)],
+                                       headers={'Authorization': f'Bearer {token}'})
+                    response = connection.getresponse()
+                    response.read()
+                    elapsed = time.perf_counter() - start
+                    with lock:
+                        latencies.append(elapsed)
+                        errors[0] += response.status != 200
+            finally:
+                connection.close()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            list(pool.map(client, range(options['concurrency'])))
+        return summarize(latencies, time.perf_counter() - start, errors[0])
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api import models
+from api.profiling import make_token, profiling_settings
+
+
+class Command(BaseCommand):
+    help = ('Print a signed token that profiles one request sending it, for a staff user. Send it in the '
+            'X-Profile header; the profiles are listed in the admin.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('user', help='Email or id of the staff user the profiles are recorded for.')
+        parser.add_argument('--path', default='/', help='Only profile requests under this path.')
+        parser.add_argument('--profiler', choices=[choice for choice, _ in models.RequestProfile.PROFILER_CHOICES],
+                            help='Overrides the configured profiler.')
+
+    def handle(self, *args, **options):
+        lookup = {'pk': options['user']} if options['user'].isdigit() else {'email': options['user']}
+        user = models.User.objects.filter(is_active=True, is_staff=True, **lookup).first()
+        if user is None:
+            raise CommandError(f'no active staff user {options["user"]}')
+        conf = profiling_settings()
+        token = make_token(user, options['path'], options['profiler'])
+        self.stdout.write(token)
+        self.stderr.write(f'valid for one request within {conf["MAX_AGE"]} seconds, send it as '
+                          f'`{conf["HEADER"]}: <token>`')
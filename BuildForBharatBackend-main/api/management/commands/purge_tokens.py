@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.tokens import blacklist_index, purge_expired_tokens
+
+
+class Command(BaseCommand):
+    help = 'Delete expired outstanding and blacklisted JWT refresh tokens in bounded batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--pause', type=float, default=0.0, help='Seconds to sleep between batches.')
+        parser.add_argument('--loop', action='store_true', help='Keep purging on a schedule instead of exiting.')
+        parser.add_argument('--interval', type=float, default=3600, help='Seconds between purges with --loop.')
+
+    def handle(self, *args, **options):
+        while True:
+            removed = purge_expired_tokens(batch_size=options['batch_size'], pause=options['pause'])
+            blacklist_index.rebuild()
+            self.stdout.write(f'removed {removed} expired tokens')
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
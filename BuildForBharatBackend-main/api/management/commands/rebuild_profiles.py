@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from api import models
+from api import responsecache
+from api.readmodel import rebuild_profile
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the denormalized seller profiles used by the read endpoints.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='users',
+                            help='Only rebuild this user id, may be repeated.')
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        if options['users']:
+            user_ids = options['users']
+        else:
+            user_ids = (models.User.objects.order_by('id').values_list('id', flat=True)
+                        .iterator(chunk_size=options['chunk_size']))
+        rebuilt = 0
+        for user_id in user_ids:
+            rebuild_profile(user_id)
+            # the cached responses may come from a snapshot built by older code
+            responsecache.bump(user_id)
+            rebuilt += 1
+            if rebuilt % options['chunk_size'] == 0:
+                self.stdout.write(f'rebuilt {rebuilt} profiles')
+        self.stdout.write(f'rebuilt {rebuilt} profiles')
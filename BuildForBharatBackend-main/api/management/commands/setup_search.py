@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api import search
+
+
+class Command(BaseCommand):
+    help = 'Create the database indexes the configured search backend needs, if it needs any.'
+
+    def handle(self, *args, **options):
+        backend = search.get_backend()
+        if not hasattr(backend, 'setup'):
+            self.stdout.write(f'{type(backend).__name__} keeps its index in memory, nothing to set up')
+            return
+        try:
+            backend.setup()
+        except Exception as exc:
+            raise CommandError(f'could not create the search indexes: {exc}')
+        self.stdout.write(f'created the {type(backend).__name__} indexes')
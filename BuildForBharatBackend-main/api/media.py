@@ -0,0 +1,195 @@
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.db.models import Q
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.views import View
+from rest_framework.exceptions import APIException
+
+from . import models
+from .authentication import CachedJWTAuthentication
+from .storage import upload_storage
+
+DEFAULTS = {
+    'BACKEND': None,                        # None serves from Python, 'nginx' or 'xsendfile' offload to the web server
+    'INTERNAL_PREFIX': '/protected-media/',  # nginx `internal` location aliased to MEDIA_ROOT
+    'MAX_AGE': 365 * 24 * 3600,             # content addressed files never change
+    'MUTABLE_MAX_AGE': 3600,                # everything else
+    'BLOCK_SIZE': 64 * 1024,
+}
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+VARIANT_RE = re.compile(r'^variants/(?P<stem>.+)__[\w-]+\.jpg$')
+
+
+def media_settings():
+    return {**DEFAULTS, **getattr(settings, 'MEDIA_SENDFILE', {})}
+
+
+def _lookup(field, name):
+    """rows whose `field` is `name`; a variant matches its original, whatever the extension"""
+    match = VARIANT_RE.match(name)
+    if match:
+        stem = match['stem']
+        return Q(**{field: stem}) | Q(**{f'{field}__startswith': f'{stem}.'})
+    return Q(**{field: name})
+
+
+def get_access(name, user):
+    """
+    'public' for business pictures, 'private' for gst certificates the user may
+    read, None when the file is not theirs or not referenced at all. Identical
+    content shared by both is public, it is already published as a picture.
+    """
+    if models.Business.objects.filter(_lookup('profile_pic', name)).exists():
+        return 'public'
+    if user is None:
+        return None
+    certificates = models.SellerGST.objects.filter(_lookup('certificate', name))
+    if not user.is_staff:
+        certificates = certificates.filter(user_id=user.pk)
+    return 'private' if certificates.exists() else None
+
+
+def is_immutable(name):
+    """content addressed originals, their name is the hash of their bytes"""
+    return name.startswith(f'{upload_storage().prefix}/')
+
+
+def etag_for(name, stat):
+    if is_immutable(name):
+        digest, _ = os.path.splitext(os.path.basename(name))
+        return f'"{digest}"'
+    return f'"{int(stat.st_mtime):x}-{stat.st_size:x}"'
+
+
+def parse_range(header, size):
+    """(start, end) inclusive for a single `bytes=` range, None to serve it all, ValueError if unsatisfiable"""
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        # malformed and multipart ranges are ignored, per RFC 9110 the full file is fine
+        return None
+    first, last = match.groups()
+    if first == '':
+        length = int(last)
+        if length == 0:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
+class RangeFile:
+    """read-only window of an open file, for FileResponse"""
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+class MediaView(View):
+    """
+    Serves MEDIA_URL. Access is checked here, the bytes are then handed to the
+    web server (X-Accel-Redirect / X-Sendfile) or, without an offload backend,
+    streamed with support for conditional and range requests.
+    """
+    http_method_names = ['get', 'head']
+
+    def get_user(self, request):
+        try:
+            result = CachedJWTAuthentication().authenticate(request)
+        except APIException:
+            result = None
+        if result is not None:
+            return result[0]
+        user = getattr(request, 'user', None)
+        return user if user is not None and user.is_authenticated else None
+
+    def get(self, request, path):
+        name = path.lstrip('/')
+        try:
+            full_path = safe_join(settings.MEDIA_ROOT, name)
+        except ValueError:
+            raise Http404
+        access = get_access(name, self.get_user(request))
+        if access is None:
+            raise Http404
+        try:
+            stat = os.stat(full_path)
+        except (FileNotFoundError, NotADirectoryError):
+            raise Http404
+
+        conf = media_settings()
+        etag = etag_for(name, stat)
+        if is_immutable(name):
+            cache_control = f'max-age={conf["MAX_AGE"]}, immutable'
+        else:
+            cache_control = f'max-age={conf["MUTABLE_MAX_AGE"]}'
+        cache_control = f'{access}, {cache_control}'
+        content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+
+        response = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+        if response is None:
+            response = self.send(request, name, full_path, stat, content_type, etag, conf)
+        response.headers['ETag'] = etag
+        response.headers['Last-Modified'] = http_date(stat.st_mtime)
+        response.headers['Cache-Control'] = cache_control
+        if access == 'private':
+            response.headers['Vary'] = 'Authorization, Cookie'
+        return response
+
+    def send(self, request, name, full_path, stat, content_type, etag, conf):
+        if conf['BACKEND'] == 'nginx':
+            response = HttpResponse(content_type=content_type)
+            response.headers['X-Accel-Redirect'] = conf['INTERNAL_PREFIX'].rstrip('/') + '/' + quote(name)
+            return response
+        if conf['BACKEND'] == 'xsendfile':
+            response = HttpResponse(content_type=content_type)
+            response.headers['X-Sendfile'] = full_path
+            return response
+
+        size = stat.st_size
+        byte_range = None
+        range_header = request.headers.get('Range')
+        if range_header and request.headers.get('If-Range', etag) == etag:
+            try:
+                byte_range = parse_range(range_header, size)
+            except ValueError:
+                response = HttpResponse(status=416)
+                response.headers['Content-Range'] = f'bytes */{size}'
+                return response
+
+        file = open(full_path, 'rb')
+        if byte_range is None:
+            # the file itself, its fileno() lets the server's wsgi.file_wrapper use sendfile()
+            response = FileResponse(file, content_type=content_type)
+        else:
+            start, end = byte_range
+            response = FileResponse(RangeFile(file, start, end - start + 1), status=206, content_type=content_type)
+            response.headers['Content-Length'] = end - start + 1
+            response.headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response.block_size = conf['BLOCK_SIZE']
+        response.headers['Accept-Ranges'] = 'bytes'
+        return response
@@ -0,0 +1,418 @@
+import fcntl
+import glob
+import itertools
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.crypto import constant_time_compare
+from django.views import View
+from rest_framework.exceptions import APIException
+
+from .authentication import CachedJWTAuthentication
+from .queryinspector import wrap_queries
+
+DEFAULTS = {
+    'ENABLED': True,
+    # shared by every worker process of the deployment
+    'DIRECTORY': os.environ.get('METRICS_DIR') or os.path.join(tempfile.gettempdir(), 'bharat-metrics'),
+    'TOKEN': None,              # scrapers send `Authorization: Bearer <TOKEN>`, without one only staff can read
+}
+
+METHODS = {'GET', 'HEAD', 'OPTIONS', 'POST', 'PUT', 'PATCH', 'DELETE'}
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# name -> (type, help, histogram buckets)
+FAMILIES = {
+    'http_requests_total': ('counter', 'Requests handled, by route, method and status.', None),
+    'http_request_duration_seconds': ('histogram', 'Request latency by route and method.', LATENCY_BUCKETS),
+    'http_requests_in_flight': ('gauge', 'Requests being handled right now.', None),
+    'db_queries_total': ('counter', 'Database queries run while handling requests, by route.', None),
+    'db_query_duration_seconds_total': ('counter', 'Time spent in database queries, by route.', None),
+    'email_send_duration_seconds': ('histogram', 'Time to hand one email to the mail server, by result.',
+                                    LATENCY_BUCKETS),
+    'password_hash_duration_seconds': ('histogram', 'Time to hash or check one password, by operation.',
+                                       LATENCY_BUCKETS),
+}
+
+HEADER = struct.Struct('<Q')        # bytes used, entries follow
+ENTRY = struct.Struct('<I')         # key length, then the key padded to 8 bytes and a float64 value
+VALUE = struct.Struct('<d')
+INITIAL_SIZE = 64 * 1024
+EXITED = 'exited.total'     # the counters and histograms of threads and processes that are gone
+
+
+def metrics_settings():
+    return {**DEFAULTS, **getattr(settings, 'METRICS', {})}
+
+
+class SlotFile:
+    """
+    Append-only `key -> float64` slots in a memory-mapped file. Only the thread
+    that owns the file writes to it, so updates need no lock, and readers in any
+    process see a consistent prefix: an entry is complete before the header
+    counts it.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'a+b')
+        if os.fstat(self.file.fileno()).st_size < INITIAL_SIZE:
+            self.file.truncate(INITIAL_SIZE)
+        self.map = mmap.mmap(self.file.fileno(), 0)
+        self.offsets = {}
+        # reopening a file continues its slots
+        for key, offset in _entries(self.map):
+            self.offsets[key] = offset
+        self.used = HEADER.unpack_from(self.map, 0)[0] or HEADER.size
+
+    def add(self, key, amount):
+        offset = self.offsets.get(key)
+        if offset is None:
+            offset = self._append(key)
+        VALUE.pack_into(self.map, offset, VALUE.unpack_from(self.map, offset)[0] + amount)
+
+    def _append(self, key):
+        encoded = json.dumps(key, separators=(',', ':')).encode()
+        padded = len(encoded) + (-(ENTRY.size + len(encoded)) % 8)
+        size = ENTRY.size + padded + VALUE.size
+        if self.used + size > len(self.map):
+            grown = max(len(self.map) * 2, self.used + size)
+            self.map.close()
+            self.file.truncate(grown)
+            self.map = mmap.mmap(self.file.fileno(), 0)
+        ENTRY.pack_into(self.map, self.used, len(encoded))
+        self.map[self.used + ENTRY.size:self.used + ENTRY.size + len(encoded)] = encoded
+        offset = self.used + ENTRY.size + padded
+        VALUE.pack_into(self.map, offset, 0.0)
+        self.used += size
+        HEADER.pack_into(self.map, 0, self.used)
+        self.offsets[key] = offset
+        return offset
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+
+_retired = itertools.count()
+
+
+class ThreadSlots(SlotFile):
+    """
+    The slot file of one thread of this process. Once the thread is gone, and
+    its thread-local with it, the file is renamed to `.exited` for the next
+    scrape to fold into EXITED.
+    """
+
+    def __init__(self, directory):
+        self.pid = os.getpid()
+        self.directory = directory
+        super().__init__(os.path.join(directory, f'{self.pid}-{threading.get_ident()}.slots'))
+
+    def retire(self):
+        if self.file.closed:
+            return
+        self.close()
+        # a forked worker inherits its parent's thread-local, the file is still the parent's
+        if self.pid == os.getpid():
+            try:
+                os.rename(self.path, f'{self.path[:-len(".slots")]}-{next(_retired)}.exited')
+            except OSError:
+                pass
+
+    def __del__(self):
+        # at interpreter shutdown the module may be half gone, the exited process' files are folded anyway
+        if not sys.is_finalizing():
+            self.retire()
+
+
+def _entries(data):
+    """(key, value offset) of every complete entry of a slot file's contents"""
+    used = HEADER.unpack_from(data, 0)[0]
+    position = HEADER.size
+    while position < used:
+        length = ENTRY.unpack_from(data, position)[0]
+        name, labels = json.loads(bytes(data[position + ENTRY.size:position + ENTRY.size + length]))
+        padded = length + (-(ENTRY.size + length) % 8)
+        offset = position + ENTRY.size + padded
+        yield (name, tuple(tuple(pair) for pair in labels)), offset
+        position = offset + VALUE.size
+
+
+_local = threading.local()
+
+
+def _slots():
+    directory = metrics_settings()['DIRECTORY']
+    slots = getattr(_local, 'slots', None)
+    # a forked worker, or a changed setting, starts a new file
+    if slots is None or (slots.pid, slots.directory) != (os.getpid(), directory):
+        if slots is not None:
+            slots.retire()
+        os.makedirs(directory, exist_ok=True)
+        slots = _local.slots = ThreadSlots(directory)
+    return slots
+
+
+def inc(name, labels=(), amount=1.0):
+    """add to a counter or gauge, `labels` is a tuple of (name, value) pairs"""
+    if metrics_settings()['ENABLED']:
+        _slots().add((name, labels), amount)
+
+
+def observe(name, labels, value):
+    """record a histogram sample"""
+    if not metrics_settings()['ENABLED']:
+        return
+    slots = _slots()
+    buckets = FAMILIES[name][2]
+    index = bisect_left(buckets, value)
+    bound = str(buckets[index]) if index < len(buckets) else '+Inf'
+    slots.add((f'{name}_bucket', labels + (('le', bound),)), 1.0)
+    slots.add((f'{name}_sum', labels), value)
+    slots.add((f'{name}_count', labels), 1.0)
+
+
+@contextmanager
+def timed(name, **labels):
+    """observe the duration of the block into histogram `name`"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, tuple(sorted(labels.items())), time.perf_counter() - start)
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _read(path):
+    """the (key, value) pairs of a slot file, none when it is gone or still empty"""
+    try:
+        with open(path, 'rb') as file:
+            data = file.read()
+    except FileNotFoundError:
+        return []
+    if len(data) < HEADER.size:
+        return []
+    return [(key, VALUE.unpack_from(data, offset)[0]) for key, offset in _entries(data)]
+
+
+def _fold(directory):
+    """
+    Add the files of exited threads and processes to EXITED and remove them,
+    so they don't pile up for every scrape to read again. What they had in
+    flight is not in flight anymore, their gauges are dropped.
+    """
+    paths = glob.glob(os.path.join(directory, '*.exited'))
+    alive = {}
+    for path in glob.glob(os.path.join(directory, '*.slots')):
+        pid = int(os.path.basename(path).split('-')[0])
+        if pid not in alive:
+            alive[pid] = _alive(pid)
+        if not alive[pid]:
+            paths.append(path)
+    if not paths:
+        return
+    exited = SlotFile(os.path.join(directory, EXITED))
+    try:
+        for path in paths:
+            for key, value in _read(path):
+                if FAMILIES.get(key[0], ('',))[0] != 'gauge':
+                    exited.add(key, value)
+            os.remove(path)
+    finally:
+        exited.close()
+
+
+def collect():
+    """{(name, labels): value} summed over the slot files of every process"""
+    directory = metrics_settings()['DIRECTORY']
+    os.makedirs(directory, exist_ok=True)
+    totals = {}
+    # one scrape at a time folds, and none reads a file that is being folded
+    with open(os.path.join(directory, 'collect.lock'), 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        _fold(directory)
+        for path in [*glob.glob(os.path.join(directory, '*.slots')), os.path.join(directory, EXITED)]:
+            for key, value in _read(path):
+                totals[key] = totals.get(key, 0.0) + value
+    return totals
+
+
+def _family(sample_name):
+    for suffix in ('_bucket', '_sum', '_count'):
+        if sample_name.endswith(suffix) and sample_name[:-len(suffix)] in FAMILIES:
+            return sample_name[:-len(suffix)]
+    return sample_name
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for _, value in labels)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + '}'
+
+
+def _format(value):
+    return str(int(value)) if value == int(value) else repr(value)
+
+
+def render():
+    """every metric in the Prometheus text exposition format"""
+    samples = {}
+    for (name, labels), value in collect().items():
+        samples.setdefault(_family(name), []).append((name, labels, value))
+
+    lines = []
+    for family, (kind, help_text, buckets) in FAMILIES.items():
+        lines.append(f'# HELP {family} {help_text}')
+        lines.append(f'# TYPE {family} {kind}')
+        if kind != 'histogram':
+            for name, labels, value in sorted(samples.get(family, [])):
+                lines.append(f'{name}{_labels(labels)} {_format(value)}')
+            continue
+        # buckets are stored per bound, the exposition format wants them cumulative
+        series = {}
+        for name, labels, value in samples.get(family, []):
+            if name.endswith('_bucket'):
+                base = tuple(pair for pair in labels if pair[0] != 'le')
+                series.setdefault(base, {})[dict(labels)['le']] = value
+            else:
+                series.setdefault(tuple(labels), {})[name[len(family):]] = value
+        for labels in sorted(series):
+            values = series[labels]
+            if '_count' not in values:
+                continue
+            cumulative = 0.0
+            for bound in [*map(str, buckets), '+Inf']:
+                cumulative += values.get(bound, 0.0)
+                lines.append(f'{family}_bucket{_labels(labels + (("le", bound),))} {_format(cumulative)}')
+            lines.append(f'{family}_sum{_labels(labels)} {_format(values.get("_sum", 0.0))}')
+            lines.append(f'{family}_count{_labels(labels)} {_format(values["_count"])}')
+    return '\n'.join(lines) + '\n'
+
+
+def clear():
+    """remove every process' slot files and the folded totals, resetting every metric"""
+    slots = getattr(_local, 'slots', None)
+    if slots is not None:
+        slots.retire()
+    _local.__dict__.clear()
+    directory = metrics_settings()['DIRECTORY']
+    for pattern in ('*.slots', '*.exited', EXITED):
+        for path in glob.glob(os.path.join(directory, pattern)):
+            os.remove(path)
+
+
+class _QueryTimer:
+    """database execute wrapper counting the queries of one request"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+
+
+class MetricsMiddleware:
+    """per route latency, status and database time of every request, see render()"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not metrics_settings()['ENABLED']:
+            return self.get_response(request)
+
+        queries = _QueryTimer()
+        inc('http_requests_in_flight')
+        start = time.perf_counter()
+        status = 500
+        try:
+            with wrap_queries(queries):
+                response = self.get_response(request)
+            status = response.status_code
+            return response
+        finally:
+            self.record(request, status, time.perf_counter() - start, queries)
+
+    async def __acall__(self, request):
+        if not metrics_settings()['ENABLED']:
+            return await self.get_response(request)
+
+        queries = _QueryTimer()
+        inc('http_requests_in_flight')
+        start = time.perf_counter()
+        status = 500
+        try:
+            with wrap_queries(queries):
+                response = await self.get_response(request)
+            status = response.status_code
+            return response
+        finally:
+            self.record(request, status, time.perf_counter() - start, queries)
+
+    @staticmethod
+    def record(request, status, elapsed, queries):
+        inc('http_requests_in_flight', amount=-1.0)
+        match = getattr(request, 'resolver_match', None)
+        route = (match.route or match.view_name) if match is not None else 'unmatched'
+        method = request.method if request.method in METHODS else 'other'
+        labels = (('method', method), ('route', route))
+        observe('http_request_duration_seconds', labels, elapsed)
+        inc('http_requests_total', labels + (('status', str(status)),))
+        inc('db_queries_total', (('route', route),), queries.count)
+        inc('db_query_duration_seconds_total', (('route', route),), queries.duration)
+
+
+class MetricsView(View):
+    """
+    Prometheus scrape endpoint, summing the metrics of every worker process.
+    Readable with the TOKEN or by a staff user, never anonymously.
+    """
+
+    def is_staff(self, request):
+        try:
+            result = CachedJWTAuthentication().authenticate(request)
+        except APIException:
+            result = None
+        user = result[0] if result is not None else getattr(request, 'user', None)
+        return user is not None and user.is_authenticated and user.is_staff
+
+    def get(self, request, *args, **kwargs):
+        token = metrics_settings()['TOKEN']
+        scraper = bool(token) and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+        if not scraper and not self.is_staff(request):
+            return HttpResponse(status=401, headers={'WWW-Authenticate': 'Bearer'})
+        return HttpResponse(render(), content_type='text/plain; version=0.0.4; charset=utf-8')
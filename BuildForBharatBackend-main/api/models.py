@@ -4,10 +4,13 @@ from django.contrib import auth
 from django.contrib.auth.base_user import BaseUserManager
 from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import AbstractUser, Group, Permission
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 from .filepath import gst_certificate_path, business_profile_pic_path
+from .storage import upload_storage
 from .util import validate_name, validate_contact_number
 
 from .validators import UnicodeContactNumberValidator, UnicodeNameValidator
@@ -16,9 +19,10 @@ from .validators import UnicodeContactNumberValidator, UnicodeNameValidator
 class UserManager(BaseUserManager):
     use_in_migrations = True
 
-    def _create_user(self, email, password, **extra_fields):
+    def _create_user(self, email, password, encoded_password=None, **extra_fields):
         """
         Create and save a user with the given username, email, and password.
+        Pass `encoded_password` when the hash was already computed elsewhere.
         """
         if not email:
             raise ValueError("The given username must be set")
@@ -30,7 +34,7 @@ class UserManager(BaseUserManager):
             self.model._meta.app_label, self.model._meta.object_name
         )
         user = self.model(email=email, **extra_fields)
-        user.password = make_password(password)
+        user.password = encoded_password or make_password(password)
         user.save(using=self._db)
         return user
 
@@ -128,6 +132,9 @@ class UserDetails(models.Model):
 
     class Meta:
         verbose_name = "User Details"
+        indexes = [
+            models.Index(fields=['is_seller', 'user']),
+        ]
 
 
 class OTPVerification(models.Model):
@@ -146,7 +153,7 @@ class OTPVerification(models.Model):
 class SellerGST(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='user_gst')
     seller_id = models.CharField(max_length=100, unique=True, null=True, blank=True)
-    certificate = models.ImageField(upload_to=gst_certificate_path, null=True, blank=True)
+    certificate = models.ImageField(upload_to=gst_certificate_path, storage=upload_storage, null=True, blank=True)
     trade_name = models.CharField(max_length=200, null=True)
     gst_number = models.CharField(max_length=100, null=True)
     gst_type = models.CharField(max_length=100, null=True)
@@ -163,11 +170,18 @@ class SellerGST(models.Model):
 
     class Meta:
         verbose_name_plural = "Seller GST Details"
+        # keyset pagination of the seller directory, see api/pagination.py
+        indexes = [
+            models.Index(fields=['created_on', 'id']),
+            models.Index(fields=['gst_verified', 'created_on', 'id']),
+            models.Index(fields=['gst_type', 'created_on', 'id']),
+        ]
 
 
 class Business(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='user_business')
-    profile_pic = models.ImageField(upload_to=business_profile_pic_path, help_text='Upload file for business profile.')
+    profile_pic = models.ImageField(upload_to=business_profile_pic_path, storage=upload_storage,
+                                    help_text='Upload file for business profile.')
     name = models.CharField(max_length=250, null=True)
     store_name = models.CharField(max_length=200, null=True)
     address = models.JSONField(null=True, blank=True)
@@ -197,3 +211,110 @@ class BanksDetails(models.Model):
 
     class Meta:
         verbose_name_plural = "Business Bank Details"
+
+
+class EmailOutbox(models.Model):
+    STATUS_PENDING = 'pending'
+    STATUS_SENDING = 'sending'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = (
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_SENDING, 'Sending'),
+        (STATUS_SENT, 'Sent'),
+        (STATUS_FAILED, 'Failed'),
+    )
+
+    subject = models.CharField(max_length=250)
+    message = models.TextField()
+    from_email = models.CharField(max_length=250, null=True, blank=True)
+    recipients = models.JSONField(default=list)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_on = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(null=True, blank=True)
+    sent_on = models.DateTimeField(null=True, blank=True)
+    created_on = models.DateTimeField(auto_now_add=True)
+    updated_on = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.subject} -> {", ".join(self.recipients)}'
+
+    class Meta:
+        verbose_name_plural = "Email Outbox"
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_on']),
+        ]
+
+
+class SellerProfile(models.Model):
+    """denormalized user, seller gst and business snapshot served by the read endpoints"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='user_profile')
+    data = models.JSONField(encoder=DjangoJSONEncoder)
+    updated_on = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "Seller Profiles"
+
+
+class MediaBlob(models.Model):
+    """one stored upload file, shared by every field whose content hashes the same"""
+    name = models.CharField(max_length=255, unique=True)
+    digest = models.CharField(max_length=64)
+    size = models.PositiveBigIntegerField(default=0)
+    refcount = models.IntegerField(default=0)
+    created_on = models.DateTimeField(auto_now_add=True)
+    updated_on = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.name} ({self.refcount})'
+
+    class Meta:
+        verbose_name_plural = "Media Blobs"
+        indexes = [
+            models.Index(fields=['refcount', 'updated_on']),
+        ]
+
+
+class IdSequence(models.Model):
+    """named counter that processes reserve blocks of ids from, see api/sellerids.py"""
+    name = models.CharField(max_length=50, primary_key=True)
+    next_value = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.name} ({self.next_value})'
+
+    class Meta:
+        verbose_name_plural = "Id Sequences"
+
+
+class RequestProfile(models.Model):
+    """one profiled request, its collapsed stacks and flamegraph are files, see api/profiling.py"""
+    PROFILER_SAMPLING = 'sampling'
+    PROFILER_CPROFILE = 'cprofile'
+    PROFILER_CHOICES = (
+        (PROFILER_SAMPLING, 'Sampling'),
+        (PROFILER_CPROFILE, 'cProfile'),
+    )
+
+    name = models.CharField(max_length=100, unique=True)
+    requested_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True,
+                                     related_name='request_profiles')
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=2000)
+    route = models.CharField(max_length=250, null=True, blank=True)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    duration_ms = models.FloatField()
+    profiler = models.CharField(max_length=10, choices=PROFILER_CHOICES)
+    samples = models.PositiveIntegerField(default=0)
+    size = models.PositiveBigIntegerField(default=0)
+    created_on = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.method} {self.path} ({self.duration_ms:.0f} ms)'
+
+    class Meta:
+        verbose_name_plural = "Request Profiles"
+        indexes = [
+            models.Index(fields=['created_on']),
+        ]
@@ -0,0 +1,127 @@
+import hashlib
+import hmac
+import secrets
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.memcached import BaseMemcachedCache
+from django.core.cache.backends.redis import RedisCache
+
+from . import models
+
+DEFAULTS = {
+    'CACHE_ALIAS': 'default',
+    'KEY_PREFIX': 'otp',
+    'LENGTH': 5,
+    'TTL': 600,                 # seconds an issued code stays valid
+    'MAX_ATTEMPTS': 5,          # wrong guesses before the current code is revoked
+}
+
+PURPOSES = ('email', 'gst', 'phone')
+
+NATIVE_TTL_CACHES = (BaseMemcachedCache, RedisCache)
+
+
+def otp_settings():
+    return {**DEFAULTS, **getattr(settings, 'OTP_STORE', {})}
+
+
+def _cache():
+    return caches[otp_settings()['CACHE_ALIAS']]
+
+
+def _key(purpose, user_id, suffix):
+    return f'{otp_settings()["KEY_PREFIX"]}:{purpose}:{user_id}:{suffix}'
+
+
+def _code_key(purpose, user_id, code):
+    # the code itself is never stored, only a keyed hash of it inside the key name
+    digest = hmac.new(settings.SECRET_KEY.encode(), f'{purpose}:{user_id}:{code}'.encode(), hashlib.sha256)
+    return _key(purpose, user_id, digest.hexdigest()[:32])
+
+
+def _delete_live(cache, key):
+    """
+    Delete `key` if it exists and hasn't expired, True if this call removed it.
+    memcached and redis expire keys themselves, so that is a single round trip.
+    locmem, database and file caches drop expired keys lazily and their delete
+    ignores expiry, so they are checked first.
+    """
+    if not isinstance(cache, NATIVE_TTL_CACHES) and not cache.has_key(key):
+        return False
+    return cache.delete(key)
+
+
+def generate_code():
+    length = otp_settings()['LENGTH']
+    return f'{secrets.randbelow(10 ** length):0{length}d}'
+
+
+def issue(purpose, user_id):
+    """create a code for `purpose`, replacing any earlier one, and return it"""
+    conf = otp_settings()
+    cache = _cache()
+    code = generate_code()
+    key = _code_key(purpose, user_id, code)
+    current_key = _key(purpose, user_id, 'current')
+    previous = cache.get(current_key)
+    if previous is not None:
+        cache.delete(previous)
+    cache.set_many({key: 1, current_key: key}, conf['TTL'])
+    cache.delete(_key(purpose, user_id, 'attempts'))
+    return code
+
+
+def revoke(purpose, user_id):
+    cache = _cache()
+    current_key = _key(purpose, user_id, 'current')
+    current = cache.get(current_key)
+    cache.delete_many([key for key in (current, current_key) if key])
+
+
+def consume(purpose, user_id, code):
+    """
+    Verify and invalidate `code` in one step. Every attempt is counted before
+    its compare, so parallel guesses can't get more than MAX_ATTEMPTS compares
+    between them, and the code is revoked by the last one. The delete is the
+    compare: only the caller that actually removed the key succeeds, so a code
+    can't be used twice.
+    """
+    conf = otp_settings()
+    cache = _cache()
+    attempts_key = _key(purpose, user_id, 'attempts')
+    if cache.add(attempts_key, 1, conf['TTL']):
+        attempts = 1
+    else:
+        try:
+            attempts = cache.incr(attempts_key)
+        except ValueError:
+            # expired between add and incr
+            attempts = 1
+    if attempts > conf['MAX_ATTEMPTS']:
+        return False
+    if _delete_live(cache, _code_key(purpose, user_id, code)):
+        return True
+    if attempts == conf['MAX_ATTEMPTS']:
+        revoke(purpose, user_id)
+    return False
+
+
+def mark_verified(purpose, user_id):
+    """persist the verification flag of `purpose`, the only database write of a successful verify"""
+    from .signals import profile_changed, user_changed
+
+    if purpose == 'gst':
+        models.SellerGST.objects.filter(user_id=user_id).update(is_otp_used=True, gst_verified=True)
+        profile_changed(user_id)
+    else:
+        field = 'phone_number_verified' if purpose == 'phone' else 'email_verified'
+        models.UserDetails.objects.filter(user_id=user_id).update(**{field: True})
+        user_changed(user_id)
+
+
+def verify(purpose, user_id, code):
+    if not consume(purpose, user_id, code):
+        return False
+    mark_verified(purpose, user_id)
+    return True
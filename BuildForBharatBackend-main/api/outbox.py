@@ -0,0 +1,217 @@
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import metrics, models
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'WORKERS': 2,
+    'BATCH_SIZE': 50,
+    'MAX_ATTEMPTS': 5,
+    'BACKOFF_BASE': 30,         # seconds, doubled on every failed attempt
+    'BACKOFF_MAX': 3600,        # seconds
+    'LEASE': 300,               # seconds before a claimed row is considered abandoned
+    'DISPATCH_ON_COMMIT': True,
+}
+
+stats = {'sent': 0, 'retried': 0, 'failed': 0}
+_stats_lock = threading.Lock()
+
+_executor = None
+_executor_lock = threading.Lock()
+_queued = 0
+_retry_timer = None
+_retry_at = None
+
+
+def outbox_settings():
+    return {**DEFAULTS, **getattr(settings, 'EMAIL_OUTBOX', {})}
+
+
+def enqueue(subject, message, from_email, recipient_list):
+    """
+    Store an email in the outbox. The row is written in the caller's transaction
+    and handed to the worker pool only once that transaction commits.
+    """
+    entry = models.EmailOutbox.objects.create(subject=subject, message=message, from_email=from_email,
+                                              recipients=list(recipient_list))
+    if outbox_settings()['DISPATCH_ON_COMMIT']:
+        transaction.on_commit(dispatch)
+    return entry
+
+
+def queue_depth():
+    """number of emails waiting to be delivered"""
+    return models.EmailOutbox.objects.filter(
+        status__in=[models.EmailOutbox.STATUS_PENDING, models.EmailOutbox.STATUS_SENDING]).count()
+
+
+def dispatch():
+    """schedule a drain on the worker pool unless one is already waiting to start"""
+    global _executor, _queued
+    with _executor_lock:
+        if _queued > 0:
+            return
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=outbox_settings()['WORKERS'],
+                                           thread_name_prefix='email-outbox')
+        _queued += 1
+    _executor.submit(_run_worker)
+
+
+def wait():
+    """let the dispatched drains finish and stop the workers, the next dispatch starts new ones"""
+    global _executor, _retry_timer
+    with _executor_lock:
+        executor, _executor = _executor, None
+        timer, _retry_timer = _retry_timer, None
+    if timer is not None:
+        timer.cancel()
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+
+def schedule_retry():
+    """
+    Dispatch again when the earliest pending email is due, so a failed send is
+    retried even if nothing else is enqueued. One timer per process, moved
+    earlier when a sooner retry comes up.
+    """
+    global _retry_timer, _retry_at
+    due = (models.EmailOutbox.objects.filter(status=models.EmailOutbox.STATUS_PENDING)
+           .order_by('next_attempt_on').values_list('next_attempt_on', flat=True).first())
+    if due is None:
+        return
+    delay = max((due - timezone.now()).total_seconds(), 0)
+    at = time.monotonic() + delay
+    with _executor_lock:
+        if _retry_timer is not None and _retry_at <= at:
+            return
+        if _retry_timer is not None:
+            _retry_timer.cancel()
+        _retry_timer = threading.Timer(delay, _retry)
+        _retry_timer.daemon = True
+        _retry_at = at
+        _retry_timer.start()
+
+
+def _retry():
+    global _retry_timer
+    with _executor_lock:
+        if _retry_timer is threading.current_thread():
+            _retry_timer = None
+    dispatch()
+
+
+def _run_worker():
+    global _queued
+    with _executor_lock:
+        _queued -= 1
+    try:
+        drain()
+        schedule_retry()
+    except Exception:
+        logger.exception('email outbox worker failed')
+    finally:
+        connections.close_all()
+
+
+def _claimable(now, lease):
+    return (Q(status=models.EmailOutbox.STATUS_PENDING, next_attempt_on__lte=now) |
+            Q(status=models.EmailOutbox.STATUS_SENDING, updated_on__lt=now - timedelta(seconds=lease)))
+
+
+def _claim(batch_size, lease):
+    """
+    Atomically move up to `batch_size` due rows to the sending state. A row is only
+    claimed by the worker whose conditional update actually changed it, so several
+    workers (or processes) can drain the same outbox.
+    """
+    now = timezone.now()
+    candidates = list(models.EmailOutbox.objects.filter(_claimable(now, lease))
+                      .order_by('next_attempt_on', 'id').values_list('id', flat=True)[:batch_size])
+    claimed = []
+    for pk in candidates:
+        updated = models.EmailOutbox.objects.filter(_claimable(now, lease), pk=pk).update(
+            status=models.EmailOutbox.STATUS_SENDING, updated_on=now)
+        if updated:
+            claimed.append(pk)
+    return list(models.EmailOutbox.objects.filter(pk__in=claimed).order_by('id'))
+
+
+def backoff(attempts):
+    conf = outbox_settings()
+    delay = min(conf['BACKOFF_MAX'], conf['BACKOFF_BASE'] * 2 ** max(attempts - 1, 0))
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def _record(key):
+    with _stats_lock:
+        stats[key] += 1
+
+
+def drain(batch_size=None, connection=None):
+    """
+    Deliver every due email over a single reused mail connection and return the
+    number of emails sent. Failed deliveries are rescheduled with exponential
+    backoff until MAX_ATTEMPTS is reached.
+    """
+    conf = outbox_settings()
+    batch_size = batch_size or conf['BATCH_SIZE']
+    owns_connection = connection is None
+    connection = connection or get_connection()
+    sent = 0
+    try:
+        while True:
+            batch = _claim(batch_size, conf['LEASE'])
+            if not batch:
+                return sent
+            for entry in batch:
+                if _deliver(entry, connection, conf):
+                    sent += 1
+    finally:
+        if owns_connection:
+            connection.close()
+
+
+def _deliver(entry, connection, conf):
+    message = EmailMessage(entry.subject, entry.message, entry.from_email or settings.DEFAULT_FROM_EMAIL,
+                           entry.recipients, connection=connection)
+    entry.attempts += 1
+    start = time.perf_counter()
+    try:
+        connection.open()
+        message.send()
+    except Exception as exc:
+        metrics.observe('email_send_duration_seconds', (('result', 'error'),), time.perf_counter() - start)
+        # drop the broken session, the next message reconnects on demand
+        connection.close()
+        entry.last_error = repr(exc)
+        if entry.attempts >= conf['MAX_ATTEMPTS']:
+            entry.status = models.EmailOutbox.STATUS_FAILED
+            _record('failed')
+            logger.error('giving up on outbox email %s after %s attempts: %r', entry.pk, entry.attempts, exc)
+        else:
+            entry.status = models.EmailOutbox.STATUS_PENDING
+            entry.next_attempt_on = timezone.now() + backoff(entry.attempts)
+            _record('retried')
+        entry.save(update_fields=['attempts', 'status', 'next_attempt_on', 'last_error', 'updated_on'])
+        return False
+    metrics.observe('email_send_duration_seconds', (('result', 'sent'),), time.perf_counter() - start)
+    entry.status = models.EmailOutbox.STATUS_SENT
+    entry.sent_on = timezone.now()
+    entry.last_error = None
+    entry.save(update_fields=['attempts', 'status', 'sent_on', 'last_error', 'updated_on'])
+    _record('sent')
+    return True
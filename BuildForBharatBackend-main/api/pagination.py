@@ -0,0 +1,44 @@
+import base64
+import json
+from datetime import datetime
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+def encode_cursor(created_on, pk):
+    """opaque cursor for the position after the row (created_on, pk)"""
+    raw = json.dumps([created_on.isoformat(), pk], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(created_on, pk) of a cursor made by `encode_cursor`, ValidationError when it is malformed"""
+    try:
+        created_on, pk = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return datetime.fromisoformat(created_on), int(pk)
+    except (TypeError, ValueError):
+        raise ValidationError('Invalid cursor.')
+
+
+def keyset_page(queryset, cursor=None, page_size=50, field='created_on'):
+    """
+    One page of `queryset`, newest first, and the cursor of the next page (None
+    on the last one). Rows are ordered by (`field`, pk) and a page starts right
+    after the cursor's row instead of at an OFFSET, so with an index on
+    (..., `field`, id) every page is one index range read however deep it is,
+    and no COUNT(*) is run.
+    """
+    if cursor:
+        created_on, pk = decode_cursor(cursor)
+        # `field <= x AND (...)` rather than a plain OR so the index range is bounded on both databases
+        queryset = queryset.filter(Q(**{f'{field}__lte': created_on}),
+                                   Q(**{f'{field}__lt': created_on}) | Q(pk__lt=pk))
+    rows = list(queryset.order_by(f'-{field}', '-pk')[:page_size + 1])
+    if len(rows) <= page_size:
+        return rows, None
+    rows = rows[:page_size]
+    last = rows[-1]
+    if isinstance(last, dict):
+        return rows, encode_cursor(last[field], last['id'])
+    return rows, encode_cursor(getattr(last, field), last.pk)
@@ -0,0 +1,337 @@
+import cProfile
+import glob
+import html
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from collections import defaultdict
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core import signing
+from django.core.cache import caches
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+
+from . import models
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': True,
+    'PROFILER': 'sampling',     # or 'cprofile', which adds exact call counts and is several times slower
+    'INTERVAL': 0.002,          # seconds between samples
+    'DIRECTORY': os.environ.get('PROFILES_DIR') or os.path.join(tempfile.gettempdir(), 'bharat-profiles'),
+    'MAX_PROFILES': 100,        # older profiles are deleted, files and rows
+    'MAX_AGE': 300,             # seconds a trigger token stays valid, it profiles one request
+    'HEADER': 'X-Profile',
+    'CACHE_ALIAS': 'default',   # remembers used tokens
+}
+
+SALT = 'api.profiling'
+FLAMEGRAPH_WIDTH = 1200
+FRAME_HEIGHT = 16
+
+
+def profiling_settings():
+    return {**DEFAULTS, **getattr(settings, 'REQUEST_PROFILING', {})}
+
+
+def make_token(user, path='/', profiler=None):
+    """a signed trigger that profiles one of `user`'s requests under `path`, unless it expires first"""
+    return signing.dumps({'u': user.pk, 'p': path, 'm': profiler, 'n': get_random_string(16)}, salt=SALT,
+                         compress=True)
+
+
+def get_token(request, conf):
+    # a header only, a query parameter would end up in access logs
+    return request.META.get('HTTP_' + conf['HEADER'].upper().replace('-', '_'))
+
+
+def get_trigger(request, conf):
+    """(staff user, profiler) when the request carries a valid, unused trigger token, else None"""
+    token = get_token(request, conf)
+    if not token:
+        return None
+    try:
+        payload = signing.loads(token, salt=SALT, max_age=conf['MAX_AGE'])
+    except signing.BadSignature:
+        return None
+    if not request.path.startswith(payload['p']):
+        return None
+    # a revoked staff member's tokens stop working
+    user = models.User.objects.filter(pk=payload['u'], is_active=True, is_staff=True).first()
+    if user is None:
+        return None
+    # single use, a replayed token is ignored
+    if not caches[conf['CACHE_ALIAS']].add(f'profiling:used:{payload["n"]}', True, conf['MAX_AGE']):
+        return None
+    return user, payload['m'] or conf['PROFILER']
+
+
+_labels = {}
+
+
+def _short(filename):
+    for marker in ('site-packages' + os.sep, 'dist-packages' + os.sep):
+        if marker in filename:
+            return filename.rsplit(marker, 1)[1]
+    base = str(settings.BASE_DIR) + os.sep
+    return filename[len(base):] if filename.startswith(base) else os.path.basename(filename)
+
+
+def _label(filename, lineno, name):
+    key = (filename, lineno, name)
+    label = _labels.get(key)
+    if label is None:
+        # ';' separates frames in the collapsed format
+        label = _labels[key] = f'{name} ({_short(filename)}:{lineno})'.replace(';', ':')
+    return label
+
+
+class Sampler:
+    """
+    Samples the stack of the thread that started it from a background thread,
+    so the profiled code runs at full speed apart from the GIL hand-offs.
+    Weights are sample counts.
+    """
+    kind = models.RequestProfile.PROFILER_SAMPLING
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.stacks = defaultdict(int)
+        self.samples = 0
+        self._stop = threading.Event()
+
+    def __enter__(self):
+        return self.start(sys._getframe(1))
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self, root):
+        self._target = threading.get_ident()
+        # frames from `root` up belong to the server, not the request
+        self._root = root
+        self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            stack = []
+            while frame is not None and frame is not self._root:
+                code = frame.f_code
+                stack.append(_label(code.co_filename, code.co_firstlineno, code.co_name))
+                frame = frame.f_back
+            if stack:
+                self.stacks[tuple(reversed(stack))] += 1
+                self.samples += 1
+
+
+class Tracer(Sampler):
+    """
+    cProfile's exact call counts and per-function times, kept as a pstats
+    file. cProfile only records caller -> callee edges, which can't be put back
+    together into stacks (every middleware shares one `inner` function), so the
+    flame graph still comes from samples.
+    """
+    kind = models.RequestProfile.PROFILER_CPROFILE
+
+    def __init__(self, interval):
+        super().__init__(interval)
+        self.profile = cProfile.Profile()
+
+    def __enter__(self):
+        self.start(sys._getframe(1))
+        self.profile.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profile.disable()
+        self.stop()
+
+
+def collapsed(stacks):
+    """the folded format of flamegraph.pl and speedscope, one `frame;frame weight` line per stack"""
+    return ''.join(f'{";".join(stack)} {weight}\n' for stack, weight in sorted(stacks.items()))
+
+
+def flamegraph(stacks, title):
+    """a self-contained SVG flame graph, callers at the bottom"""
+    root = {'weight': 0, 'children': {}}
+    depth = 0
+    for stack, weight in stacks.items():
+        node = root
+        node['weight'] += weight
+        for frame in stack:
+            node = node['children'].setdefault(frame, {'weight': 0, 'children': {}})
+            node['weight'] += weight
+        depth = max(depth, len(stack))
+
+    height = (depth + 2) * FRAME_HEIGHT
+    scale = FLAMEGRAPH_WIDTH / root['weight'] if root['weight'] else 0
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{FLAMEGRAPH_WIDTH}" height="{height}" '
+        f'font-family="monospace" font-size="11">',
+        f'<text x="4" y="12">{html.escape(title)}, {root["weight"]} samples</text>',
+    ]
+
+    def draw(name, node, x, level):
+        width = node['weight'] * scale
+        if width < 0.5:
+            return
+        y = height - (level + 1) * FRAME_HEIGHT
+        # a stable warm colour per frame, like flamegraph.pl
+        hue = zlib.crc32(name.encode()) % 60
+        share = 100 * node['weight'] / root['weight']
+        parts.append(f'<g><title>{html.escape(name)}: {node["weight"]} samples, {share:.1f}%</title>'
+                     f'<rect x="{x:.1f}" y="{y}" width="{width:.1f}" height="{FRAME_HEIGHT - 1}" '
+                     f'fill="hsl({hue},85%,60%)"/>')
+        characters = int(width / 7)
+        if characters >= 3:
+            text = name if len(name) <= characters else name[:characters - 2] + '..'
+            parts.append(f'<text x="{x + 2:.1f}" y="{y + 11}">{html.escape(text)}</text>')
+        parts.append('</g>')
+        for child_name, child in sorted(node['children'].items()):
+            draw(child_name, child, x, level + 1)
+            x += child['weight'] * scale
+
+    x = 0.0
+    for name, node in sorted(root['children'].items()):
+        draw(name, node, x, 0)
+        x += node['weight'] * scale
+    parts.append('</svg>')
+    return '\n'.join(parts) + '\n'
+
+
+def file_path(profile, extension, conf=None):
+    """the 'collapsed', 'svg' or, for cProfile, 'prof' file of `profile`"""
+    conf = conf or profiling_settings()
+    return os.path.join(conf['DIRECTORY'], f'{profile.name}.{extension}')
+
+
+def save(request, response, user, profiler, elapsed):
+    conf = profiling_settings()
+    os.makedirs(conf['DIRECTORY'], exist_ok=True)
+    match = getattr(request, 'resolver_match', None)
+    # the row first, so pruning by another process never mistakes the files for orphans
+    profile = models.RequestProfile.objects.create(
+        name=f'{timezone.now():%Y%m%dT%H%M%S}-{get_random_string(8).lower()}',
+        requested_by=user, method=request.method, path=request.path[:2000],
+        route=match.route if match is not None else None, status_code=response.status_code,
+        duration_ms=round(elapsed * 1000, 3), profiler=profiler.kind, samples=profiler.samples)
+    title = f'{request.method} {request.path} {profile.duration_ms:.1f} ms'
+    size = 0
+    for extension, content in (('collapsed', collapsed(profiler.stacks)),
+                               ('svg', flamegraph(profiler.stacks, title))):
+        with open(file_path(profile, extension, conf), 'w') as file:
+            size += file.write(content)
+    if profiler.kind == models.RequestProfile.PROFILER_CPROFILE:
+        path = file_path(profile, 'prof', conf)
+        profiler.profile.dump_stats(path)
+        size += os.path.getsize(path)
+    profile.size = size
+    profile.save(update_fields=['size'])
+    prune(conf)
+    return profile
+
+
+def delete_files(profile):
+    for extension in ('collapsed', 'svg', 'prof'):
+        try:
+            os.remove(file_path(profile, extension))
+        except FileNotFoundError:
+            pass
+
+
+def prune(conf=None):
+    """keep the newest MAX_PROFILES profiles, and drop files no profile refers to"""
+    conf = conf or profiling_settings()
+    keep = list(models.RequestProfile.objects.order_by('-created_on', '-id')
+                .values_list('id', flat=True)[:conf['MAX_PROFILES']])
+    # deleting the rows deletes their files, see signals.py
+    models.RequestProfile.objects.exclude(id__in=keep).delete()
+    names = set(models.RequestProfile.objects.values_list('name', flat=True))
+    for path in glob.glob(os.path.join(conf['DIRECTORY'], '*.*')):
+        stem = os.path.basename(path).rsplit('.', 1)[0]
+        if stem in names:
+            continue
+        try:
+            # leave the files of a profile that is being saved right now
+            if os.path.getmtime(path) < time.time() - 60:
+                os.remove(path)
+        except OSError:
+            # another process pruned it first
+            pass
+
+
+class ProfilingMiddleware:
+    """
+    Profile the requests that carry a trigger from make_token() in the
+    REQUEST_PROFILING header. Everything else pays for one dictionary lookup.
+    The response names the profile in X-Profile-Id; failing to save the
+    profile is logged and doesn't fail the response. Under ASGI the samples are
+    of the event loop thread, so they include whatever else it ran meanwhile.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        conf = profiling_settings()
+        trigger = get_trigger(request, conf) if conf['ENABLED'] else None
+        if trigger is None:
+            return self.get_response(request)
+
+        user, kind = trigger
+        profiler = self.profiler(kind, conf)
+        start = time.perf_counter()
+        with profiler:
+            response = self.get_response(request)
+        return self.finish(request, response, user, profiler, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        conf = profiling_settings()
+        # the token is checked against the database, only requests that carry one pay for it
+        if not conf['ENABLED'] or not get_token(request, conf):
+            return await self.get_response(request)
+        trigger = await sync_to_async(get_trigger)(request, conf)
+        if trigger is None:
+            return await self.get_response(request)
+
+        user, kind = trigger
+        profiler = self.profiler(kind, conf)
+        start = time.perf_counter()
+        with profiler:
+            response = await self.get_response(request)
+        return await sync_to_async(self.finish)(request, response, user, profiler, time.perf_counter() - start)
+
+    @staticmethod
+    def profiler(kind, conf):
+        return (Tracer if kind == models.RequestProfile.PROFILER_CPROFILE else Sampler)(conf['INTERVAL'])
+
+    @staticmethod
+    def finish(request, response, user, profiler, elapsed):
+        try:
+            profile = save(request, response, user, profiler, elapsed)
+        except Exception:
+            logger.exception('saving the profile of %s %s failed', request.method, request.path)
+        else:
+            response['X-Profile-Id'] = str(profile.pk)
+        return response
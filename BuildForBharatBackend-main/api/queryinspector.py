@@ -0,0 +1,204 @@
+import logging
+import re
+import time
+import traceback
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': False,
+    'N_PLUS_ONE_THRESHOLD': 3,      # identical query shapes per request before they are reported
+    'CAPTURE_STACK': True,
+    'STACK_DEPTH': 8,
+    'RAISE_ON_BUDGET': False,       # turn budget overruns into errors instead of warnings
+}
+
+_literals = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_in_lists = re.compile(r'\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\)')
+_spaces = re.compile(r'\s+')
+
+
+def inspector_settings():
+    return {**DEFAULTS, **getattr(settings, 'QUERY_INSPECTOR', {})}
+
+
+def query_shape(sql):
+    """sql with literals and IN lists collapsed, so repeats of one query compare equal"""
+    shape = _literals.sub('?', sql)
+    shape = _in_lists.sub('(?)', shape)
+    return _spaces.sub(' ', shape).strip()
+
+
+def _project_stack(depth):
+    """innermost project frames that led to the query, skipping django and site-packages"""
+    base = str(settings.BASE_DIR)
+    frames = [frame for frame in traceback.extract_stack()[:-3]
+              if frame.filename.startswith(base) and 'site-packages' not in frame.filename
+              and not frame.filename.endswith('queryinspector.py')]
+    return [f'{frame.filename[len(base) + 1:]}:{frame.lineno} in {frame.name}' for frame in frames[-depth:]]
+
+
+class QueryRecorder:
+    """database execute wrapper that keeps every query run while it is installed"""
+
+    def __init__(self, capture_stack=True, stack_depth=8):
+        self.capture_stack = capture_stack
+        self.stack_depth = stack_depth
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'alias': context['connection'].alias,
+                'sql': sql,
+                'shape': query_shape(sql),
+                'duration': time.perf_counter() - start,
+                'stack': _project_stack(self.stack_depth) if self.capture_stack else [],
+            })
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def duration(self):
+        return sum(query['duration'] for query in self.queries)
+
+    def repeated(self, threshold):
+        """(shape, count, first stack) for every shape run at least `threshold` times"""
+        counts = Counter(query['shape'] for query in self.queries)
+        found = []
+        for shape, count in counts.most_common():
+            if count < threshold:
+                break
+            stack = next(query['stack'] for query in self.queries if query['shape'] == shape)
+            found.append((shape, count, stack))
+        return found
+
+    def report(self):
+        lines = [f'{self.count} queries in {self.duration * 1000:.1f} ms']
+        for number, query in enumerate(self.queries, 1):
+            lines.append(f'{number}. [{query["alias"]}] {query["sql"]}')
+            lines.extend(f'       {frame}' for frame in query['stack'])
+        return '\n'.join(lines)
+
+
+# execute wrappers of the current context, outermost first
+_wrappers = ContextVar('query_wrappers', default=())
+
+
+def _run_wrappers(execute, sql, params, many, context):
+    for wrapper in reversed(_wrappers.get()):
+        execute = partial(wrapper, execute)
+    return execute(sql, params, many, context)
+
+
+def _install(connection, **kwargs):
+    if _run_wrappers not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_run_wrappers)
+
+
+connection_created.connect(_install)
+
+
+@contextmanager
+def wrap_queries(wrapper):
+    """
+    Run `wrapper` around the queries of the block, like connection.execute_wrapper()
+    but on whichever thread's connection runs them: sync_to_async carries the
+    context along, so the queries an async view sends to a worker thread count.
+    """
+    for connection in connections.all():
+        _install(connection)
+    token = _wrappers.set(_wrappers.get() + (wrapper,))
+    try:
+        yield wrapper
+    finally:
+        _wrappers.reset(token)
+
+
+@contextmanager
+def record_queries(capture_stack=True, stack_depth=8):
+    with wrap_queries(QueryRecorder(capture_stack, stack_depth)) as recorder:
+        yield recorder
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+@contextmanager
+def query_budget(budget, label='block'):
+    """fail with the offending queries and their call sites when more than `budget` queries run"""
+    with record_queries() as recorder:
+        yield recorder
+    if recorder.count > budget:
+        raise QueryBudgetExceeded(f'{label} ran {recorder.count} queries, budget is {budget}\n{recorder.report()}')
+
+
+def get_budget(url_name):
+    from .urls import query_budgets
+    return query_budgets.get(url_name)
+
+
+class QueryInspectorMiddleware:
+    """
+    Development / CI middleware: records every query a view runs, reports repeated
+    query shapes as likely N+1 patterns and checks the endpoint's query budget
+    declared in api/urls.py.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        conf = inspector_settings()
+        if not conf['ENABLED']:
+            return self.get_response(request)
+
+        with record_queries(conf['CAPTURE_STACK'], conf['STACK_DEPTH']) as recorder:
+            response = self.get_response(request)
+        return self.inspect(request, response, recorder, conf)
+
+    async def __acall__(self, request):
+        conf = inspector_settings()
+        if not conf['ENABLED']:
+            return await self.get_response(request)
+
+        with record_queries(conf['CAPTURE_STACK'], conf['STACK_DEPTH']) as recorder:
+            response = await self.get_response(request)
+        return self.inspect(request, response, recorder, conf)
+
+    @staticmethod
+    def inspect(request, response, recorder, conf):
+        response['X-Query-Count'] = str(recorder.count)
+        for shape, count, stack in recorder.repeated(conf['N_PLUS_ONE_THRESHOLD']):
+            logger.warning('possible N+1 on %s %s: %s queries like %s\n%s', request.method, request.path, count,
+                           shape, '\n'.join(stack))
+
+        match = request.resolver_match
+        budget = get_budget(match.url_name) if match else None
+        if budget is not None and recorder.count > budget:
+            message = f'{request.method} {request.path} ran {recorder.count} queries, budget is {budget}'
+            if conf['RAISE_ON_BUDGET']:
+                raise QueryBudgetExceeded(f'{message}\n{recorder.report()}')
+            logger.warning('%s\n%s', message, recorder.report())
+        return response
@@ -0,0 +1,88 @@
+import threading
+
+from django.db import transaction
+
+from . import models
+from . import replicas
+from . import serializers
+
+_pending = threading.local()
+
+
+def _profile_queryset(user_id):
+    return (models.User.objects.select_related('user_details', 'user_gst', 'user_business')
+            .prefetch_related('user_business__business_bank_details').filter(pk=user_id))
+
+
+def build_profile(user_id):
+    """
+    Serialize everything the seller app loads on launch into one dict, or return
+    None when the user no longer exists.
+    """
+    return _serialize_profile(_profile_queryset(user_id).first())
+
+
+def _serialize_profile(user):
+    if user is None:
+        return None
+    return {
+        'user': serializers.UserSerializer(user, many=False).data,
+        'seller_gst': (serializers.SellerGSTDetailsSerializer(user.user_gst, many=False).data
+                       if hasattr(user, 'user_gst') else None),
+        'business': (serializers.BusinessSerializer(user.user_business, many=False).data
+                     if hasattr(user, 'user_business') else None),
+    }
+
+
+def rebuild_profile(user_id):
+    # the snapshot is written to the primary, so it must not be built from a lagging replica
+    with replicas.use_primary():
+        data = build_profile(user_id)
+    if data is None:
+        models.SellerProfile.objects.filter(pk=user_id).delete()
+        return None
+    models.SellerProfile.objects.update_or_create(user_id=user_id, defaults={'data': data})
+    return data
+
+
+def get_profile(user_id):
+    """the user's snapshot with a single primary key lookup, built on the spot if missing"""
+    data = models.SellerProfile.objects.filter(pk=user_id).values_list('data', flat=True).first()
+    if data is None:
+        data = rebuild_profile(user_id)
+    return data
+
+
+async def aget_profile(user_id):
+    """get_profile for async views, using the async ORM only"""
+    data = await models.SellerProfile.objects.filter(pk=user_id).values_list('data', flat=True).afirst()
+    if data is None:
+        # related rows are all loaded by the query, serializing does no further I/O
+        with replicas.use_primary():
+            data = _serialize_profile(await _profile_queryset(user_id).afirst())
+        if data is None:
+            return None
+        await models.SellerProfile.objects.aupdate_or_create(user_id=user_id, defaults={'data': data})
+    return data
+
+
+def schedule_rebuild(user_id):
+    """
+    Rebuild the snapshot once the current transaction commits. Every change
+    registers a callback, but the first one to run rebuilds all pending users
+    and the rest find nothing left to do. Ids left behind by a rollback are
+    simply rebuilt after the next commit.
+    """
+    if not transaction.get_connection().in_atomic_block:
+        rebuild_profile(user_id)
+        return
+    if getattr(_pending, 'user_ids', None) is None:
+        _pending.user_ids = set()
+    _pending.user_ids.add(user_id)
+    transaction.on_commit(_flush)
+
+
+def _flush():
+    user_ids, _pending.user_ids = getattr(_pending, 'user_ids', None) or set(), set()
+    for user_id in user_ids:
+        rebuild_profile(user_id)
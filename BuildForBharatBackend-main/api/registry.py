@@ -0,0 +1,116 @@
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+
+MAGIC = b'BHREG001'
+HEADER = struct.Struct('<8sHIQ')        # magic, key size, record size, record count
+HEADER_SIZE = 32
+SEPARATOR = b'\x1f'
+
+
+def build(path, records, key_size, record_size):
+    """
+    Write `records`, an iterable of (key, [field, ...]), as a registry file: a
+    header followed by fixed width records sorted by key. Keys are ASCII and at
+    most `key_size` bytes, fields are UTF-8 joined with \\x1f and truncated to
+    fit. The file is swapped in atomically, workers holding the old one keep
+    reading it until they notice the change. Returns the number of records.
+    """
+    value_size = record_size - key_size
+    encoded = {}
+    for key, fields in records:
+        key = key.encode('ascii')
+        if len(key) > key_size:
+            raise ValueError(f'key {key!r} is longer than {key_size} bytes')
+        value = SEPARATOR.join((field or '').encode() for field in fields)[:value_size]
+        # drop a multi byte character cut in half by the truncation
+        encoded[key.ljust(key_size, b' ')] = value.decode(errors='ignore').encode().ljust(value_size, b'\0')
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=directory, prefix='.registry-', delete=False) as file:
+        file.write(HEADER.pack(MAGIC, key_size, record_size, len(encoded)).ljust(HEADER_SIZE, b'\0'))
+        for key in sorted(encoded):
+            file.write(key)
+            file.write(encoded[key])
+    # NamedTemporaryFile is private to its owner, the workers may run as another user
+    os.chmod(file.name, 0o644)
+    os.replace(file.name, path)
+    return len(encoded)
+
+
+class Registry:
+    """
+    Read-only sorted record file searched in place through mmap. The pages live
+    in the OS page cache, shared by every worker process, instead of in each
+    worker's heap. The file is opened on first use and re-opened when it is
+    replaced, checked at most every `check_interval` seconds.
+    """
+
+    def __init__(self, path, check_interval=60):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._state = None          # (mmap, key size, record size, count, file identity), swapped as a whole
+        self._identity = None
+        self._checked = None
+
+    def _open(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if identity == self._identity:
+            return self._state
+        with open(self.path, 'rb') as file:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, key_size, record_size, count = HEADER.unpack_from(data)
+        if magic != MAGIC or HEADER_SIZE + count * record_size > len(data):
+            data.close()
+            raise ValueError(f'{self.path} is not a registry file')
+        # the previous mapping is left to the garbage collector, a concurrent reader may still use it
+        self._identity = identity
+        return data, key_size, record_size, count, identity
+
+    def state(self):
+        now = time.monotonic()
+        if self._checked is None or now - self._checked > self.check_interval:
+            with self._lock:
+                if self._checked is None or now - self._checked > self.check_interval:
+                    self._state = self._open()
+                    self._checked = now
+        return self._state
+
+    def __len__(self):
+        state = self.state()
+        return state[3] if state is not None else 0
+
+    def get(self, key):
+        """the fields stored for `key`, or None"""
+        state = self.state()
+        if state is None:
+            return None
+        data, key_size, record_size, count, _ = state
+        try:
+            key = key.encode('ascii').ljust(key_size, b' ')
+        except UnicodeEncodeError:
+            return None
+        if len(key) != key_size:
+            return None
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            offset = HEADER_SIZE + middle * record_size
+            probe = data[offset:offset + key_size]
+            if probe < key:
+                low = middle + 1
+            elif probe > key:
+                high = middle
+            else:
+                value = data[offset + key_size:offset + record_size].rstrip(b'\0')
+                return [field.decode() for field in value.split(SEPARATOR)]
+        return None
@@ -1,14 +1,79 @@
-from rest_framework import renderers
 import json
 
+from rest_framework import renderers
+from rest_framework.exceptions import ErrorDetail
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_encoder = JSONEncoder()
+
+
+class _ErrorTracker:
+    """
+    orjson `default` hook. With OPT_PASSTHROUGH_SUBCLASS every str/dict/list
+    subclass lands here, which is how ErrorDetail values are spotted during the
+    single encoding pass.
+    """
+
+    def __init__(self):
+        self.found = False
+
+    def __call__(self, obj):
+        if isinstance(obj, ErrorDetail):
+            self.found = True
+            return str(obj)
+        if isinstance(obj, str):
+            return str(obj)
+        if isinstance(obj, dict):
+            return dict(obj)
+        if isinstance(obj, list):
+            return list(obj)
+        if isinstance(obj, int):
+            return int(obj)
+        return _encoder.default(obj)
+
+
+def _contains_error(data):
+    """structural ErrorDetail search for the stdlib encoder, stops at the first hit"""
+    stack = [data]
+    pop, extend = stack.pop, stack.extend
+    while stack:
+        item = pop()
+        if isinstance(item, str):
+            if isinstance(item, ErrorDetail):
+                return True
+        elif isinstance(item, dict):
+            extend(item.values())
+        elif isinstance(item, (list, tuple)):
+            extend(item)
+    return False
+
+
+def encode(data):
+    """return (json bytes, whether the payload holds ErrorDetail values)"""
+    if orjson is not None:
+        tracker = _ErrorTracker()
+        try:
+            body = orjson.dumps(data, default=tracker,
+                                option=orjson.OPT_PASSTHROUGH_SUBCLASS | orjson.OPT_NON_STR_KEYS)
+            return body, tracker.found
+        except orjson.JSONEncodeError:
+            # what orjson can't encode but json can, e.g. integers beyond 64 bits; anything
+            # neither can encode raises the same TypeError from the stdlib path below
+            pass
+    body = json.dumps(data, default=_encoder.default, separators=(',', ':')).encode('utf-8')
+    return body, _contains_error(data)
+
 
 class UserRenderer(renderers.JSONRenderer):
     charset = 'utf-8'
 
     def render(self, data, accepted_media_type=None, renderer_context=None):
-        response = ''
-        if 'ErrorDetail' in str(data):
-            response = json.dumps({'errors': data})
-        else:
-            response = json.dumps(data)
-        return response
+        body, has_errors = encode(data)
+        if has_errors:
+            return b'{"errors":' + body + b'}'
+        return body
@@ -0,0 +1,186 @@
+import base64
+import json
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.functional import empty
+from rest_framework_simplejwt.settings import api_settings
+
+DEFAULTS = {
+    'REPLICAS': {},             # alias in DATABASES -> weight
+    'PIN_SECONDS': 10,          # reads stay on the primary this long after a user's write
+    'CACHE_ALIAS': 'default',
+    'KEY_PREFIX': 'db-pin',
+}
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# database the current request reads from, None for the primary
+_read_alias = ContextVar('read_alias', default=None)
+
+
+def replica_settings():
+    return {**DEFAULTS, **getattr(settings, 'DATABASE_REPLICAS', {})}
+
+
+def choose_replica():
+    """a replica alias picked by weight, None without replicas"""
+    replicas = {alias: weight for alias, weight in replica_settings()['REPLICAS'].items() if weight > 0}
+    if not replicas:
+        return None
+    return random.choices(list(replicas), weights=list(replicas.values()))[0]
+
+
+@contextmanager
+def use_replica(alias):
+    """route the reads of the block to `alias`, None meaning the primary"""
+    token = _read_alias.set(alias)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+def use_primary():
+    """read from the primary inside the block, for data that is about to be written back"""
+    return use_replica(None)
+
+
+def _pin_key(user_id):
+    return f'{replica_settings()["KEY_PREFIX"]}:{user_id}'
+
+
+def pin(user_id):
+    """
+    Keep `user_id`'s reads on the primary for PIN_SECONDS, so they see their own
+    writes. Only as reliable as CACHE_ALIAS is shared: a per process cache pins
+    the user in the worker that handled the write alone.
+    """
+    conf = replica_settings()
+    if conf['REPLICAS']:
+        caches[conf['CACHE_ALIAS']].set(_pin_key(user_id), 1, conf['PIN_SECONDS'])
+
+
+async def apin(user_id):
+    conf = replica_settings()
+    if conf['REPLICAS']:
+        await caches[conf['CACHE_ALIAS']].aset(_pin_key(user_id), 1, conf['PIN_SECONDS'])
+
+
+def is_pinned(user_id):
+    return caches[replica_settings()['CACHE_ALIAS']].get(_pin_key(user_id)) is not None
+
+
+async def ais_pinned(user_id):
+    return await caches[replica_settings()['CACHE_ALIAS']].aget(_pin_key(user_id)) is not None
+
+
+def token_user_id(request):
+    """
+    The user id claim of the request's bearer token, without verifying it.
+    Only used to pick a database; the view still authenticates the token, and
+    a forged one can at most send its own reads to the primary.
+    """
+    parts = request.META.get('HTTP_AUTHORIZATION', '').split()
+    if len(parts) != 2 or parts[0] not in api_settings.AUTH_HEADER_TYPES:
+        return None
+    segments = parts[1].split('.')
+    if len(segments) != 3:
+        return None
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(segments[1] + '=' * (-len(segments[1]) % 4)))
+    except ValueError:
+        return None
+    return payload.get(api_settings.USER_ID_CLAIM) if isinstance(payload, dict) else None
+
+
+class ReplicaRouter:
+    """
+    Sends reads to the replica ReplicaMiddleware picked for the request and
+    everything else to the primary. Writes, select_for_update() and
+    get_or_create() style queries always go to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            # related objects are read from wherever their instance came from
+            return None
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, *replica_settings()['REPLICAS']}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas get their schema through replication
+        return False if db in replica_settings()['REPLICAS'] else None
+
+
+class ReplicaMiddleware:
+    """
+    Reads of GET / HEAD / OPTIONS requests go to a replica chosen by weight,
+    unless the user wrote something in the last PIN_SECONDS. Any other method
+    reads from the primary and pins the user.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not replica_settings()['REPLICAS']:
+            return self.get_response(request)
+
+        user_id = token_user_id(request)
+        safe = request.method in SAFE_METHODS
+        alias = choose_replica() if safe and (user_id is None or not is_pinned(user_id)) else None
+        with use_replica(alias):
+            response = self.get_response(request)
+
+        user_id = None if safe else self.writer(request, user_id)
+        if user_id is not None:
+            pin(user_id)
+        return response
+
+    async def __acall__(self, request):
+        if not replica_settings()['REPLICAS']:
+            return await self.get_response(request)
+
+        user_id = token_user_id(request)
+        safe = request.method in SAFE_METHODS
+        alias = choose_replica() if safe and (user_id is None or not await ais_pinned(user_id)) else None
+        with use_replica(alias):
+            response = await self.get_response(request)
+
+        user_id = None if safe else self.writer(request, user_id)
+        if user_id is not None:
+            await apin(user_id)
+        return response
+
+    @staticmethod
+    def writer(request, user_id):
+        """the user a write request was made by, the token's claim unless a view authenticated someone"""
+        # rest framework sets the authenticated user on the django request too. a session user nothing
+        # looked at yet stays unevaluated, loading it is a query, which an async request can't run here
+        user = getattr(request, 'user', None)
+        if getattr(user, '_wrapped', None) is empty:
+            return user_id
+        if user is not None and user.is_authenticated:
+            return user.pk
+        return user_id
@@ -0,0 +1,153 @@
+import hashlib
+import json
+import secrets
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+from rest_framework.response import Response
+
+DEFAULTS = {
+    'CACHE_ALIAS': 'default',
+    'KEY_PREFIX': 'resp',
+    'TIMEOUT': 3600,
+    'LOCAL_TIMEOUT': 5,         # body TIMEOUT of a per process cache, where other workers' bumps don't reach
+}
+
+
+def response_cache_settings():
+    conf = {**DEFAULTS, **getattr(settings, 'RESPONSE_CACHE', {})}
+    # versions always keep TIMEOUT, so ETags don't churn. a worker still on a version another one bumped
+    # rebuilds its bodies after BODY_TIMEOUT, and the ETag is a digest of the body, so it never 304s changed data
+    conf['BODY_TIMEOUT'] = conf['TIMEOUT']
+    if isinstance(caches[conf['CACHE_ALIAS']], LocMemCache):
+        conf['BODY_TIMEOUT'] = min(conf['TIMEOUT'], conf['LOCAL_TIMEOUT'])
+    return conf
+
+
+def _version_key(conf, user_id):
+    return f'{conf["KEY_PREFIX"]}:version:{user_id}'
+
+
+def _body_key(conf, name, user_id, version):
+    return f'{conf["KEY_PREFIX"]}:{name}:{user_id}:{version}'
+
+
+def bump(user_id):
+    """give `user_id` a new version, which retires every response cached for the old one"""
+    conf = response_cache_settings()
+    caches[conf['CACHE_ALIAS']].set(_version_key(conf, user_id), secrets.token_hex(8), conf['TIMEOUT'])
+
+
+def changed(user_id):
+    """
+    Bump now and again after the surrounding transaction commits, so a response
+    built from pre-commit data can't be cached under the version readers see
+    after the commit.
+    """
+    bump(user_id)
+    transaction.on_commit(lambda: bump(user_id))
+
+
+def version(user_id):
+    conf = response_cache_settings()
+    cache = caches[conf['CACHE_ALIAS']]
+    key = _version_key(conf, user_id)
+    current = cache.get(key)
+    if current is None:
+        # evicted or never bumped: start a new version, another worker may win the race
+        cache.add(key, secrets.token_hex(8), conf['TIMEOUT'])
+        current = cache.get(key)
+    return current
+
+
+async def aversion(user_id):
+    conf = response_cache_settings()
+    cache = caches[conf['CACHE_ALIAS']]
+    key = _version_key(conf, user_id)
+    current = await cache.aget(key)
+    if current is None:
+        await cache.aadd(key, secrets.token_hex(8), conf['TIMEOUT'])
+        current = await cache.aget(key)
+    return current
+
+
+def _digest(content):
+    return hashlib.blake2b(content, digest_size=8).hexdigest()
+
+
+def _not_modified(request, etag):
+    tags = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+    return '*' in tags or etag in [tag.removeprefix('W/') for tag in tags]
+
+
+def _finish(response, etag):
+    response['ETag'] = etag
+    # clients revalidate on every use, shared caches must not keep per-user data
+    response['Cache-Control'] = 'private, no-cache'
+    response['Vary'] = 'Authorization'
+    return response
+
+
+def per_user(name):
+    """
+    Cache the successful responses of a DRF `get` per user and version, with a
+    strong ETag made from a digest of the body. A request whose If-None-Match
+    has the current ETag gets a 304 after two cache reads, without running the
+    view while the body is cached.
+    """
+    def decorator(get):
+        @wraps(get)
+        def wrapper(self, request, *args, **kwargs):
+            conf = response_cache_settings()
+            cache = caches[conf['CACHE_ALIAS']]
+            user_id = request.user.pk
+            key = _body_key(conf, name, user_id, version(user_id))
+            cached = cache.get(key)
+            if cached is None:
+                response = get(self, request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+                body = json.dumps(response.data, cls=DjangoJSONEncoder, sort_keys=True).encode()
+                cached = (_digest(body), response.data)
+                cache.set(key, cached, conf['BODY_TIMEOUT'])
+            else:
+                response = Response(data=cached[1])
+            etag = f'"{name}-{user_id}-{cached[0]}"'
+            if _not_modified(request, etag):
+                return _finish(Response(status=304), etag)
+            return _finish(response, etag)
+        return wrapper
+    return decorator
+
+
+def aper_user(name):
+    """per_user for the async views, caching the rendered body"""
+    def decorator(get):
+        @wraps(get)
+        async def wrapper(self, request, *args, **kwargs):
+            conf = response_cache_settings()
+            cache = caches[conf['CACHE_ALIAS']]
+            user_id = request.user.pk
+            key = _body_key(conf, f'{name}-a', user_id, await aversion(user_id))
+            content = await cache.aget(key)
+            if content is None:
+                response = await get(self, request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+                content = response.content
+                await cache.aset(key, content, conf['BODY_TIMEOUT'])
+            else:
+                response = HttpResponse(content, content_type='application/json')
+            # the JSON differs from the DRF renderer's, so the tag must too
+            etag = f'"{name}-{user_id}-{_digest(content)}-a"'
+            if _not_modified(request, etag):
+                return _finish(HttpResponseNotModified(), etag)
+            return _finish(response, etag)
+        return wrapper
+    return decorator
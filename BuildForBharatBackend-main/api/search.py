@@ -0,0 +1,449 @@
+import heapq
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+from datetime import timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connection, connections, transaction
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from . import models
+
+DEFAULTS = {
+    'BACKEND': 'api.search.InMemoryBackend',
+    'LIMIT': 20,
+    'MAX_LIMIT': 100,
+    'MAX_EXPANSIONS': 64,       # indexed words one query word may match
+    'REFRESH_INTERVAL': 5,      # seconds between pulls of rows other processes changed
+    'REBUILD_INTERVAL': 3600,   # seconds between full rebuilds, which drop rows other processes deleted
+}
+
+# words too common to narrow a search down, never indexed
+STOPWORDS = frozenset(['and', 'co', 'company', 'limited', 'llp', 'ltd', 'of', 'private', 'pvt', 'the'])
+WORD_RE = re.compile(r'[a-z0-9]+')
+
+# updated_on is set on save, not on commit: pulls overlap so slow transactions aren't missed
+SYNC_OVERLAP = timedelta(seconds=60)
+
+# matches of one query word never outrank an exact one
+PREFIX_WEIGHT = 0.9
+FUZZY_WEIGHT = 0.8
+# shorter words are too easily one typo away from each other to match fuzzily
+FUZZY_MIN_LENGTH = 4
+ALPHABET = 'abcdefghijklmnopqrstuvwxyz0123456789'
+
+_backend = {}
+
+
+def search_settings():
+    return {**DEFAULTS, **getattr(settings, 'SEARCH', {})}
+
+
+@receiver(setting_changed)
+def _reset_backend(setting, **kwargs):
+    if setting == 'SEARCH':
+        _backend.clear()
+
+
+def get_backend():
+    """the configured backend, one instance per process"""
+    backend = _backend.get('value')
+    if backend is None:
+        conf = search_settings()
+        backend = _backend.setdefault('value', import_string(conf['BACKEND'])(conf))
+    return backend
+
+
+def words(text):
+    """lowercase ASCII words of `text`, accents folded and stopwords dropped"""
+    text = unicodedata.normalize('NFKD', text or '').encode('ascii', 'ignore').decode().lower()
+    return [word for word in WORD_RE.findall(text) if word not in STOPWORDS]
+
+
+def typos(word):
+    """every string one substituted, inserted, deleted or swapped character away from `word`"""
+    splits = [(word[:i], word[i:]) for i in range(len(word) + 1)]
+    variants = {head + tail[1:] for head, tail in splits if tail}
+    variants.update(head + tail[1] + tail[0] + tail[2:] for head, tail in splits if len(tail) > 1)
+    variants.update(head + char + tail[1:] for head, tail in splits if tail for char in ALPHABET)
+    variants.update(head + char + tail for head, tail in splits for char in ALPHABET)
+    variants.discard(word)
+    return variants
+
+
+class WordIndex:
+    """
+    In-memory word index. Each distinct word maps to the set of documents that
+    contain it, and the vocabulary is kept sorted for prefix matches. A
+    misspelt word is matched by looking up each of its few hundred one-typo
+    variants, so matching a query word never scans the vocabulary, and
+    combining query words is set algebra done in C.
+    """
+
+    def __init__(self):
+        self.postings = {}          # word -> set of document ids
+        self.documents = {}         # document id -> tuple of its words
+        self.vocabulary = []        # sorted words
+
+    @classmethod
+    def build(cls, documents):
+        """index an iterable of (document id, words) in one go"""
+        index = cls()
+        postings = index.postings
+        interned = {}
+        for document, document_words in documents:
+            document_words = tuple({interned.setdefault(word, word): None for word in document_words})
+            index.documents[document] = document_words
+            for word in document_words:
+                postings.setdefault(word, set()).add(document)
+        index.vocabulary = sorted(postings)
+        return index
+
+    def __len__(self):
+        return len(self.documents)
+
+    def add(self, document, document_words):
+        """index or re-index a document"""
+        self.remove(document)
+        document_words = tuple(dict.fromkeys(document_words))
+        if not document_words:
+            return
+        self.documents[document] = document_words
+        for word in document_words:
+            if word not in self.postings:
+                self.postings[word] = set()
+                insort(self.vocabulary, word)
+            self.postings[word].add(document)
+
+    def remove(self, document):
+        for word in self.documents.pop(document, ()):
+            documents = self.postings[word]
+            documents.discard(document)
+            if not documents:
+                del self.postings[word]
+                del self.vocabulary[bisect_left(self.vocabulary, word)]
+
+    def _starting_with(self, prefix, limit):
+        """up to `limit` indexed words starting with `prefix`, and whether there are more"""
+        start = bisect_left(self.vocabulary, prefix)
+        found = []
+        for word in self.vocabulary[start:start + limit + 1]:
+            if not word.startswith(prefix):
+                return found, False
+            found.append(word)
+        return found[:limit], len(found) > limit
+
+    def expand(self, word, prefix, limit):
+        """
+        ([(score, documents)], complete) for the indexed words `word` matches,
+        best first. `complete` is False when it matches more than `limit` words.
+        """
+        scores = {}
+        more = False
+        if word in self.postings:
+            scores[word] = 1.0
+        if prefix:
+            # bounded, a short prefix would otherwise walk a sizeable part of the vocabulary
+            candidates, more = self._starting_with(word, limit * 8)
+            for candidate in candidates:
+                scores.setdefault(candidate, prefix_score(word, candidate))
+        # misspellings are only looked for when the word as typed matches nothing
+        if not scores and len(word) >= FUZZY_MIN_LENGTH:
+            score = FUZZY_WEIGHT * (1 - 1 / len(word))
+            # a deleted character widens a prefix the most, those variants come last
+            for variant in sorted(typos(word), key=len, reverse=True):
+                if prefix:
+                    candidates, more_variant = self._starting_with(variant, min(limit, limit * 8 - len(scores)))
+                    scores.update(dict.fromkeys(candidates, score))
+                    more = more or more_variant
+                    if len(scores) >= limit * 8:
+                        break
+                elif variant in self.postings:
+                    scores[variant] = score
+        best = heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], len(self.postings[item[0]])))
+        return [(score, self.postings[candidate]) for candidate, score in best], not more and len(scores) <= limit
+
+    def search(self, query_words, limit=20, max_expansions=64):
+        """
+        [(document id, score)] best first. Every query word has to match, the last
+        one as a prefix too since it is usually still being typed. A document
+        scores the sum of its best match for each query word.
+        """
+        expansions = {}
+        results = self._search(query_words, limit, max_expansions, expansions)
+        if not results and len(query_words) > 1 and any(word.startswith(query_words[-1]) for word in STOPWORDS):
+            # "sharma traders priv": the last word is more likely an unindexed stopword being typed
+            results = self._search(query_words[:-1], limit, max_expansions, expansions)
+        return results
+
+    def _search(self, query_words, limit, max_expansions, expansions):
+        if not query_words:
+            return []
+        expanded = []
+        for position, word in enumerate(query_words):
+            key = (word, position == len(query_words) - 1)
+            if key not in expansions:
+                expansions[key] = self.expand(*key, max_expansions)
+            matches, complete = expansions[key]
+            if not matches:
+                return []
+            expanded.append(matches)
+        # drive from the query word matching the fewest documents, the others only filter and score
+        sizes = [sum(len(documents) for _, documents in matches) for matches in expanded]
+        prefix = query_words[-1]
+        start = bisect_left(self.vocabulary, prefix)
+        if (len(expanded) > 1 and start < len(self.vocabulary) and self.vocabulary[start].startswith(prefix)
+                and (not complete or sizes[-1] > min(sizes[:-1]))):
+            # a prefix that can't drive is checked against the documents the other words found,
+            # rather than unioning every word it starts
+            expanded.pop()
+            sizes.pop()
+        else:
+            prefix = None
+        expanded = [matches for _, matches in sorted(zip(sizes, expanded), key=lambda item: item[0])]
+        driver, others = expanded[0], expanded[1:]
+        other_documents = [matches[0][1] if len(matches) == 1 else set().union(*(documents for _, documents in matches))
+                           for matches in others]
+        best_others = sum(matches[0][0] for matches in others) + (prefix is not None)
+
+        scores = {}
+        for score, documents in driver:
+            if len(scores) >= limit and score + best_others <= heapq.nlargest(limit, scores.values())[-1]:
+                break
+            candidates = documents.intersection(*other_documents) if other_documents else set(documents)
+            candidates.difference_update(scores)
+            # with no other word to tell them apart, the first `limit` of the best matches will do
+            enough = None if others else limit
+            if prefix is not None:
+                totals = {document: score + extra
+                          for document, extra in self._match_prefix(prefix, candidates, enough).items()}
+            else:
+                if enough is not None and len(candidates) > enough:
+                    candidates = set(islice(candidates, enough))
+                totals = dict.fromkeys(candidates, score)
+            for matches in others:
+                unscored = set(totals)
+                for other_score, other in matches:
+                    hits = unscored.intersection(other)
+                    for document in hits:
+                        totals[document] += other_score
+                    unscored -= hits
+                    if not unscored:
+                        break
+            scores.update(totals)
+        return heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], -item[0]))
+
+    def _match_prefix(self, prefix, candidates, enough=None):
+        """
+        {document: score} of the candidates with a word starting with `prefix`.
+        With `enough`, stops once that many are found, best scored first.
+        """
+        start = bisect_left(self.vocabulary, prefix)
+        end = bisect_left(self.vocabulary, prefix + '\x7f', start)
+        matched = {}
+        if end - start < len(candidates):
+            # fewer words than candidates: intersect each word's documents, the best scored words first
+            for word in sorted(self.vocabulary[start:end], key=len):
+                hits = candidates.intersection(self.postings[word])
+                if hits:
+                    score = prefix_score(prefix, word)
+                    for document in hits:
+                        matched.setdefault(document, score)
+                    if enough is not None and len(matched) >= enough:
+                        break
+        else:
+            for document in candidates:
+                best = max((prefix_score(prefix, word) for word in self.documents[document]
+                            if word.startswith(prefix)), default=None)
+                if best is not None:
+                    matched[document] = best
+        return matched
+
+
+def prefix_score(prefix, word):
+    return 1.0 if prefix == word else PREFIX_WEIGHT * (0.5 + 0.5 * len(prefix) / len(word))
+
+
+def documents(user_ids=None):
+    """(user id, words) of the searchable names of the given users, or of everybody"""
+    gst = models.SellerGST.objects.values_list('user_id', 'trade_name', 'legal_name')
+    business = models.Business.objects.values_list('user_id', 'name', 'store_name')
+    if user_ids is None:
+        batches = [(gst, business)]
+        names = {}
+    else:
+        user_ids = list(user_ids)
+        batches = [(gst.filter(user_id__in=user_ids[i:i + 1000]), business.filter(user_id__in=user_ids[i:i + 1000]))
+                   for i in range(0, len(user_ids), 1000)]
+        # users without any row left are yielded too, with no words
+        names = {user_id: [] for user_id in user_ids}
+    for querysets in batches:
+        for queryset in querysets:
+            for user_id, *fields in queryset.iterator(chunk_size=5000):
+                names.setdefault(user_id, []).extend(fields)
+    for user_id, fields in names.items():
+        yield user_id, words(' '.join(field for field in fields if field))
+
+
+class SearchBackend:
+    """finds sellers by name, see `search_sellers`"""
+
+    def __init__(self, conf):
+        self.conf = conf
+
+    def search(self, query, limit):
+        """[(user id, score)], best first"""
+        raise NotImplementedError
+
+    def changed(self, user_id):
+        """the names of `user_id` changed in this process, called after commit"""
+
+
+class InMemoryBackend(SearchBackend):
+    """
+    In-process WordIndex, built from the database on the first search.
+    Changes made by this process are applied through `changed`, those of other
+    processes are pulled by `updated_on` at most every REFRESH_INTERVAL
+    seconds. Rows deleted elsewhere are skipped when results are loaded and
+    dropped by the periodic rebuild, which runs on a background thread while
+    searches keep using the current index.
+    """
+
+    def __init__(self, conf):
+        super().__init__(conf)
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._index = None
+        self._rebuilding = False
+        self._pending = set()
+        self._built_at = self._refreshed_at = self._synced_at = None
+
+    def _changed_since(self, since):
+        user_ids = set()
+        for model in (models.SellerGST, models.Business):
+            user_ids.update(model.objects.filter(updated_on__gte=since).values_list('user_id', flat=True))
+        return user_ids
+
+    def _build(self):
+        """build a new index without holding the lock, then swap it in"""
+        synced_at = timezone.now() - SYNC_OVERLAP
+        index = WordIndex.build(documents())
+        now = time.monotonic()
+        with self._lock:
+            # a first build pulls nothing yet, a rebuild catches up on what changed while it ran
+            first = self._index is None
+            self._index, self._synced_at, self._built_at = index, synced_at, now
+            self._refreshed_at = now if first else None
+
+    def _rebuild(self):
+        try:
+            self._build()
+        finally:
+            self._rebuilding = False
+            connections.close_all()
+
+    def index(self):
+        if self._index is None:
+            # nothing to search yet: the first caller builds, the others wait for it
+            with self._build_lock:
+                if self._index is None:
+                    self._build()
+        now = time.monotonic()
+        with self._lock:
+            if now - self._built_at > self.conf['REBUILD_INTERVAL'] and not self._rebuilding:
+                self._rebuilding = True
+                threading.Thread(target=self._rebuild, name='search-rebuild', daemon=True).start()
+            stale = self._refreshed_at is None or now - self._refreshed_at > self.conf['REFRESH_INTERVAL']
+            if stale or self._pending:
+                if stale:
+                    since, self._synced_at = self._synced_at, timezone.now() - SYNC_OVERLAP
+                    self._pending.update(self._changed_since(since))
+                    self._refreshed_at = now
+                pending, self._pending = self._pending, set()
+                for user_id, document_words in documents(pending):
+                    self._index.add(user_id, document_words)
+            return self._index
+
+    def search(self, query, limit):
+        return self.index().search(words(query), limit, self.conf['MAX_EXPANSIONS'])
+
+    def changed(self, user_id):
+        # applied by the next search, one query for however many changes piled up
+        with self._lock:
+            if self._index is not None:
+                self._pending.add(user_id)
+
+
+class MySQLFullTextBackend(SearchBackend):
+    """
+    InnoDB FULLTEXT indexes, for when the sellers outgrow each worker's memory.
+    Words and prefixes match in BOOLEAN MODE; when that finds too little, any
+    word matching in NATURAL LANGUAGE MODE counts too. MySQL has no typo
+    tolerance, so misspellings only match through the other words of the query.
+    Create the indexes with `manage.py setup_search`.
+    """
+    indexes = (
+        (models.SellerGST, 'search_names', ('trade_name', 'legal_name')),
+        (models.Business, 'search_names', ('name', 'store_name')),
+    )
+
+    def setup(self):
+        with connection.cursor() as cursor:
+            for model, name, columns in self.indexes:
+                cursor.execute(f'CREATE FULLTEXT INDEX {name} ON {model._meta.db_table} ({", ".join(columns)})')
+
+    def _query(self, cursor, against, mode, limit):
+        selects = ' UNION ALL '.join(
+            f'SELECT user_id, MATCH ({", ".join(columns)}) AGAINST (%s IN {mode}) AS score '
+            f'FROM {model._meta.db_table} WHERE MATCH ({", ".join(columns)}) AGAINST (%s IN {mode})'
+            for model, _, columns in self.indexes)
+        cursor.execute(f'SELECT user_id, SUM(score) AS total FROM ({selects}) AS matches '
+                       f'GROUP BY user_id ORDER BY total DESC, user_id LIMIT %s',
+                       [against] * 2 * len(self.indexes) + [limit])
+        return cursor.fetchall()
+
+    def search(self, query, limit):
+        query_words = words(query)
+        if not query_words:
+            return []
+        # all words required, the last one is still being typed
+        required = ' '.join(f'+{word}' for word in query_words[:-1]) + f' +{query_words[-1]}*'
+        with connection.cursor() as cursor:
+            results = self._query(cursor, required.strip(), 'BOOLEAN MODE', limit)
+            if len(results) < limit:
+                found = {user_id for user_id, _ in results}
+                # scaled below every required match
+                results += [(user_id, score / 1000) for user_id, score in
+                            self._query(cursor, ' '.join(query_words), 'NATURAL LANGUAGE MODE', limit)
+                            if user_id not in found][:limit - len(results)]
+        return [(user_id, float(score)) for user_id, score in results]
+
+
+def changed(user_id):
+    """tell the search backend the names of `user_id` changed, once the transaction commits"""
+    transaction.on_commit(lambda: get_backend().changed(user_id))
+
+
+def search_sellers(query, limit=None):
+    """ranked sellers whose trade, legal, business or store name matches `query`"""
+    conf = search_settings()
+    limit = min(limit or conf['LIMIT'], conf['MAX_LIMIT'])
+    ranked = get_backend().search(query, limit)
+    if not ranked:
+        return []
+    rows = {row['id']: row for row in models.User.objects.filter(id__in=[user_id for user_id, _ in ranked]).values(
+        'id', 'user_gst__seller_id', 'user_gst__trade_name', 'user_gst__legal_name', 'user_business__name',
+        'user_business__store_name')}
+    # a user deleted by another process may still be in this one's index
+    return [{'user_id': user_id, 'seller_id': rows[user_id]['user_gst__seller_id'],
+             'trade_name': rows[user_id]['user_gst__trade_name'], 'legal_name': rows[user_id]['user_gst__legal_name'],
+             'business_name': rows[user_id]['user_business__name'],
+             'store_name': rows[user_id]['user_business__store_name'], 'score': round(score, 4)}
+            for user_id, score in ranked if user_id in rows]
@@ -0,0 +1,125 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import OperationalError, connection, connections, transaction
+from django.db.models import F
+
+DEFAULTS = {
+    'SEQUENCE': 'seller_id',
+    'BLOCK_SIZE': 100,          # ids reserved per database round trip
+    'LENGTH': 10,               # characters before the `U<user id>` suffix
+    'MULTIPLIER': 2760343847,   # scrambles consecutive numbers, must not be divisible by 2 or 3
+    'OFFSET': 1191266519357,
+    'RETRIES': 5,
+}
+
+ALPHABET = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def seller_id_settings():
+    return {**DEFAULTS, **getattr(settings, 'SELLER_IDS', {})}
+
+
+def encode(number, length):
+    """
+    Bijective map of 0 <= number < 36**length to `length` uppercase alphanumerics.
+    An affine permutation modulo 36**length, so consecutive sequence values don't
+    look consecutive, then base 36.
+    """
+    conf = seller_id_settings()
+    space = len(ALPHABET) ** length
+    if not 0 <= number < space:
+        raise ValueError(f'{number} does not fit in {length} characters')
+    number = (number * conf['MULTIPLIER'] + conf['OFFSET']) % space
+    chars = []
+    for _ in range(length):
+        number, digit = divmod(number, len(ALPHABET))
+        chars.append(ALPHABET[digit])
+    return ''.join(reversed(chars))
+
+
+def reserve_block(name, size):
+    """atomically take the next `size` values of sequence `name`, returns (start, end)"""
+    from .models import IdSequence
+
+    retries = seller_id_settings()['RETRIES']
+    for attempt in range(retries):
+        try:
+            with transaction.atomic():
+                sequence, _ = IdSequence.objects.select_for_update().get_or_create(name=name)
+                IdSequence.objects.filter(pk=name).update(next_value=F('next_value') + size)
+            return sequence.next_value, sequence.next_value + size
+        except OperationalError:
+            # lock wait timeout or deadlock with another worker reserving at the same time
+            if attempt == retries - 1:
+                raise
+            time.sleep(0.01 * 2 ** attempt)
+
+
+def _reserve_in_worker(name, size):
+    try:
+        return reserve_block(name, size)
+    finally:
+        connections.close_all()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='id-sequence')
+        return _executor
+
+
+class BlockAllocator:
+    """
+    Hands out the values of a database sequence from blocks reserved per process,
+    so only one in BLOCK_SIZE calls reaches the database. Values are unique across
+    processes; the unused rest of a block is skipped when a process exits.
+    """
+
+    def __init__(self, name, block_size):
+        self.name = name
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._next = self._end = 0
+        os.register_at_fork(after_in_child=self.reset)
+
+    def reset(self):
+        # a forked worker must not hand out its parent's block
+        self._lock = threading.Lock()
+        self._next = self._end = 0
+
+    def reserve(self):
+        if connection.in_atomic_block:
+            if getattr(connection, 'single_writer', False):
+                # a second connection would wait for the caller's write lock: take just the
+                # value being allocated, which commits or rolls back with the row using it
+                return reserve_block(self.name, 1)
+            # the reservation has to commit even if the caller's transaction rolls back,
+            # so it runs on its own connection
+            return get_executor().submit(_reserve_in_worker, self.name, self.block_size).result()
+        return reserve_block(self.name, self.block_size)
+
+    def allocate(self):
+        with self._lock:
+            if self._next >= self._end:
+                self._next, self._end = self.reserve()
+            value = self._next
+            self._next += 1
+            return value
+
+
+_conf = seller_id_settings()
+allocator = BlockAllocator(_conf['SEQUENCE'], _conf['BLOCK_SIZE'])
+
+
+def next_seller_id(user_id):
+    """a new seller id, `LENGTH` scrambled characters followed by `U<user id>`"""
+    return f'{encode(allocator.allocate(), seller_id_settings()["LENGTH"])}U{user_id}'
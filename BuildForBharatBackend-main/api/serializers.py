@@ -1,5 +1,10 @@
+from django.db import transaction
+
+from . import ifsc
 from . import models
+from . import otp as otp_store
 from rest_framework import serializers
+from .imaging import variant_urls
 from .mailservice import SendMail
 
 mail = SendMail()
@@ -14,17 +19,17 @@ class UserRegisterSerializer(serializers.ModelSerializer):
         print('attrs: ', attrs)
         return attrs
 
+    @transaction.atomic
     def create(self, validated_data):
         user = models.User.objects.create_user(
             name=validated_data['name'],
             email=validated_data['email'].lower(),
             contact_number=validated_data['contact_number'],
             password=validated_data['password'],
+            encoded_password=validated_data.get('encoded_password'),
         )
         models.UserDetails.objects.create(user_id=user.id)
-        otp = mail.generate_otp()
-        models.OTPVerification.objects.create(user_id=user.id, email_id=user.email, phone_number=user.contact_number,
-                                              otp=otp)
+        otp = otp_store.issue('email', user.id)
         mail.send_otp(user, otp, "email")
         return user
 
@@ -49,15 +54,15 @@ class UserSerializer(serializers.ModelSerializer):
 
     @staticmethod
     def get_email_verified(instance):
-        return instance.user_details.email_verified
+        return hasattr(instance, 'user_details') and instance.user_details.email_verified
 
     @staticmethod
     def get_phone_verified(instance):
-        return instance.user_details.phone_number_verified
+        return hasattr(instance, 'user_details') and instance.user_details.phone_number_verified
 
     @staticmethod
     def get_is_seller(instance):
-        return instance.user_details.is_seller
+        return hasattr(instance, 'user_details') and instance.user_details.is_seller
 
     class Meta:
         model = models.User
@@ -65,13 +70,24 @@ class UserSerializer(serializers.ModelSerializer):
 
 
 class SellerGSTDetailsSerializer(serializers.ModelSerializer):
+    certificate_variants = serializers.SerializerMethodField(method_name='get_certificate_variants')
+
+    @staticmethod
+    def get_certificate_variants(instance):
+        return variant_urls(instance.certificate)
+
     class Meta:
         model = models.SellerGST
-        fields = ['id', 'seller_id', 'certificate', 'trade_name', 'gst_number', 'gst_type', 'legal_name',
-                  'business_address', 'gst_verified']
+        fields = ['id', 'seller_id', 'certificate', 'certificate_variants', 'trade_name', 'gst_number', 'gst_type',
+                  'legal_name', 'business_address', 'gst_verified']
 
 
 class BusinessSerializer(serializers.ModelSerializer):
+    profile_pic_variants = serializers.SerializerMethodField(method_name='get_profile_pic_variants')
+
+    @staticmethod
+    def get_profile_pic_variants(instance):
+        return variant_urls(instance.profile_pic)
 
     def to_representation(self, instance):
         response = super().to_representation(instance)
@@ -80,10 +96,20 @@ class BusinessSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = models.Business
-        fields = ['name', 'store_name', 'address', 'email_address', 'phone_number', 'shipping_method', ]
+        fields = ['name', 'store_name', 'address', 'email_address', 'phone_number', 'shipping_method',
+                  'profile_pic_variants', ]
 
 
 class BankDetailsSerializer(serializers.ModelSerializer):
+
+    def to_representation(self, instance):
+        response = super().to_representation(instance)
+        branch = ifsc.lookup(instance.ifsc) or {}
+        response['bank_name'] = branch.get('bank')
+        response['branch'] = branch.get('branch')
+        response['city'] = branch.get('city')
+        return response
+
     class Meta:
         model = models.BanksDetails
         fields = ['acc_holder_name', 'acc_number', 'ifsc']
@@ -0,0 +1,119 @@
+from django.core.files import File
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
+from django.dispatch import receiver
+
+from . import models
+from . import profiling
+from . import replicas
+from . import responsecache
+from . import search
+from .authentication import invalidate_user
+from .readmodel import schedule_rebuild
+from .storage import release, stored_file_fields
+
+
+def user_changed(user_id):
+    """
+    Drop everything cached for `user_id`. Runs immediately and again after the
+    surrounding transaction commits, so a concurrent reader can't re-cache the
+    pre-commit row.
+    """
+    invalidate_user(user_id)
+    transaction.on_commit(lambda: invalidate_user(user_id))
+    profile_changed(user_id)
+
+
+def profile_changed(user_id):
+    """
+    Refresh the denormalized seller profile, the search entry and the cached
+    responses of `user_id`, and keep the user's reads on the primary until
+    replicas have the change.
+    """
+    replicas.pin(user_id)
+    schedule_rebuild(user_id)
+    search.changed(user_id)
+    # after schedule_rebuild, so the post-commit bump runs once the snapshot is rebuilt
+    responsecache.changed(user_id)
+
+
+@receiver([post_save, post_delete], sender=models.User)
+def user_saved(sender, instance, **kwargs):
+    if kwargs.get('signal') is post_delete:
+        invalidate_user(instance.pk)
+    elif set(kwargs.get('update_fields') or ()) == {'last_login'}:
+        # every login touches last_login, which no cached representation includes
+        return
+    else:
+        user_changed(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=models.UserDetails)
+def user_details_saved(sender, instance, **kwargs):
+    user_changed(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=models.SellerGST)
+@receiver([post_save, post_delete], sender=models.Business)
+def seller_profile_saved(sender, instance, **kwargs):
+    profile_changed(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=models.BanksDetails)
+def bank_details_saved(sender, instance, **kwargs):
+    if models.BanksDetails.business.is_cached(instance):
+        user_id = instance.business.user_id
+    else:
+        user_id = models.Business.objects.filter(pk=instance.business_id).values_list('user_id', flat=True).first()
+    if user_id is not None:
+        profile_changed(user_id)
+
+
+def _stored_names(instance):
+    # read the raw attribute: going through the descriptor would load deferred fields
+    names = {}
+    for field in stored_file_fields(type(instance)):
+        value = instance.__dict__.get(field)
+        names[field] = getattr(value, 'name', value)
+    return names
+
+
+@receiver(post_init, sender=models.SellerGST)
+@receiver(post_init, sender=models.Business)
+def remember_stored_files(sender, instance, **kwargs):
+    # the blob names as loaded, so a save that replaces a file can release the old one
+    instance._stored_files = _stored_names(instance)
+
+
+@receiver(pre_save, sender=models.SellerGST)
+@receiver(pre_save, sender=models.Business)
+def note_new_files(sender, instance, **kwargs):
+    # fields about to store a new upload, even if it hashes to the blob already referenced
+    instance._new_files = set()
+    for field in stored_file_fields(sender):
+        value = instance.__dict__.get(field)
+        if isinstance(value, File) and not getattr(value, '_committed', False):
+            instance._new_files.add(field)
+
+
+@receiver(post_save, sender=models.SellerGST)
+@receiver(post_save, sender=models.Business)
+def release_replaced_files(sender, instance, **kwargs):
+    current = _stored_names(instance)
+    for field, name in instance._stored_files.items():
+        if name and (name != current[field] or field in instance._new_files):
+            transaction.on_commit(lambda name=name: release(name))
+    instance._stored_files = current
+
+
+@receiver(post_delete, sender=models.SellerGST)
+@receiver(post_delete, sender=models.Business)
+def release_deleted_files(sender, instance, **kwargs):
+    for name in _stored_names(instance).values():
+        if name:
+            transaction.on_commit(lambda name=name: release(name))
+
+
+@receiver(post_delete, sender=models.RequestProfile)
+def delete_profile_files(sender, instance, **kwargs):
+    transaction.on_commit(lambda: profiling.delete_files(instance))
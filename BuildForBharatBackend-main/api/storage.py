@@ -0,0 +1,185 @@
+import hashlib
+import os
+import tempfile
+from collections import Counter
+from functools import lru_cache
+
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage, default_storage, storages
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+from django.db import transaction
+from django.db.models import F, FileField
+from django.utils import timezone
+
+CHUNK_SIZE = 64 * 1024
+
+
+class HashingUploadMixin:
+    """hash uploads as their chunks arrive, the digest ends up on `file.content_sha256`"""
+
+    def new_file(self, *args, **kwargs):
+        # before super(): the memory handler ends new_file by raising StopFutureHandlers
+        self._sha256 = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        self._sha256.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        if file is not None:
+            file.content_sha256 = self._sha256.hexdigest()
+        return file
+
+
+class HashingMemoryFileUploadHandler(HashingUploadMixin, MemoryFileUploadHandler):
+    pass
+
+
+class HashingTemporaryFileUploadHandler(HashingUploadMixin, TemporaryFileUploadHandler):
+    pass
+
+
+def upload_storage():
+    """storage of the gst certificate and business picture fields, see STORAGES['uploads']"""
+    return storages['uploads']
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Stores every upload once, as `<prefix>/ab/cd/<sha256><ext>`. Saving identical
+    bytes again returns the existing name and bumps the blob's reference count
+    in `MediaBlob`. References are dropped by the model signals when a row stops
+    pointing at a blob (api/signals.py), so `delete` does nothing; unreferenced
+    blobs are removed by `manage.py gc_media`.
+    """
+
+    def __init__(self, prefix='cas', **kwargs):
+        super().__init__(**kwargs)
+        self.prefix = prefix
+
+    def get_available_name(self, name, max_length=None):
+        # the final name is chosen by _save from the content
+        return name
+
+    def blob_name(self, digest, name):
+        _, ext = os.path.splitext(name)
+        return f'{self.prefix}/{digest[:2]}/{digest[2:4]}/{digest}{ext.lower()}'
+
+    def _save(self, name, content):
+        from .models import MediaBlob
+
+        digest = getattr(content, 'content_sha256', None)
+        temporary_path = None
+        if digest is None or not hasattr(content, 'temporary_file_path'):
+            temporary_path, digest = self._spool(content, digest)
+        final_name = self.blob_name(digest, name)
+        final_path = self.path(final_name)
+
+        # reference first: while a blob row is locked by gc_media this waits, so
+        # the file below can't be unlinked after being written
+        with transaction.atomic():
+            blob, created = MediaBlob.objects.select_for_update().get_or_create(
+                name=final_name, defaults={'digest': digest, 'size': content.size, 'refcount': 0})
+            MediaBlob.objects.filter(pk=blob.pk).update(refcount=F('refcount') + 1, updated_on=timezone.now())
+
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        if os.path.exists(final_path):
+            # already stored, the new copy is simply dropped
+            if temporary_path:
+                os.unlink(temporary_path)
+        elif temporary_path:
+            os.replace(temporary_path, final_path)
+        else:
+            # the upload handler already streamed it to disk, so it is moved rather than copied
+            file_move_safe(content.temporary_file_path(), final_path, allow_overwrite=True)
+        if self.file_permissions_mode is not None:
+            os.chmod(final_path, self.file_permissions_mode)
+        return final_name
+
+    def _spool(self, content, digest):
+        """copy `content` next to its final location in one pass, hashing it on the way"""
+        directory = self.path(self.prefix)
+        os.makedirs(directory, exist_ok=True)
+        sha256 = hashlib.sha256()
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        with tempfile.NamedTemporaryFile(dir=directory, prefix='.upload-', delete=False) as spool:
+            for chunk in content.chunks(CHUNK_SIZE):
+                sha256.update(chunk)
+                spool.write(chunk)
+        return spool.name, digest or sha256.hexdigest()
+
+    def delete(self, name):
+        # FieldFile.delete() is followed by the save that releases the reference, doing it
+        # here too would count it twice
+        pass
+
+
+def release(name):
+    """drop one reference to a stored blob"""
+    from .models import MediaBlob
+
+    if name:
+        MediaBlob.objects.filter(name=name, refcount__gt=0).update(refcount=F('refcount') - 1,
+                                                                   updated_on=timezone.now())
+
+
+def collect_garbage(storage, older_than):
+    """
+    Remove blobs (and their image variants) that no field references any more and
+    that were last touched before `older_than`, along with spool files left by
+    interrupted saves. Returns the removed blob names.
+    """
+    from .imaging import image_settings, variant_name
+    from .models import MediaBlob
+
+    removed = []
+    candidates = MediaBlob.objects.filter(refcount__lte=0, updated_on__lt=older_than).values_list('pk', flat=True)
+    for pk in list(candidates):
+        with transaction.atomic():
+            blob = MediaBlob.objects.select_for_update().filter(pk=pk, refcount__lte=0).first()
+            if blob is None:
+                continue
+            FileSystemStorage.delete(storage, blob.name)
+            for variant in image_settings()['SIZES']:
+                default_storage.delete(variant_name(blob.name, variant))
+            blob.delete()
+        removed.append(blob.name)
+
+    spool_dir = storage.path(storage.prefix)
+    if os.path.isdir(spool_dir):
+        cutoff = older_than.timestamp()
+        for entry in os.scandir(spool_dir):
+            if entry.name.startswith('.upload-') and entry.stat().st_mtime < cutoff:
+                os.unlink(entry.path)
+    return removed
+
+
+@lru_cache(maxsize=None)
+def stored_file_fields(model):
+    """names of the file fields of `model` kept in a ContentAddressedStorage"""
+    return [field.name for field in model._meta.get_fields()
+            if isinstance(field, FileField) and isinstance(field.storage, ContentAddressedStorage)]
+
+
+def recount(models_and_fields):
+    """
+    Recompute every blob's reference count from the rows that point at it, for
+    blobs leaked by rolled back requests or crashed processes. Returns the number
+    of blobs whose count changed.
+    """
+    from .models import MediaBlob
+
+    counts = Counter()
+    for model, fields in models_and_fields:
+        for field in fields:
+            names = model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+            counts.update(names.values_list(field, flat=True).iterator())
+    changed = 0
+    for blob in MediaBlob.objects.only('id', 'name', 'refcount').iterator():
+        if blob.refcount != counts[blob.name]:
+            MediaBlob.objects.filter(pk=blob.pk).update(refcount=counts[blob.name], updated_on=timezone.now())
+            changed += 1
+    return changed
@@ -1,3 +1,1358 @@
-from django.test import TestCase
+import io
+import json
+import os
+import pstats
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.core import mail as django_mail
+from django.core.cache import cache, caches
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.apps import apps
+from django.db import connection, connections, transaction
+from django.db.utils import load_backend
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django.test import AsyncClient
+from rest_framework.exceptions import ErrorDetail
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+from . import (authentication, bulkimport, gstin, ifsc, imaging, media, metrics, models, otp, outbox,
+               profiling, readmodel, renderers, replicas, responsecache, search, sellerids, throttling, tokens)
+from .db import pool as db_pool
+from .loadtest import fake_gstin
+from .mailservice import SendMail
+from .queryinspector import query_budget, query_shape, record_queries
+from .registry import Registry
+from .renderers import UserRenderer
+from .storage import collect_garbage, recount, upload_storage
+from .urls import query_budgets
+from .views import get_tokens_for_user
+
+
+def create_user(**fields):
+    """the user most tests act as, `fields` override or add to its defaults, with its seller profile built"""
+    with TestCase.captureOnCommitCallbacks(execute=True):
+        return models.User.objects.create_user(**{'name': 'Test User', 'email': 'test@example.com',
+                                                  'contact_number': '9876543210', **fields})
+
+
+def authenticated_client(user):
+    """an APIClient sending `user`'s access token"""
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {get_tokens_for_user(user)["access"]}')
+    return client
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class EmailOutboxTests(TestCase):
+
+    def setUp(self):
+        self.user = create_user(password='secret-pass')
+
+    def test_send_otp_is_queued_not_sent(self):
+        SendMail.send_otp(self.user, '12345', 'email')
+        self.assertEqual(len(django_mail.outbox), 0)
+        self.assertEqual(outbox.queue_depth(), 1)
+
+    def test_drain_delivers_over_one_connection(self):
+        SendMail.send_otp(self.user, '12345', 'email')
+        SendMail.send_otp(self.user, '54321', 'gst')
+        with mock.patch('api.outbox.get_connection', wraps=outbox.get_connection) as get_connection:
+            self.assertEqual(outbox.drain(), 2)
+        self.assertEqual(get_connection.call_count, 1)
+        self.assertEqual(len(django_mail.outbox), 2)
+        self.assertEqual(outbox.queue_depth(), 0)
+        self.assertIn('12345', django_mail.outbox[0].body)
+
+    def test_failed_delivery_is_retried_with_backoff(self):
+        entry = SendMail.send_otp(self.user, '12345', 'email')
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=OSError):
+            self.assertEqual(outbox.drain(), 0)
+        entry.refresh_from_db()
+        self.assertEqual(entry.status, models.EmailOutbox.STATUS_PENDING)
+        self.assertEqual(entry.attempts, 1)
+        self.assertGreater(entry.next_attempt_on, entry.created_on)
+        # not due yet
+        self.assertEqual(outbox.drain(), 0)
+
+    def test_failed_send_schedules_a_retry(self):
+        SendMail.send_otp(self.user, '12345', 'email')
+        self.addCleanup(outbox.wait)
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=OSError), \
+                mock.patch.object(outbox, 'connections'):
+            outbox._queued += 1
+            outbox._run_worker()
+        # without anything else enqueued, the worker comes back when the email is due
+        timer = outbox._retry_timer
+        self.assertIsNotNone(timer)
+        self.assertTrue(20 < timer.interval <= 36)
+        with mock.patch.object(outbox, 'dispatch') as dispatch:
+            timer.function()
+        dispatch.assert_called_once()
+
+    @override_settings(EMAIL_OUTBOX={'MAX_ATTEMPTS': 1})
+    def test_gives_up_after_max_attempts(self):
+        entry = SendMail.send_otp(self.user, '12345', 'email')
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=OSError):
+            outbox.drain()
+        entry.refresh_from_db()
+        self.assertEqual(entry.status, models.EmailOutbox.STATUS_FAILED)
+        self.assertEqual(outbox.queue_depth(), 0)
+
+
+class CachedAuthenticationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        authentication.local_cache.clear()
+        self.user = create_user(password='secret-pass')
+        models.UserDetails.objects.create(user=self.user)
+        self.client = authenticated_client(self.user)
+
+    def test_repeat_requests_skip_user_queries(self):
+        self.client.get('/api/user-details')
+        # with the cached response retired, only the profile snapshot lookup remains
+        responsecache.bump(self.user.pk)
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/user-details')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.data['user']['email_verified'])
+
+    def test_password_hash_is_not_cached(self):
+        self.client.get('/api/user-details')
+        self.assertNotIn(self.user.password, repr(cache.get(authentication._cache_key(self.user.pk))))
+        with self.assertNumQueries(0):
+            user = authentication.get_user(self.user.pk)
+        self.assertEqual((user.pk, user.email, user.is_active), (self.user.pk, 'test@example.com', True))
+        self.assertIn('password', user.get_deferred_fields())
+
+    def test_user_details_save_invalidates(self):
+        self.client.get('/api/user-details')
+        details = self.user.user_details
+        details.email_verified = True
+        with self.captureOnCommitCallbacks(execute=True):
+            details.save()
+        response = self.client.get('/api/user-details')
+        self.assertTrue(response.data['user']['email_verified'])
+
+
+class RefreshTokenBlacklistTests(TestCase):
+
+    def setUp(self):
+        tokens.blacklist_index.bloom = None
+        self.user = create_user(password='secret-pass')
+        self.refresh = get_tokens_for_user(self.user)['refresh']
+
+    def test_rotated_token_is_rejected(self):
+        response = self.client.post('/api/token/refresh', {'refresh': self.refresh})
+        self.assertEqual(response.status_code, 200)
+        response = self.client.post('/api/token/refresh', {'refresh': self.refresh})
+        self.assertEqual(response.status_code, 401)
+
+    def test_clean_token_skips_blacklist_query(self):
+        tokens.blacklist_index.sync()
+        token = tokens.FilteredRefreshToken(self.refresh, verify=False)
+        with self.assertNumQueries(0):
+            token.check_blacklist()
+
+    def test_row_committed_out_of_id_order_is_seen(self):
+        get_tokens_for_user(self.user)
+        first, second = OutstandingToken.objects.order_by('id')[:2]
+        BlacklistedToken.objects.create(id=100, token=second)
+        tokens.blacklist_index.sync(force=True)
+        # a transaction that took id 50 before id 100 was inserted, committing after the sync
+        BlacklistedToken.objects.create(id=50, token=first)
+        tokens.blacklist_index.sync(force=True)
+        self.assertTrue(tokens.blacklist_index.might_contain(first.jti))
+
+        # once old enough, rows stop being read again
+        BlacklistedToken.objects.update(blacklisted_at=timezone.now() - tokens.SYNC_OVERLAP * 2)
+        tokens.blacklist_index.sync(force=True)
+        self.assertEqual((tokens.blacklist_index.watermark, tokens.blacklist_index.recent), (100, set()))
+
+    def test_purge_removes_expired_tokens_in_batches(self):
+        self.client.post('/api/logout', {'refresh': self.refresh})
+        for i in range(5):
+            get_tokens_for_user(self.user)
+        OutstandingToken.objects.update(expires_at=OutstandingToken.objects.first().expires_at - timedelta(days=30))
+        self.assertEqual(tokens.purge_expired_tokens(batch_size=2), 6)
+        self.assertFalse(OutstandingToken.objects.exists())
+
+
+class QueryBudgetTests(TestCase):
+    # url name -> (method, data or a function of the test case returning it)
+    requests = {
+        'register': ('post', {'name': 'New Seller', 'email': 'new@example.com', 'contact_number': '9876500001',
+                              'password': 'secret-pass'}),
+        'login': ('post', {'email': 'test@example.com', 'password': 'secret-pass'}),
+        'token-refresh': ('post', lambda test: {'refresh': get_tokens_for_user(test.user)['refresh']}),
+        'verify-otp': ('post', lambda test: {'of': 'email', 'otp': otp.issue('email', test.user.pk)}),
+        'logout': ('post', lambda test: {'refresh': get_tokens_for_user(test.user)['refresh']}),
+        'upload-gst-certificate': ('post', lambda test: {
+            'gst-certificate': SimpleUploadedFile('certificate.pdf', b'%PDF-1.4 certificate')}),
+        'update-gst-details': ('post', {'gst-no': '33AAACH7409R1Z8', 'gst-type': 'Regular', 'business_address': 'Pune',
+                                        'legal-name': 'Test Store LLP', 'trade-name': 'Test Store'}),
+        'update-business-profile': ('post', lambda test: {'upload-file': 1, 'profile-pic': jpeg_upload(size=(64, 48)),
+                                                          'business-name': 'Test Store', 'business-address': 'Pune'}),
+        'import-sellers': ('post', lambda test: {'file': SimpleUploadedFile(
+            'sellers.ndjson', b'{"name": "Asha Rao", "email": "asha@example.com", "contact_number": "9876500002"}\n')}),
+        'create-bank-details': ('post', {'acc-holder-name': 'Test User', 'acc-number': '1234567890',
+                                         'ifsc': 'SBIN0000001'}),
+        'user-details': ('get', None),
+        'business-details': ('get', None),
+        'seller-details': ('get', None),
+        'seller-directory': ('get', None),
+        'seller-search': ('get', {'q': 'Test'}),
+        'db-pool-status': ('get', None),
+        'home': ('get', None),
+    }
+
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            # staff, for the ops endpoints
+            self.user = create_user(password='secret-pass', is_staff=True)
+            models.UserDetails.objects.create(user=self.user)
+            models.SellerGST.objects.create(user=self.user, seller_id='ABCDEFGHIJU1')
+            business = models.Business.objects.create(user=self.user, name='Test Store')
+            for number in range(3):
+                models.BanksDetails.objects.create(business=business, acc_holder_name='Test User',
+                                                   acc_number=f'00{number}', ifsc='SBIN0000001')
+        self.client = authenticated_client(self.user)
+
+    def test_every_budget_is_exercised(self):
+        self.assertEqual(set(query_budgets), set(self.requests))
+
+    def test_endpoints_stay_within_budget(self):
+        for name, budget in query_budgets.items():
+            method, data = self.requests[name]
+            with self.subTest(name):
+                cache.clear()
+                authentication.local_cache.clear()
+                tokens.blacklist_index.bloom = None
+                if callable(data):
+                    data = data(self)
+                # on_commit callbacks run inside the budget, the variant worker thread does not
+                with query_budget(budget, name), mock.patch.object(imaging, 'get_executor'), \
+                        self.captureOnCommitCallbacks(execute=True):
+                    response = getattr(self.client, method)(reverse(name), data)
+                self.assertEqual(response.status_code, 200)
+
+    def test_repeated_shapes_are_reported(self):
+        with record_queries() as recorder:
+            for user in models.User.objects.all():
+                list(models.BanksDetails.objects.filter(business__user=user))
+            list(models.BanksDetails.objects.filter(business__user=self.user))
+            list(models.BanksDetails.objects.filter(business__user=self.user))
+        shape, count, stack = recorder.repeated(3)[0]
+        self.assertEqual(count, 3)
+        self.assertEqual(shape, query_shape(recorder.queries[1]['sql']))
+        self.assertTrue(any('tests.py' in frame for frame in stack))
+
+
+class SellerProfileTests(TestCase):
+
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user = create_user(password='secret-pass')
+            models.UserDetails.objects.create(user=self.user)
+            self.business = models.Business.objects.create(user=self.user, name='Test Store')
+
+    def test_snapshot_follows_writes(self):
+        profile = readmodel.get_profile(self.user.id)
+        self.assertIsNone(profile['seller_gst'])
+        self.assertEqual(profile['business']['bank_details'], [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                models.BanksDetails.objects.create(business=self.business, acc_holder_name='Test User',
+                                                   acc_number='001', ifsc='SBIN0000001')
+                models.BanksDetails.objects.create(business=self.business, acc_holder_name='Test User',
+                                                   acc_number='002', ifsc='SBIN0000001')
+        with self.assertNumQueries(1):
+            profile = readmodel.get_profile(self.user.id)
+        self.assertEqual(len(profile['business']['bank_details']), 2)
+
+    def test_missing_snapshot_is_built_on_read(self):
+        models.SellerProfile.objects.all().delete()
+        self.assertEqual(readmodel.get_profile(self.user.id)['business']['name'], 'Test Store')
+        self.assertTrue(models.SellerProfile.objects.filter(pk=self.user.id).exists())
+
+
+@override_settings(ROOT_URLCONF='bharatBackend_proj.asgi_urls', PASSWORD_HASHER_POLICY={'ITERATIONS': 1000})
+class AsyncAuthenticationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = create_user(password='secret-pass')
+
+    async def test_register(self):
+        response = await AsyncClient().post('/api/register', {'name': 'New User', 'email': 'New@Example.com',
+                                                              'contact_number': '9876543211', 'password': 'pass-1234'})
+        self.assertEqual(response.json()['status']['code'], 200)
+        user = await models.User.objects.aget(email='new@example.com')
+        self.assertTrue(user.password.startswith('pbkdf2_sha256$1000$'))
+
+    async def test_register_reports_validation_errors(self):
+        response = await AsyncClient().post('/api/register', {'name': 'New User', 'email': 'test@example.com',
+                                                              'contact_number': '9876543211', 'password': 'pass'})
+        self.assertEqual(response.json()['messages']['email'], 'This email is already in use.')
+
+    async def test_login_rehashes_to_policy(self):
+        with override_settings(PASSWORD_HASHER_POLICY={'ITERATIONS': 2000}):
+            response = await AsyncClient().post('/api/login', {'email': 'test@example.com', 'password': 'secret-pass'},
+                                                content_type='application/json')
+            self.assertIn('access', response.json()['token'])
+        user = await models.User.objects.aget(pk=self.user.pk)
+        self.assertTrue(user.password.startswith('pbkdf2_sha256$2000$'))
+
+    async def test_wrong_password(self):
+        response = await AsyncClient().post('/api/login', {'email': 'test@example.com', 'password': 'wrong'})
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(ROOT_URLCONF='bharatBackend_proj.asgi_urls')
+class AsyncReadEndpointTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        authentication.local_cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user = create_user(password='secret-pass')
+            models.UserDetails.objects.create(user=self.user)
+            models.Business.objects.create(user=self.user, name='Test Store')
+        self.headers = {'Authorization': f'Bearer {get_tokens_for_user(self.user)["access"]}'}
+
+    async def test_read_endpoints(self):
+        client = AsyncClient()
+        response = await client.get('/api/user-details', headers=self.headers)
+        self.assertEqual(response.json()['user']['email'], 'test@example.com')
+        response = await client.get('/api/business-details', headers=self.headers)
+        self.assertEqual(response.json()['business']['name'], 'Test Store')
+        response = await client.get('/api/seller-details', headers=self.headers)
+        self.assertEqual(response.status_code, 404)
+
+    async def test_conditional_get(self):
+        client = AsyncClient()
+        etag = (await client.get('/api/business-details', headers=self.headers))['ETag']
+        response = await client.get('/api/business-details', headers={**self.headers, 'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+    async def test_middleware_runs_natively(self):
+        # with DEBUG an adapted sync middleware logs 'Asynchronous handler adapted for middleware ...'
+        with self.settings(DEBUG=True), self.assertNoLogs('django.request', 'DEBUG'):
+            response = await AsyncClient().get('/api/user-details', headers=self.headers)
+        # the queries the view sent to a worker thread still count
+        self.assertGreater(int(response['X-Query-Count']), 0)
+
+    async def test_requires_token(self):
+        response = await AsyncClient().get('/api/user-details')
+        self.assertEqual(response.status_code, 401)
+        response = await AsyncClient().get('/api/user-details', headers={'Authorization': 'Bearer invalid'})
+        self.assertEqual(response.status_code, 401)
+
+
+def jpeg_upload(name='photo.jpg', size=(2400, 1600)):
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.new('RGB', size, (200, 120, 40)).save(buffer, 'JPEG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+class ImageVariantTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.user = create_user(password='secret-pass')
+        models.UserDetails.objects.create(user=self.user)
+        self.client = authenticated_client(self.user)
+
+    def test_profile_pic_variants(self):
+        with mock.patch.object(imaging, 'get_executor') as get_executor, \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/update/business-profile', {'upload-file': 1,
+                                                                         'profile-pic': jpeg_upload()})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(get_executor.return_value.submit.called)
+        business = models.Business.objects.get(user=self.user)
+        variants = imaging.variant_urls(business.profile_pic)
+        self.assertEqual(variants['thumb'], variants['original'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            imaging.process('api.Business', business.pk, 'profile_pic')
+        variants = imaging.variant_urls(business.profile_pic)
+        self.assertTrue(variants['thumb'].endswith('__thumb.jpg'))
+        from PIL import Image
+        with imaging.variant_storage().open(imaging.variant_name(business.profile_pic.name, 'display')) as image:
+            self.assertEqual(Image.open(image).size, (1080, 720))
+        profile = readmodel.get_profile(self.user.id)
+        self.assertEqual(profile['business']['profile_pic_variants'], variants)
+
+    def test_non_images_are_skipped(self):
+        # an existing row, allocating a seller id needs a connection of its own
+        models.SellerGST.objects.create(user=self.user, seller_id='ABCDEFGHIJU1')
+        with mock.patch.object(imaging, 'get_executor') as get_executor, \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/upload/gst-certificate', {
+                'gst-certificate': SimpleUploadedFile('certificate.pdf', b'%PDF-1.4 certificate')})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(get_executor.return_value.submit.called)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            models.Business.objects.create(user=self.user, profile_pic=SimpleUploadedFile('photo.jpg', b'not a jpeg'))
+        business = models.Business.objects.get(user=self.user)
+        with self.assertNoLogs('api.imaging', 'ERROR'):
+            imaging.process('api.Business', business.pk, 'profile_pic')
+        self.assertEqual(imaging.variant_urls(business.profile_pic)['thumb'], business.profile_pic.url)
+
+
+class ContentAddressedStorageTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.users = [models.User.objects.create_user(name='Test User', email=f'test{i}@example.com',
+                                                      contact_number=f'987654321{i}', password='secret-pass')
+                      for i in range(2)]
+
+    def upload(self, user, picture):
+        client = authenticated_client(user)
+        with mock.patch.object(imaging, 'get_executor'), self.captureOnCommitCallbacks(execute=True):
+            response = client.post('/api/update/business-profile', {'upload-file': 1, 'profile-pic': picture})
+        self.assertEqual(response.status_code, 200)
+        return models.Business.objects.get(user=user).profile_pic.name
+
+    def test_identical_uploads_share_one_blob(self):
+        first = self.upload(self.users[0], jpeg_upload('a.jpg', size=(64, 48)))
+        second = self.upload(self.users[1], jpeg_upload('b.JPG', size=(64, 48)))
+        self.assertEqual(first, second)
+        self.assertTrue(first.startswith('cas/'))
+        self.assertEqual(models.MediaBlob.objects.get(name=first).refcount, 2)
+        self.upload(self.users[1], jpeg_upload('b.jpg', size=(64, 48)))
+        self.assertEqual(models.MediaBlob.objects.get(name=first).refcount, 2)
+
+        replaced = self.upload(self.users[0], jpeg_upload('a.jpg', size=(48, 64)))
+        self.assertNotEqual(replaced, first)
+        self.assertEqual(models.MediaBlob.objects.get(name=first).refcount, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            models.Business.objects.get(user=self.users[1]).delete()
+        self.assertEqual(models.MediaBlob.objects.get(name=first).refcount, 0)
+
+        storage = upload_storage()
+        self.assertTrue(storage.exists(first))
+        self.assertEqual(collect_garbage(storage, timezone.now() - timedelta(hours=1)), [])
+        self.assertEqual(collect_garbage(storage, timezone.now() + timedelta(seconds=1)), [first])
+        self.assertFalse(storage.exists(first))
+        self.assertTrue(storage.exists(replaced))
+
+    def test_field_delete_then_save_releases_once(self):
+        shared = self.upload(self.users[0], jpeg_upload(size=(64, 48)))
+        self.assertEqual(self.upload(self.users[1], jpeg_upload(size=(64, 48))), shared)
+        business = models.Business.objects.get(user=self.users[0])
+        with self.captureOnCommitCallbacks(execute=True):
+            business.profile_pic.delete(save=False)
+            business.save()
+        # still referenced by the other business
+        self.assertEqual(models.MediaBlob.objects.get(name=shared).refcount, 1)
+
+    def test_recount(self):
+        name = self.upload(self.users[0], jpeg_upload(size=(64, 48)))
+        models.MediaBlob.objects.filter(name=name).update(refcount=5)
+        self.assertEqual(recount([(models.Business, ['profile_pic'])]), 1)
+        self.assertEqual(models.MediaBlob.objects.get(name=name).refcount, 1)
+
+
+class MediaServingTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.owner, self.other = [
+            models.User.objects.create_user(name='Test User', email=f'test{i}@example.com',
+                                            contact_number=f'987654321{i}', password='secret-pass')
+            for i in range(2)]
+        self.picture = models.Business.objects.create(user=self.owner, profile_pic=jpeg_upload(size=(64, 48)))
+        self.certificate = models.SellerGST.objects.create(user=self.owner, certificate=jpeg_upload(size=(48, 64)))
+
+    def auth(self, user):
+        return {'HTTP_AUTHORIZATION': f'Bearer {get_tokens_for_user(user)["access"]}'}
+
+    def test_public_picture(self):
+        url = self.picture.profile_pic.url
+        with mock.patch.object(media, 'FileResponse', wraps=media.FileResponse) as file_response:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        # the open file, which the server can sendfile()
+        self.assertTrue(hasattr(file_response.call_args.args[0], 'fileno'))
+        body = b''.join(response.streaming_content)
+        self.assertEqual(body, self.picture.profile_pic.read())
+        self.assertEqual(response['Content-Length'], str(len(body)))
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        etag = response['ETag']
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        response = self.client.get(url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), body[10:20])
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(body)}')
+        self.assertEqual(self.client.get(url, HTTP_RANGE=f'bytes={len(body)}-').status_code, 416)
+
+    def test_certificate_is_private(self):
+        url = self.certificate.certificate.url
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.client.get(url, **self.auth(self.other)).status_code, 404)
+        response = self.client.get(url, **self.auth(self.owner))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Cache-Control'].startswith('private'))
+
+    @override_settings(MEDIA_SENDFILE={'BACKEND': 'nginx'})
+    def test_offload(self):
+        response = self.client.get(self.picture.profile_pic.url)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.picture.profile_pic.name}')
+        self.assertEqual(response.content, b'')
+
+
+class SellerIdTests(TestCase):
+
+    def test_encode_is_injective(self):
+        codes = {sellerids.encode(number, 10) for number in range(5000)}
+        self.assertEqual(len(codes), 5000)
+        self.assertTrue(all(re.fullmatch('[0-9A-Z]{10}', code) for code in codes))
+        with self.assertRaises(ValueError):
+            sellerids.encode(36 ** 10, 10)
+
+
+class SellerIdAllocationTests(TransactionTestCase):
+
+    def test_upload_allocates_once(self):
+        # the reservation commits on its own connection, which sqlite only allows outside
+        # a test transaction
+        user = create_user(password='secret-pass')
+        client = authenticated_client(user)
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        with override_settings(MEDIA_ROOT=media_root), mock.patch.object(imaging, 'get_executor'):
+            client.post('/api/upload/gst-certificate', {'gst-certificate': jpeg_upload(size=(64, 48))})
+            seller_id = models.SellerGST.objects.get(user=user).seller_id
+            client.post('/api/upload/gst-certificate', {'gst-certificate': jpeg_upload(size=(48, 64))})
+        self.assertRegex(seller_id, rf'^[0-9A-Z]{{10}}U{user.id}$')
+        self.assertEqual(models.SellerGST.objects.get(user=user).seller_id, seller_id)
+
+    def test_concurrent_allocators_never_collide(self):
+        # one allocator per simulated process, several threads per process
+        allocators = [sellerids.BlockAllocator('stress', block_size=7) for _ in range(3)]
+        results = []
+        errors = []
+
+        def work(allocator):
+            try:
+                values = [allocator.allocate() for _ in range(40)]
+                results.extend(values)
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=work, args=(allocators[i % 3],)) for i in range(9)]
+        with override_settings(SELLER_IDS={'RETRIES': 50}):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(len(results), 9 * 40)
+        self.assertEqual(len(set(results)), len(results))
+        self.assertGreaterEqual(models.IdSequence.objects.get(name='stress').next_value, len(results))
+
+
+class OTPStoreTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = create_user(password='secret-pass')
+        models.UserDetails.objects.create(user=self.user)
+        self.client = authenticated_client(self.user)
+
+    def verify(self, of, code):
+        return self.client.post('/api/verify/otp', {'of': of, 'otp': code}).data['status']['code']
+
+    def test_code_is_single_use(self):
+        code = otp.issue('email', self.user.id)
+        readmodel.get_profile(self.user.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.verify('email', code), 200)
+        self.assertTrue(models.UserDetails.objects.get(user=self.user).email_verified)
+        self.assertTrue(readmodel.get_profile(self.user.id)['user']['email_verified'])
+        self.assertEqual(self.verify('email', code), 220)
+
+    def test_reissue_replaces_code(self):
+        first = otp.issue('email', self.user.id)
+        second = otp.issue('email', self.user.id)
+        self.assertFalse(first != second and otp.consume('email', self.user.id, first))
+        self.assertFalse(otp.consume('gst', self.user.id, second))
+        self.assertTrue(otp.consume('email', self.user.id, second))
+
+    @override_settings(OTP_STORE={'MAX_ATTEMPTS': 3})
+    def test_code_revoked_after_max_attempts(self):
+        code = otp.issue('email', self.user.id)
+        wrong = f'{(int(code) + 1) % 100000:05d}'
+        for _ in range(3):
+            self.assertFalse(otp.consume('email', self.user.id, wrong))
+        self.assertFalse(otp.consume('email', self.user.id, code))
+        self.assertFalse(models.UserDetails.objects.get(user=self.user).email_verified)
+
+    @override_settings(OTP_STORE={'MAX_ATTEMPTS': 3})
+    def test_parallel_guesses_are_counted_before_compare(self):
+        code = otp.issue('email', self.user.id)
+        wrong = f'{(int(code) + 1) % 100000:05d}'
+        # the guesses racing the one whose revoke hasn't landed yet
+        with mock.patch.object(otp, 'revoke'):
+            for _ in range(3):
+                self.assertFalse(otp.consume('email', self.user.id, wrong))
+            self.assertFalse(otp.consume('email', self.user.id, code))
+
+    @override_settings(OTP_STORE={'TTL': 0.2})
+    def test_code_expires(self):
+        code = otp.issue('email', self.user.id)
+        time.sleep(0.3)
+        self.assertFalse(otp.consume('email', self.user.id, code))
+
+
+@override_settings(THROTTLES={'POLICIES': {
+    'login': [{'KEY': 'ip', 'RATE': '100/min'}, {'KEY': 'email', 'RATE': '3/min'}],
+}})
+class ThrottleTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        # requests of one test must not straddle a window boundary
+        clock = mock.patch.object(throttling, 'time')
+        clock.start().time.return_value = 1030.0
+        self.addCleanup(clock.stop)
+
+    def test_sliding_window(self):
+        limiter = throttling.Limiter('login')
+        request = self.factory.post('/api/login', {'email': 'test@example.com'})
+        for _ in range(3):
+            self.assertIsNone(limiter.hit(request, now=60.0))
+        self.assertEqual(limiter.hit(request, now=90.0), 30)
+        # half way through the next minute the previous one still counts for half
+        self.assertIsNone(limiter.hit(request, now=150.0))
+        self.assertIsNone(limiter.hit(request, now=151.0))
+        self.assertEqual(limiter.hit(request, now=152.0), 28)
+        other = self.factory.post('/api/login', {'email': 'Other@Example.com'})
+        self.assertIsNone(limiter.hit(other, now=152.0))
+
+    def test_forwarded_for_is_not_trusted_without_proxies(self):
+        limiter = throttling.Limiter('login')
+        with override_settings(THROTTLES={'POLICIES': {'login': [{'KEY': 'ip', 'RATE': '2/min'}]}}):
+            for address in ('1.1.1.1', '2.2.2.2'):
+                self.assertIsNone(limiter.hit(self.factory.post('/api/login', HTTP_X_FORWARDED_FOR=address)))
+            self.assertIsNotNone(limiter.hit(self.factory.post('/api/login', HTTP_X_FORWARDED_FOR='3.3.3.3')))
+            # the cache key holds a digest, not the address
+            self.assertFalse([key for key in cache._cache if '127.0.0.1' in key])
+
+    def test_parallel_requests_cannot_all_pass(self):
+        # every request read the counts before any of them was counted
+        limiter = throttling.Limiter('login')
+        request = self.factory.post('/api/login', {'email': 'test@example.com'})
+        with mock.patch.object(type(caches['default']), 'get_many', return_value={}):
+            allowed = [limiter.hit(request) is None for _ in range(5)]
+        self.assertEqual(allowed, [True] * 3 + [False] * 2)
+        # the rejected ones weren't counted
+        ip_window, email_window = limiter.windows(request, 1030.0)
+        self.assertEqual(cache.get_many([ip_window.current_key, email_window.current_key]),
+                         {ip_window.current_key: 3, email_window.current_key: 3})
+
+    def test_login_rejected_before_any_query(self):
+        data = {'email': 'test@example.com', 'password': 'wrong'}
+        for _ in range(3):
+            self.assertEqual(self.client.post('/api/login', data).status_code, 404)
+        with self.assertNumQueries(0):
+            response = self.client.post('/api/login', data)
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+
+    async def test_async_login(self):
+        data = {'email': 'test@example.com', 'password': 'wrong'}
+        with override_settings(ROOT_URLCONF='bharatBackend_proj.asgi_urls'):
+            for _ in range(3):
+                await AsyncClient().post('/api/login', data, content_type='application/json')
+            response = await AsyncClient().post('/api/login', data, content_type='application/json')
+        self.assertEqual(response.status_code, 429)
+
+
+class BulkImportTests(TestCase):
+    CSV = (b'name,email,contact_number\n'
+           b'Asha Rao,asha@example.com,9876500001\n'
+           b'Bad Name 1,bad@example.com,9876500002\n'
+           b'Ravi Kumar,ASHA@example.com,9876500003\n'
+           b'Meena Shah,test@example.com,9876500004\n'
+           b'Vikram Singh,vikram@example.com,12345\n'
+           b'Kiran Das,kiran@example.com,9876500006\n')
+
+    def setUp(self):
+        self.user = create_user(password='secret-pass')
+
+    def test_csv_import(self):
+        errors = {}
+        result = bulkimport.import_sellers(bulkimport.read_rows(io.BytesIO(self.CSV)), chunk_size=2,
+                                           report=lambda line, row_errors: errors.update({line: row_errors}))
+        self.assertEqual(result.as_dict(), {'rows': 6, 'created': 2, 'failed': 4})
+        self.assertEqual(set(errors), {3, 4, 5, 6})
+        self.assertIn('name', errors[3])
+        self.assertEqual(errors[4], {'email': 'This email is already in use.'})
+        self.assertIn('contact_number', errors[6])
+        seller = models.User.objects.get(email='kiran@example.com')
+        self.assertFalse(seller.has_usable_password())
+        self.assertTrue(seller.user_details.is_seller)
+
+    def test_bulk_inserts_refresh_profiles(self):
+        rows = [(1, {'name': 'Asha Rao', 'email': 'asha@example.com', 'contact_number': '9876500001'}),
+                (2, {'name': 'A' * 501, 'email': 'long@example.com', 'contact_number': '9876500002'})]
+        errors = {}
+        with mock.patch('api.signals.profile_changed') as profile_changed:
+            result = bulkimport.import_sellers(rows, report=lambda line, row_errors: errors.update({line: row_errors}))
+        self.assertEqual(result.as_dict(), {'rows': 2, 'created': 1, 'failed': 1})
+        self.assertEqual(errors, {2: {'name': 'Ensure this field has no more than 500 characters.'}})
+        profile_changed.assert_called_once_with(models.User.objects.get(email='asha@example.com').pk)
+
+    def test_admin_endpoint(self):
+        client = authenticated_client(self.user)
+        rows = b'{"name": "Asha Rao", "email": "asha@example.com", "contact_number": "9876500001"}\nnot json\n'
+        upload = SimpleUploadedFile('sellers.ndjson', rows)
+        self.assertEqual(client.post('/api/import/sellers', {'file': upload}).status_code, 403)
+
+        models.User.objects.filter(pk=self.user.pk).update(is_staff=True)
+        authentication.invalidate_user(self.user.pk)
+        upload.seek(0)
+        response = client.post('/api/import/sellers', {'file': upload})
+        self.assertEqual(response.data['result'], {'rows': 2, 'created': 1, 'failed': 1})
+        self.assertEqual(response.data['errors'], [{'line': 2, 'errors': {'row': 'Not a JSON object.'}}])
+
+
+class RendererTests(TestCase):
+    payload = {
+        'when': datetime(2024, 1, 2, 3, 4, 5, tzinfo=dt_timezone.utc), 'amount': Decimal('12.50'),
+        'id': uuid.UUID(int=1), 'big': 2 ** 70, 'ids': {1: 'a'}, 'name': 'चाय',
+    }
+
+    def render_both(self, data):
+        renderer = UserRenderer()
+        with mock.patch.object(renderers, 'orjson', None):
+            stdlib = renderer.render(data)
+        return renderer.render(data), stdlib
+
+    def test_same_output_with_and_without_orjson(self):
+        fast, stdlib = self.render_both(self.payload)
+        self.assertEqual(json.loads(fast), json.loads(stdlib))
+        self.assertEqual(json.loads(fast)['big'], 2 ** 70)
+        self.assertEqual(json.loads(fast)['amount'], 12.5)
+
+    def test_errors_are_wrapped(self):
+        for body in self.render_both({'email': [ErrorDetail('Enter a valid email.', code='invalid')]}):
+            self.assertEqual(json.loads(body), {'errors': {'email': ['Enter a valid email.']}})
+        for body in self.render_both({'message': 'ok'}):
+            self.assertEqual(json.loads(body), {'message': 'ok'})
+
+    def test_unencodable_raises_type_error(self):
+        renderer = UserRenderer()
+        with self.assertRaises(TypeError):
+            renderer.render({'value': object()})
+        with mock.patch.object(renderers, 'orjson', None), self.assertRaises(TypeError):
+            renderer.render({'value': object()})
+
+
+class GSTINTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        path = os.path.join(directory, 'gst_registry.bin')
+        written, skipped = gstin.build_registry(path, [
+            ('27AAPFU0939F1ZV', 'Upkar Foods LLP', 'Upkar Foods', 'ACTIVE '),
+            ('29AAGCB7383J1Z4', 'Bharat Crafts Private Limited', 'Bharat Crafts', 'cancelled'),
+            ('29AAGCB7383J1Z5', 'Bad Check Digit', '', 'Active'),
+        ])
+        self.assertEqual((written, skipped), (2, 1))
+        patcher = mock.patch.object(gstin, 'registry', Registry(path))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.user = create_user(password='secret-pass')
+        models.SellerGST.objects.create(user=self.user, seller_id='ABCDEFGHIJU1')
+        self.client = authenticated_client(self.user)
+
+    def test_validate(self):
+        self.assertEqual(gstin.validate(' 27aapfu0939f1zv '), '27AAPFU0939F1ZV')
+        for invalid in ('27AAPFU0939F1ZW', '00AAPFU0939F1ZV', '27AAPFU0939F1Z', 'not a gstin'):
+            with self.subTest(invalid), self.assertRaises(ValidationError):
+                gstin.validate(invalid)
+        # the onboarding benchmark's numbers
+        generated = {fake_gstin(number) for number in range(0, 10 ** 7, 9973)}
+        self.assertEqual({gstin.validate(number) for number in generated}, generated)
+
+    def test_registry_lookup(self):
+        self.assertEqual(gstin.lookup('27AAPFU0939F1ZV'),
+                         {'legal_name': 'Upkar Foods LLP', 'trade_name': 'Upkar Foods', 'status': 'Active'})
+        self.assertIsNone(gstin.lookup('33AAACH7409R1Z8'))
+
+    def post(self, gst_no, **extra):
+        data = {'gst-no': gst_no, 'gst-type': 'Regular', 'business_address': 'Pune', **extra}
+        return self.client.post('/api/update/gst-details', data).data
+
+    def test_listed_gstin_is_verified_and_prefilled(self):
+        response = self.post('27AAPFU0939F1ZV')
+        self.assertEqual(response['status']['code'], 200)
+        self.assertEqual(response['seller_gst']['legal_name'], 'Upkar Foods LLP')
+        self.assertTrue(response['seller_gst']['gst_verified'])
+        self.assertEqual(models.SellerGST.objects.get(user=self.user).gst_number, '27AAPFU0939F1ZV')
+        self.assertFalse(models.EmailOutbox.objects.exists())
+
+    def test_unlisted_gstin_goes_through_otp(self):
+        self.assertEqual(self.post('33AAACH7409R1Z8')['status']['code'], 230)
+        response = self.post('33AAACH7409R1Z8', **{'legal-name': 'Acme', 'trade-name': 'Acme'})
+        self.assertFalse(response['seller_gst']['gst_verified'])
+        self.assertEqual(models.EmailOutbox.objects.count(), 1)
+        self.assertEqual(self.post('29AAGCB7383J1Z4')['message'], 'GST number is cancelled.')
+        self.assertEqual(self.post('33AAACH7409R1Z9')['status']['code'], 230)
+
+
+class IFSCTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        path = os.path.join(directory, 'ifsc_directory.bin')
+        written, skipped = ifsc.build_directory(path, [
+            ('SBIN0000001', 'State Bank of India', 'Main Branch', 'Kolkata'),
+            ('hdfc0000240', 'HDFC Bank', 'Shivajinagar', 'Pune'),
+            ('HDFC1000240', 'Bad Fifth Character', '', ''),
+        ])
+        self.assertEqual((written, skipped), (2, 1))
+        patcher = mock.patch.object(ifsc, 'directory', Registry(path))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        ifsc._lookup.cache_clear()
+
+        self.user = create_user(password='secret-pass')
+        models.Business.objects.create(user=self.user, name='Test Store')
+        self.client = authenticated_client(self.user)
+
+    def test_lookup(self):
+        self.assertEqual(ifsc.lookup(' hdfc0000240 '), {'bank': 'HDFC Bank', 'branch': 'Shivajinagar', 'city': 'Pune'})
+        self.assertIsNone(ifsc.lookup('HDFC0000241'))
+        self.assertIsNone(ifsc.lookup('not an ifsc'))
+        self.assertEqual(ifsc.validate('sbin0000001'), 'SBIN0000001')
+        for invalid in ('HDFC0000241', 'HDFC1000240', ''):
+            with self.subTest(invalid), self.assertRaises(ValidationError):
+                ifsc.validate(invalid)
+
+    def test_bank_details_are_enriched(self):
+        data = {'acc-holder-name': 'Test User', 'acc-number': '1234567890'}
+        response = self.client.post(reverse('create-bank-details'), {**data, 'ifsc': 'hdfc0000240'}).data
+        self.assertEqual(response['status']['code'], 200)
+        self.assertEqual((response['bank']['ifsc'], response['bank']['bank_name'], response['bank']['city']),
+                         ('HDFC0000240', 'HDFC Bank', 'Pune'))
+        response = self.client.post(reverse('create-bank-details'), {**data, 'ifsc': 'HDFC0000241'}).data
+        self.assertEqual(response['message'], 'IFSC code not found.')
+        self.assertEqual(models.BanksDetails.objects.count(), 1)
+
+
+class SellerDirectoryTests(TestCase):
+
+    def setUp(self):
+        for number in range(7):
+            user = models.User.objects.create_user(name='Test User', email=f'seller{number}@example.com',
+                                                   contact_number=f'98765432{number:02}', password='secret-pass')
+            models.UserDetails.objects.create(user=user, is_seller=number != 6)
+            models.SellerGST.objects.create(user=user, seller_id=f'SELLER{number:06}', gst_verified=number % 2 == 0,
+                                            gst_type='Regular')
+            models.Business.objects.create(user=user, name=f'Store {number}')
+        # identical timestamps, the id breaks the tie
+        models.SellerGST.objects.update(created_on=timezone.now())
+        self.client = APIClient()
+        self.client.force_authenticate(models.User.objects.create_user(
+            name='Ops User', email='ops@example.com', contact_number='9000000000', is_staff=True))
+
+    def walk(self, **params):
+        names, cursor = [], None
+        while True:
+            with self.assertNumQueries(1):
+                response = self.client.get(reverse('seller-directory'),
+                                           {'page-size': 3, **params, **({'cursor': cursor} if cursor else {})}).data
+            names += [seller['business_name'] for seller in response['sellers']]
+            cursor = response['next']
+            if cursor is None:
+                return names
+
+    def test_pages(self):
+        self.assertEqual(self.walk(), [f'Store {number}' for number in range(6, -1, -1)])
+        self.assertEqual(self.walk(**{'gst-verified': 'true', 'is-seller': 'true'}), ['Store 4', 'Store 2', 'Store 0'])
+
+    def test_bad_cursor_and_staff_only(self):
+        self.assertEqual(self.client.get(reverse('seller-directory'), {'cursor': 'nonsense'}).data['message'],
+                         'Invalid cursor.')
+        self.client.force_authenticate(models.User.objects.get(email='seller0@example.com'))
+        self.assertEqual(self.client.get(reverse('seller-directory')).status_code, 403)
+
+
+class SearchTests(TestCase):
+
+    def setUp(self):
+        search._backend.clear()
+        self.addCleanup(search._backend.clear)
+        self.index = search.WordIndex.build([
+            (1, search.words('Sharma Traders Private Limited')),
+            (2, search.words('Sharma Textiles')),
+            (3, search.words('Varanasi Silk Sarees')),
+            (4, search.words('Shah Trading Co')),
+        ])
+
+    def test_index(self):
+        self.assertEqual([document for document, _ in self.index.search(['sharma', 'tr'])], [1])
+        self.assertEqual([document for document, _ in self.index.search(['sharma'])], [1, 2])
+        # misspelt, and a stopword still being typed
+        self.assertEqual([document for document, _ in self.index.search(['shrama', 'textiles'])], [2])
+        self.assertEqual([document for document, _ in self.index.search(['varanasi', 'priv'])], [3])
+        # exact matches outrank prefixes
+        self.index.add(5, ['sha', 'silk'])
+        self.assertEqual([document for document, _ in self.index.search(['sha'])][0], 5)
+        self.index.remove(3)
+        self.assertEqual(self.index.search(['varanasi']), [])
+        self.assertNotIn('varanasi', self.index.vocabulary)
+
+    def test_rebuild_runs_beside_searches(self):
+        started, release = threading.Event(), threading.Event()
+        snapshots = [[(2, search.words('Sharma Textiles'))], [(1, search.words('Sharma Traders'))]]
+
+        def documents(user_ids=None):
+            if user_ids is not None:
+                return []
+            if len(snapshots) == 1:
+                started.set()
+                release.wait(5)
+            return snapshots.pop(0) if len(snapshots) > 1 else snapshots[0]
+
+        backend = search.InMemoryBackend({**search.search_settings(), 'REBUILD_INTERVAL': 0})
+        with mock.patch.object(search, 'documents', documents):
+            self.assertEqual([user_id for user_id, _ in backend.search('sharma', 5)], [2])
+            # starts the rebuild, then answers from the current index while it runs
+            self.assertEqual([user_id for user_id, _ in backend.search('sharma', 5)], [2])
+            self.assertTrue(started.wait(5))
+            self.assertEqual([user_id for user_id, _ in backend.search('sharma', 5)], [2])
+            release.set()
+            self.join_rebuilds()
+            self.assertEqual([user_id for user_id, _ in backend.search('sharma', 5)][0], 1)
+            self.join_rebuilds()
+
+    @staticmethod
+    def join_rebuilds():
+        for thread in threading.enumerate():
+            if thread.name == 'search-rebuild':
+                thread.join(5)
+
+    def test_endpoint_follows_changes(self):
+        staff = models.User.objects.create_user(name='Ops User', email='ops@example.com', contact_number='9000000000',
+                                                is_staff=True)
+        client = APIClient()
+        client.force_authenticate(staff)
+        user = create_user()
+        models.SellerGST.objects.create(user=user, trade_name='Sharma Traders', legal_name='Sharma Traders LLP')
+        business = models.Business.objects.create(user=user, name='Sharma Traders', store_name='Kirana Corner')
+
+        sellers = client.get(reverse('seller-search'), {'q': 'kiran'}).data['sellers']
+        self.assertEqual([(seller['user_id'], seller['store_name']) for seller in sellers],
+                         [(user.id, 'Kirana Corner')])
+        with self.captureOnCommitCallbacks(execute=True):
+            business.store_name = 'Mumbai Spices'
+            business.save()
+        self.assertEqual(client.get(reverse('seller-search'), {'q': 'kiran'}).data['sellers'], [])
+        self.assertEqual(len(client.get(reverse('seller-search'), {'q': 'mumbai sp'}).data['sellers']), 1)
+        self.assertEqual(client.get(reverse('seller-search'), {'q': ' '}).data['status']['code'], 230)
+
+
+@override_settings(DATABASE_REPLICAS={'REPLICAS': {'replica-1': 3, 'replica-2': 1, 'replica-3': 0}})
+class ReplicaRoutingTests(TestCase):
+    # two local sqlite replicas that, unlike real ones, receive nothing from the primary.
+    # they are registered as connections without being configured databases, so the
+    # test runner leaves them alone
+    replicas = ('replica-1', 'replica-2')
+
+    def setUp(self):
+        configured = connections.configure_settings(
+            {**connections.settings, **{alias: {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}
+                                        for alias in self.replicas}})
+        for alias in self.replicas:
+            connections[alias] = load_backend(configured[alias]['ENGINE']).DatabaseWrapper(configured[alias], alias)
+            self.addCleanup(connections.__delitem__, alias)
+            with connections[alias].schema_editor() as editor:
+                for model in apps.get_models():
+                    editor.create_model(model)
+        cache.clear()
+        self.user = create_user()
+        cache.clear()
+
+    def test_weighted_choice(self):
+        picks = [replicas.choose_replica() for _ in range(2000)]
+        self.assertNotIn('replica-3', picks)
+        self.assertGreater(picks.count('replica-1'), 2 * picks.count('replica-2'))
+
+    def test_router(self):
+        with replicas.use_replica('replica-1'):
+            self.assertFalse(models.User.objects.filter(pk=self.user.pk).exists())
+            with replicas.use_primary():
+                self.assertTrue(models.User.objects.filter(pk=self.user.pk).exists())
+            # writes always reach the primary
+            models.UserDetails.objects.create(user=self.user)
+        self.assertTrue(models.UserDetails.objects.filter(user=self.user).exists())
+
+    @override_settings(DATABASE_REPLICAS={'REPLICAS': {'replica-1': 1}})
+    def test_reads_follow_writes(self):
+        # the replica lags behind with an older snapshot
+        models.User.objects.using('replica-1').create(pk=self.user.pk, name=self.user.name, email=self.user.email,
+                                                      contact_number=self.user.contact_number)
+        models.SellerProfile.objects.using('replica-1').create(user_id=self.user.pk,
+                                                               data={'user': {'name': 'Stale Name'}})
+        # seeding the replica went through the write signals, which pinned the user
+        cache.clear()
+        client = authenticated_client(self.user)
+
+        self.assertEqual(client.get(reverse('user-details')).data['user']['name'], 'Stale Name')
+        client.post('/api/update/business-profile', {})
+        # the post changed nothing, retire what a real write would have
+        authentication.invalidate_user(self.user.pk)
+        responsecache.bump(self.user.pk)
+        self.assertEqual(client.get(reverse('user-details')).data['user']['name'], 'Test User')
+        self.assertTrue(replicas.is_pinned(self.user.pk))
+
+
+class ConnectionPoolTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'pool.sqlite3')
+
+    def make_pool(self, **kwargs):
+        pool = db_pool.ConnectionPool(lambda: sqlite3.connect(self.path, check_same_thread=False),
+                              lambda connection: connection.execute('SELECT 1'), **kwargs)
+        self.addCleanup(pool.close)
+        return pool
+
+    def test_reuse_and_limits(self):
+        pool = self.make_pool(min_size=1, max_size=2, timeout=0.2)
+        pool.fill()
+        first = pool.checkout()
+        pool.checkin(first)
+        self.assertIs(pool.checkout(), first)
+        second = pool.checkout()
+        self.assertEqual(pool.stats()['in_use'], 2)
+        with self.assertRaises(db_pool.PoolTimeout):
+            pool.checkout()
+
+        # a waiting checkout gets the connection given back by another thread
+        threading.Timer(0.05, pool.checkin, (second,)).start()
+        pool.timeout = 2
+        self.assertIs(pool.checkout(), second)
+        stats = pool.stats()
+        self.assertEqual((stats['opened'], stats['timeouts'], stats['in_use']), (2, 1, 2))
+        self.assertGreater(stats['max_wait_seconds'], 0.01)
+
+    def test_broken_and_old_connections_are_replaced(self):
+        pool = self.make_pool(min_size=0, max_size=2, max_lifetime=60)
+        broken = pool.checkout()
+        pool.checkin(broken)
+        broken.close()
+        healthy = pool.checkout()
+        self.assertIsNot(healthy, broken)
+        self.assertEqual(pool.stats()['ping_failures'], 1)
+
+        pool.max_lifetime = 0
+        pool.checkin(healthy)
+        self.assertEqual(pool.stats()['size'], 0)
+
+    def test_database_wrapper(self):
+        settings_dict = connections.configure_settings(
+            {**connections.settings, 'pooled': {'ENGINE': 'api.db.sqlite3', 'NAME': self.path,
+                                                'POOL': {'MIN_SIZE': 1}}})['pooled']
+        wrapper = load_backend('api.db.sqlite3').DatabaseWrapper(settings_dict, 'pooled')
+        self.addCleanup(db_pool.close_all)
+        with wrapper.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        raw = wrapper.connection
+        wrapper.close()
+        self.assertEqual(db_pool.stats()['pooled']['idle'], 1)
+        with wrapper.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        self.assertIs(wrapper.connection, raw)
+        self.assertEqual(db_pool.stats()['pooled']['in_use'], 1)
+        wrapper.close()
+
+
+class ResponseCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        authentication.local_cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user = create_user()
+            models.UserDetails.objects.create(user=self.user)
+            self.business = models.Business.objects.create(user=self.user, name='Test Store')
+        self.client = authenticated_client(self.user)
+
+    def test_conditional_get(self):
+        url = reverse('business-details')
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response['ETag'], etag)
+            # no validator: the cached body
+            self.assertEqual(self.client.get(url).data['business']['name'], 'Test Store')
+
+        # every endpoint has its own tag
+        self.assertNotEqual(self.client.get(reverse('user-details'))['ETag'], etag)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.business.name = 'Renamed Store'
+            self.business.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data['business']['name'], 'Renamed Store')
+
+    def test_per_process_cache_gets_short_timeout(self):
+        # another worker's bump can't reach a LocMemCache, so its bodies expire soon. versions don't
+        conf = responsecache.response_cache_settings()
+        self.assertEqual((conf['TIMEOUT'], conf['BODY_TIMEOUT']), (3600, 5))
+        with self.settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}):
+            self.assertEqual(responsecache.response_cache_settings()['BODY_TIMEOUT'], 3600)
+
+    def test_stale_version_keeps_etags_honest(self):
+        # a worker that missed the bump rebuilds the expired body under its old version
+        url = reverse('business-details')
+        etag = self.client.get(url)['ETag']
+        conf = responsecache.response_cache_settings()
+        body_key = responsecache._body_key(conf, 'business-details', self.user.pk, responsecache.version(self.user.pk))
+        for name in ('Renamed Store', 'Test Store'):
+            models.Business.objects.filter(pk=self.business.pk).update(name=name)
+            readmodel.rebuild_profile(self.user.pk)
+            cache.delete(body_key)
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304 if name == 'Test Store' else 200)
+
+    def test_errors_are_not_cached(self):
+        url = reverse('seller-details')
+        self.assertEqual(self.client.get(url).status_code, 404)
+        with self.captureOnCommitCallbacks(execute=True):
+            models.SellerGST.objects.create(user=self.user, trade_name='Test Traders')
+        self.assertEqual(self.client.get(url).data['seller_gst']['trade_name'], 'Test Traders')
+
+
+class MetricsTests(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        overrides = override_settings(METRICS={'DIRECTORY': self.directory, 'TOKEN': 'scrape'})
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.addCleanup(metrics.clear)
+        cache.clear()
+        self.user = create_user()
+        models.UserDetails.objects.create(user=self.user)
+        self.client = authenticated_client(self.user)
+
+    def test_request_metrics(self):
+        self.client.get(reverse('user-details'))
+        self.client.get(reverse('user-details'))
+        self.client.get('/api/no-such-endpoint')
+        scraper = APIClient()
+        scraper.credentials(HTTP_AUTHORIZATION='Bearer scrape')
+        text = scraper.get(reverse('metrics')).content.decode()
+
+        labels = 'method="GET",route="api/user-details"'
+        self.assertIn(f'http_requests_total{{{labels},status="200"}} 2', text)
+        self.assertIn(f'http_request_duration_seconds_count{{{labels}}} 2', text)
+        # buckets are cumulative, +Inf holds every sample
+        self.assertIn(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} 2', text)
+        self.assertIn('http_requests_total{method="GET",route="unmatched",status="404"} 1', text)
+        self.assertRegex(text, r'db_queries_total\{route="api/user-details"\} [1-9]')
+        # the scrape itself is in flight
+        self.assertIn('http_requests_in_flight 1', text)
+
+    def test_processes_are_summed(self):
+        metrics.inc('db_queries_total', (('route', 'x'),), 2)
+        # a worker process that has exited
+        other = metrics.SlotFile(os.path.join(self.directory, '999999999-1.slots'))
+        other.add(('db_queries_total', (('route', 'x'),)), 3)
+        other.add(('http_requests_in_flight', ()), 4)
+        totals = metrics.collect()
+        self.assertEqual(totals[('db_queries_total', (('route', 'x'),))], 5)
+        self.assertNotIn(('http_requests_in_flight', ()), totals)
+
+    def test_hash_and_email_timings(self):
+        from .hashers import PolicyPBKDF2PasswordHasher
+        hasher = PolicyPBKDF2PasswordHasher()
+        hasher.verify('secret', hasher.encode('secret', hasher.salt(), iterations=1))
+        SendMail.send_otp(self.user, '12345', 'email')
+        outbox.drain()
+        text = metrics.render()
+        self.assertIn('password_hash_duration_seconds_count{operation="encode"} 1', text)
+        self.assertIn('password_hash_duration_seconds_count{operation="verify"} 1', text)
+        self.assertIn('email_send_duration_seconds_count{result="sent"} 1', text)
+
+    def test_exited_threads_and_processes_are_folded(self):
+        metrics.inc('db_queries_total', (('route', 'x'),))
+        thread = threading.Thread(target=metrics.inc, args=('db_queries_total', (('route', 'x'),), 2))
+        thread.start()
+        thread.join()
+        other = metrics.SlotFile(os.path.join(self.directory, '999999999-1.slots'))
+        other.add(('db_queries_total', (('route', 'x'),)), 3)
+        other.close()
+        self.assertEqual(metrics.collect()[('db_queries_total', (('route', 'x'),))], 6)
+        # only this thread's file is left beside the folded total
+        self.assertEqual(sorted(name for name in os.listdir(self.directory) if name != 'collect.lock'),
+                         [f'{os.getpid()}-{threading.get_ident()}.slots', metrics.EXITED])
+        self.assertEqual(metrics.collect()[('db_queries_total', (('route', 'x'),))], 6)
+
+    def test_token(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 401)
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer scrape')
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
+
+    def test_staff_only_without_token(self):
+        with self.settings(METRICS={'DIRECTORY': self.directory}):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, 401)
+            self.assertEqual(APIClient().get(reverse('metrics')).status_code, 401)
+            self.user.is_staff = True
+            self.user.save()
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
+
+
+class RequestProfilingTests(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        overrides = override_settings(REQUEST_PROFILING={'DIRECTORY': self.directory, 'PROFILER': 'cprofile'})
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        cache.clear()
+        self.staff = models.User.objects.create_user(name='Staff User', email='staff@example.com',
+                                                     contact_number='9876543211', is_staff=True)
+        self.user = create_user()
+        models.UserDetails.objects.create(user=self.user)
+        self.client = authenticated_client(self.user)
+
+    def test_signed_trigger(self):
+        url = reverse('user-details')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.get(url, HTTP_X_PROFILE=profiling.make_token(self.staff, '/api/'))
+        self.assertEqual(response.status_code, 200)
+        profile = models.RequestProfile.objects.get(pk=response['X-Profile-Id'])
+        self.assertEqual((profile.route, profile.status_code, profile.requested_by), ('api/user-details', 200,
+                                                                                       self.staff))
+        # cProfile's exact counts, the flame graph from samples
+        stats = pstats.Stats(profiling.file_path(profile, 'prof')).stats
+        self.assertTrue(any(filename.endswith('views.py') for filename, _, _ in stats))
+        with open(profiling.file_path(profile, 'svg')) as file:
+            self.assertTrue(file.read().startswith('<svg'))
+
+        # not staff, another path, tampered, replayed, in the query string
+        token = profiling.make_token(self.staff)
+        for headers in ({'HTTP_X_PROFILE': profiling.make_token(self.user)},
+                        {'HTTP_X_PROFILE': profiling.make_token(self.staff, '/admin/')},
+                        {'HTTP_X_PROFILE': profiling.make_token(self.staff) + 'x'},
+                        {'HTTP_X_PROFILE': response.request['HTTP_X_PROFILE']},
+                        {'QUERY_STRING': f'profile={token}'}):
+            response = self.client.get(url, **headers)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(models.RequestProfile.objects.count(), 1)
+
+    @override_settings(ROOT_URLCONF='bharatBackend_proj.asgi_urls')
+    async def test_async_request(self):
+        access = (await sync_to_async(get_tokens_for_user)(self.user))['access']
+        headers = {'Authorization': f'Bearer {access}', 'X-Profile': profiling.make_token(self.staff)}
+        response = await AsyncClient().get('/api/user-details', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        profile = await models.RequestProfile.objects.aget(pk=response['X-Profile-Id'])
+        self.assertEqual(profile.route, 'api/user-details')
+
+    def test_failed_save_keeps_the_response(self):
+        with mock.patch.object(profiling, 'save', side_effect=FileNotFoundError), \
+                self.assertLogs('api.profiling', 'ERROR'):
+            response = self.client.get(reverse('user-details'), HTTP_X_PROFILE=profiling.make_token(self.staff))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Profile-Id', response)
+
+    def test_prune_tolerates_files_removed_meanwhile(self):
+        stale = os.path.join(self.directory, 'gone.svg')
+        open(stale, 'w').close()
+        os.utime(stale, (0, 0))
+        with mock.patch.object(profiling.os, 'remove', side_effect=FileNotFoundError):
+            profiling.prune()
+
+    def test_profiles_are_pruned(self):
+        with self.settings(REQUEST_PROFILING={'DIRECTORY': self.directory, 'PROFILER': 'cprofile', 'MAX_PROFILES': 2}):
+            with self.captureOnCommitCallbacks(execute=True):
+                first = self.client.get(reverse('user-details'),
+                                        HTTP_X_PROFILE=profiling.make_token(self.staff))['X-Profile-Id']
+            for _ in range(2):
+                with self.captureOnCommitCallbacks(execute=True):
+                    self.client.get(reverse('user-details'), HTTP_X_PROFILE=profiling.make_token(self.staff))
+        self.assertEqual(models.RequestProfile.objects.count(), 2)
+        self.assertFalse(models.RequestProfile.objects.filter(pk=first).exists())
+        self.assertEqual(len(os.listdir(self.directory)), 6)
+
+    def test_sampler(self):
+        def busy():
+            deadline = time.perf_counter() + 0.05
+            while time.perf_counter() < deadline:
+                pass
+
+        with profiling.Sampler(0.001) as sampler:
+            busy()
+        busy_samples = sum(count for stack, count in sampler.stacks.items() if stack[-1].startswith('busy '))
+        self.assertGreater(busy_samples, sampler.samples / 2)
+
+    def test_admin_lists_profiles(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.get(reverse('user-details'), HTTP_X_PROFILE=profiling.make_token(self.staff))
+        pk = response['X-Profile-Id']
+        self.staff.is_superuser = True
+        self.staff.save()
+        admin = self.client_class()
+        admin.force_login(self.staff)
+        self.assertContains(admin.get(reverse('admin:api_requestprofile_changelist')), '/api/user-details')
+        response = admin.get(reverse('admin:api_requestprofile_file', args=[pk, 'svg']))
+        self.assertEqual(response['Content-Type'], 'image/svg+xml')
@@ -0,0 +1,216 @@
+import hashlib
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+DEFAULTS = {
+    'CACHE_ALIAS': 'default',
+    'KEY_PREFIX': 'throttle',
+    'POLICIES': {},
+}
+
+DURATIONS = {'s': 1, 'sec': 1, 'm': 60, 'min': 60, 'h': 3600, 'hour': 3600, 'd': 86400, 'day': 86400}
+
+
+_compiled = {}
+
+
+def throttle_settings():
+    return {**DEFAULTS, **getattr(settings, 'THROTTLES', {})}
+
+
+@receiver(setting_changed)
+def _reset_compiled(setting, **kwargs):
+    if setting == 'THROTTLES':
+        _compiled.clear()
+
+
+def compiled_settings():
+    """(cache alias, key prefix, {scope: [(key, limit, window)]}), parsed once instead of on every request"""
+    if not _compiled:
+        conf = throttle_settings()
+        policies = {scope: [(policy['KEY'], *parse_rate(policy['RATE'])) for policy in scope_policies]
+                    for scope, scope_policies in conf['POLICIES'].items()}
+        _compiled['value'] = (conf['CACHE_ALIAS'], conf['KEY_PREFIX'], policies)
+    return _compiled['value']
+
+
+def parse_rate(rate):
+    """'5/min' -> (5, 60)"""
+    count, _, period = rate.partition('/')
+    return int(count), DURATIONS[period]
+
+
+def _ident(request, key):
+    """the value a policy counts by, None when the request has none (then the policy is skipped)"""
+    if key == 'ip':
+        # X-Forwarded-For is whatever the client sent unless NUM_PROXIES says how many hops to trust
+        if api_settings.NUM_PROXIES is None:
+            ident = request.META.get('REMOTE_ADDR')
+        else:
+            ident = BaseThrottle().get_ident(request)
+        return _digest(ident) if ident else None
+    if key == 'user':
+        user = getattr(request, 'user', None)
+        return user.pk if user is not None and user.is_authenticated else None
+    if key == 'email':
+        data = getattr(request, 'data', None)
+        if data is None:
+            # plain django request of an async view, see AsyncAPIView.dispatch
+            data = getattr(request, 'throttle_data', request.POST)
+        email = data.get('email') if hasattr(data, 'get') else None
+        if not isinstance(email, str) or not email.strip():
+            return None
+        return _digest(email.strip().lower())
+    raise ValueError(f'unknown throttle key {key!r}')
+
+
+def _digest(value):
+    # hashed, arbitrary client input doesn't make a valid cache key
+    return hashlib.blake2b(value.encode(), digest_size=12).hexdigest()
+
+
+class SlidingWindow:
+    """
+    Sliding window counter: the previous fixed window's count, weighted by how
+    much of it still overlaps the sliding window, plus the current one's. Two
+    cache keys per identity, whatever the rate.
+    """
+
+    def __init__(self, key, limit, window, now):
+        index, offset = divmod(now, window)
+        index = int(index)
+        self.limit = limit
+        self.window = window
+        self.elapsed = offset / window
+        self.current_key = f'{key}:{index}'
+        self.previous_key = f'{key}:{index - 1}'
+
+    def estimate(self, counts):
+        self.previous = counts.get(self.previous_key, 0)
+        self.current = counts.get(self.current_key, 0)
+        return self.previous * (1 - self.elapsed) + self.current
+
+    def retry_after(self):
+        """seconds until one more request fits"""
+        if self.current >= self.limit or not self.previous:
+            return math.ceil((1 - self.elapsed) * self.window)
+        fits_at = 1 - (self.limit - 1 - self.current) / self.previous
+        return max(1, math.ceil((fits_at - self.elapsed) * self.window))
+
+
+class Limiter:
+    """checks every policy of a scope with one cache read, and only counts requests that are let through"""
+
+    def __init__(self, scope):
+        self.scope = scope
+
+    def windows(self, request, now):
+        _, prefix, policies = compiled_settings()
+        windows = []
+        for key, limit, window in policies.get(self.scope, ()):
+            ident = _ident(request, key)
+            if ident is not None:
+                windows.append(SlidingWindow(f'{prefix}:{self.scope}:{key}:{ident}', limit, window, now))
+        return windows
+
+    @staticmethod
+    def _keys(windows):
+        return [key for window in windows for key in (window.current_key, window.previous_key)]
+
+    @staticmethod
+    def _blocked(windows, counts):
+        waits = [window.retry_after() for window in windows if window.estimate(counts) >= window.limit]
+        return max(waits) if waits else None
+
+    @staticmethod
+    def _counted(windows, counts, values):
+        """counts as they were before this request, given what counting it returned"""
+        return {**counts, **{window.current_key: value - 1 for window, value in zip(windows, values)}}
+
+    def hit(self, request, now=None):
+        """count the request, or return the seconds to wait when any policy is exhausted"""
+        windows = self.windows(request, time.time() if now is None else now)
+        if not windows:
+            return None
+        # looked up per call, cache connections are per thread
+        cache = caches[compiled_settings()[0]]
+        counts = cache.get_many(self._keys(windows))
+        wait = self._blocked(windows, counts)
+        if wait is not None:
+            return wait
+        # count first and check what the increments returned, so parallel requests can't all
+        # pass the read above; a request that turns out to be over the limit is uncounted
+        values = [self._count(cache, window) for window in windows]
+        wait = self._blocked(windows, self._counted(windows, counts, values))
+        if wait is not None:
+            for window in windows:
+                try:
+                    cache.decr(window.current_key)
+                except ValueError:
+                    pass
+        return wait
+
+    @staticmethod
+    def _count(cache, window):
+        # keys outlive their own window so they can still be the next one's `previous`
+        while not cache.add(window.current_key, 1, window.window * 2):
+            try:
+                return cache.incr(window.current_key)
+            except ValueError:
+                # expired between the add and the incr
+                pass
+        return 1
+
+    async def ahit(self, request, now=None):
+        windows = self.windows(request, time.time() if now is None else now)
+        if not windows:
+            return None
+        # looked up per call, cache connections are per thread
+        cache = caches[compiled_settings()[0]]
+        counts = await cache.aget_many(self._keys(windows))
+        wait = self._blocked(windows, counts)
+        if wait is not None:
+            return wait
+        values = [await self._acount(cache, window) for window in windows]
+        wait = self._blocked(windows, self._counted(windows, counts, values))
+        if wait is not None:
+            for window in windows:
+                try:
+                    await cache.adecr(window.current_key)
+                except ValueError:
+                    pass
+        return wait
+
+    @staticmethod
+    async def _acount(cache, window):
+        while not await cache.aadd(window.current_key, 1, window.window * 2):
+            try:
+                return await cache.aincr(window.current_key)
+            except ValueError:
+                pass
+        return 1
+
+
+class SlidingWindowThrottle(BaseThrottle):
+    """
+    DRF throttle for the policies of the view's `throttle_scope` in
+    THROTTLES['POLICIES']. DRF runs throttles in `initial()`, before the handler,
+    so a rejected request costs one cache read and no serializer or ORM work.
+    """
+
+    def allow_request(self, request, view):
+        scope = getattr(view, 'throttle_scope', None)
+        if scope is None:
+            return True
+        self.wait_seconds = Limiter(scope).hit(request)
+        return self.wait_seconds is None
+
+    def wait(self):
+        return self.wait_seconds
@@ -0,0 +1,166 @@
+import hashlib
+import math
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework_simplejwt import serializers as jwt_serializers
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.utils import aware_utcnow
+
+DEFAULTS = {
+    'CAPACITY': 100000,         # blacklisted jtis before the filter is rebuilt bigger
+    'ERROR_RATE': 0.001,        # share of clean tokens that still fall through to the database
+    'SYNC_INTERVAL': 2,         # seconds, how long another process' blacklist entry can go unseen
+    'SYNC_BATCH_SIZE': 5000,
+}
+
+
+# blacklisted_at is set on insert, not on commit: rows this recent are read again on every sync
+SYNC_OVERLAP = timedelta(seconds=60)
+
+
+def blacklist_filter_settings():
+    return {**DEFAULTS, **getattr(settings, 'TOKEN_BLACKLIST_FILTER', {})}
+
+
+class BloomFilter:
+    """fixed size bloom filter over strings, sized for `capacity` items at `error_rate`"""
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = max(int(capacity), 1)
+        self.size = max(int(-self.capacity * math.log(error_rate) / (math.log(2) ** 2)), 8)
+        self.hashes = max(int(round(self.size / self.capacity * math.log(2))), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class BlacklistIndex:
+    """
+    In-memory bloom filter of blacklisted refresh token jtis. A jti that is not in
+    the filter is definitely not blacklisted, so only possible hits go to the
+    database. New rows are picked up incrementally, at most once every
+    SYNC_INTERVAL seconds, by primary key above a watermark that trails the
+    newest row by SYNC_OVERLAP: auto-increment ids are handed out on insert, so
+    a row can commit after rows with higher ids.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.bloom = None
+        self.watermark = 0      # every row with an id up to this one is in the filter
+        self.recent = set()     # ids above the watermark that are in the filter
+        self.synced_at = 0.0
+
+    def _add_rows(self, rows, bloom, recent, watermark):
+        """add the unseen (id, jti, blacklisted_at) rows, returns the advanced watermark"""
+        settled = timezone.now() - SYNC_OVERLAP
+        for pk, jti, blacklisted_at in rows:
+            if pk not in recent:
+                bloom.add(jti)
+                recent.add(pk)
+            # a lower id was handed out earlier still, its transaction has ended by now
+            if blacklisted_at < settled:
+                watermark = max(watermark, pk)
+        return watermark
+
+    def rebuild(self):
+        conf = blacklist_filter_settings()
+        live = BlacklistedToken.objects.filter(token__expires_at__gt=aware_utcnow())
+        bloom = BloomFilter(max(conf['CAPACITY'], live.count() * 2), conf['ERROR_RATE'])
+        recent = set()
+        watermark = self._add_rows(live.values_list('id', 'token__jti', 'blacklisted_at').iterator(),
+                                   bloom, recent, 0)
+        with self._lock:
+            self.bloom, self.watermark, self.synced_at = bloom, watermark, time.monotonic()
+            self.recent = {pk for pk in recent if pk > watermark}
+
+    def sync(self, force=False):
+        conf = blacklist_filter_settings()
+        if self.bloom is None:
+            return self.rebuild()
+        if not force and time.monotonic() - self.synced_at < conf['SYNC_INTERVAL']:
+            return
+        cursor = self.watermark
+        while True:
+            rows = list(BlacklistedToken.objects.filter(id__gt=cursor).order_by('id')
+                        .values_list('id', 'token__jti', 'blacklisted_at')[:conf['SYNC_BATCH_SIZE']])
+            with self._lock:
+                self.watermark = self._add_rows(rows, self.bloom, self.recent, self.watermark)
+                self.recent = {pk for pk in self.recent if pk > self.watermark}
+                self.synced_at = time.monotonic()
+            if self.bloom.count > self.bloom.capacity:
+                return self.rebuild()
+            if len(rows) < conf['SYNC_BATCH_SIZE']:
+                return
+            cursor = rows[-1][0]
+
+    def add(self, jti):
+        if self.bloom is not None:
+            with self._lock:
+                self.bloom.add(jti)
+
+    def might_contain(self, jti):
+        self.sync()
+        return jti in self.bloom
+
+
+blacklist_index = BlacklistIndex()
+
+
+class FilteredRefreshToken(RefreshToken):
+    """refresh token that consults the blacklist filter before the database"""
+
+    def check_blacklist(self):
+        if blacklist_index.might_contain(self.payload[api_settings.JTI_CLAIM]):
+            super().check_blacklist()
+
+    def blacklist(self):
+        result = super().blacklist()
+        blacklist_index.add(self.payload[api_settings.JTI_CLAIM])
+        return result
+
+
+class TokenRefreshSerializer(jwt_serializers.TokenRefreshSerializer):
+    token_class = FilteredRefreshToken
+
+
+class TokenBlacklistSerializer(jwt_serializers.TokenBlacklistSerializer):
+    token_class = FilteredRefreshToken
+
+
+def purge_expired_tokens(batch_size=1000, pause=0.0):
+    """
+    Delete expired outstanding tokens (and their blacklist rows) in batches of
+    `batch_size`, so no single statement locks a large part of the tables.
+    Returns the number of outstanding tokens removed.
+    """
+    removed = 0
+    while True:
+        ids = list(OutstandingToken.objects.filter(expires_at__lte=aware_utcnow())
+                   .order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return removed
+        BlacklistedToken.objects.filter(token_id__in=ids).delete()
+        OutstandingToken.objects.filter(id__in=ids).delete()
+        removed += len(ids)
+        if pause:
+            time.sleep(pause)
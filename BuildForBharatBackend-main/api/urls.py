@@ -1,25 +1,60 @@
 from rest_framework_simplejwt import views as jwt_views
 from django.urls import path
 from . import views
+from . import tokens
 
 urlpatterns = [
     # """ Authentication """,
-    path('register', views.UserRegisterView.as_view()),
-    path('login', views.UserLoginView.as_view()),
-    path('token/refresh', jwt_views.TokenRefreshView.as_view()),
-    path('verify/otp', views.VerifyOTP.as_view()),
-    path('logout', jwt_views.TokenBlacklistView.as_view()),
+    path('register', views.UserRegisterView.as_view(), name='register'),
+    path('login', views.UserLoginView.as_view(), name='login'),
+    path('token/refresh', jwt_views.TokenRefreshView.as_view(serializer_class=tokens.TokenRefreshSerializer),
+         name='token-refresh'),
+    path('verify/otp', views.VerifyOTP.as_view(), name='verify-otp'),
+    path('logout', jwt_views.TokenBlacklistView.as_view(serializer_class=tokens.TokenBlacklistSerializer),
+         name='logout'),
 
     # """ Seller Registration """,
-    path('upload/gst-certificate', views.UploadGSTCertificateView.as_view()),
-    path('update/gst-details', views.UpdateGSTDetailsView.as_view()),
-    path('update/business-profile', views.UpdateBusinessView.as_view()),
+    path('upload/gst-certificate', views.UploadGSTCertificateView.as_view(), name='upload-gst-certificate'),
+    path('update/gst-details', views.UpdateGSTDetailsView.as_view(), name='update-gst-details'),
+    path('update/business-profile', views.UpdateBusinessView.as_view(), name='update-business-profile'),
+    path('import/sellers', views.SellerImportView.as_view(), name='import-sellers'),
 
     # """ Payment Details """
-    path('create/bank-details', views.BankDetailsView.as_view()),
+    path('create/bank-details', views.BankDetailsView.as_view(), name='create-bank-details'),
 
     # """ Retrieve Data """
-    path('user-details', views.UserDetailsView.as_view()),
-    path('business-details', views.GetBusinessView.as_view()),
-    path('seller-details', views.SellerDetailsView.as_view()),
+    path('user-details', views.UserDetailsView.as_view(), name='user-details'),
+    path('business-details', views.GetBusinessView.as_view(), name='business-details'),
+    path('seller-details', views.SellerDetailsView.as_view(), name='seller-details'),
+    path('directory/sellers', views.SellerDirectoryView.as_view(), name='seller-directory'),
+    path('search/sellers', views.SellerSearchView.as_view(), name='seller-search'),
+    path('status/db-pool', views.DatabasePoolView.as_view(), name='db-pool-status'),
+    path('home', views.HomeView.as_view(), name='home'),
 ]
+
+# maximum number of queries per request, with cold caches and the transaction.on_commit() callbacks
+# (seller profile and search index refreshes, email dispatch) counted, by url name. enforced by the test suite and
+# by api.queryinspector.QueryInspectorMiddleware
+query_budgets = {
+    'register': 16,
+    'login': 3,
+    # simplejwt's rotation: the user three times, and get_or_create of the old and the new token
+    'token-refresh': 14,
+    'verify-otp': 8,
+    # including the first load of the blacklist filter
+    'logout': 8,
+    # including the reservation of a new block of seller ids
+    'upload-gst-certificate': 24,
+    'update-gst-details': 12,
+    'update-business-profile': 19,
+    # per chunk, not per row
+    'import-sellers': 15,
+    'create-bank-details': 9,
+    'user-details': 2,
+    'business-details': 2,
+    'seller-details': 2,
+    'seller-directory': 2,
+    'seller-search': 4,
+    'db-pool-status': 1,
+    'home': 1,
+}
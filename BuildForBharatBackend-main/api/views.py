@@ -5,12 +5,26 @@ from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework.response import Response
 from rest_framework import status
 from django.contrib.auth import authenticate
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.http import Http404
 from django.shortcuts import get_object_or_404
+from . import bulkimport
+from . import gstin
+from . import ifsc
 from . import models
-from .util import generate_unique_id
+from . import otp as otp_store
+from . import readmodel
+from . import responsecache
+from . import search
+from .db import pool
+from .imaging import schedule_variants
+from .sellerids import next_seller_id
 from .mailservice import SendMail
+from .pagination import keyset_page
 from . import serializers
 from .renderers import UserRenderer
+from .throttling import SlidingWindowThrottle
 
 mail = SendMail()
 
@@ -27,6 +41,8 @@ def get_tokens_for_user(user):
 class UserRegisterView(generics.CreateAPIView):
     serializer_class = serializers.UserRegisterSerializer
     permission_classes = [permissions.AllowAny]
+    throttle_classes = [SlidingWindowThrottle]
+    throttle_scope = 'register'
 
     def post(self, request, *args, **kwargs):
         serializer = serializers.UserRegisterSerializer(data=request.data)
@@ -44,6 +60,8 @@ class UserRegisterView(generics.CreateAPIView):
 class UserLoginView(generics.CreateAPIView):
     serializer_class = serializers.UserLoginSerializer
     permission_classes = [permissions.AllowAny]
+    throttle_classes = [SlidingWindowThrottle]
+    throttle_scope = 'login'
 
     def post(self, request, *args, **kwargs):
         serializer = serializers.UserLoginSerializer(data=request.data)
@@ -52,9 +70,9 @@ class UserLoginView(generics.CreateAPIView):
             for key, value in dict(serializer.errors).items():
                 messages[key] = value[0]
             return Response(data={'messages': messages, 'status': {'msg': 'failed', 'code': 220}})
-        username = serializer.data.get('username')
-        password = serializer.data.get('password')
-        user = authenticate(username=username, password=password)
+        email = serializer.validated_data.get('email')
+        password = serializer.validated_data.get('password')
+        user = authenticate(username=email, password=password)
         if user is not None:
             token = get_tokens_for_user(user)
             return Response(
@@ -67,39 +85,31 @@ class UserLoginView(generics.CreateAPIView):
 
 class VerifyOTP(generics.CreateAPIView):
     permission_classes = [permissions.IsAuthenticated]
+    throttle_classes = [SlidingWindowThrottle]
+    throttle_scope = 'verify-otp'
 
     def post(self, request, *args, **kwargs):
         of = request.data.get('of')
         otp = request.data.get('otp')
 
-        user = get_object_or_404(models.User, id=request.user.id)
         if otp is None or otp == "":
             return Response(data={'message': 'Enter otp.', 'status': {'code': 220, 'msg': 'failed'}})
         if of is None or of == "":
             return Response(
                 data={'message': 'Submit which otp should verify.', 'status': {'code': 220, 'msg': 'failed'}})
-        if of == "gst":
-            if user.user_gst.otp != otp:
-                return Response(data={'message': 'Enter correct otp.', 'status': {'code': 220, 'msg': 'failed'}})
-            user.user_gst.is_otp_used = True
-            user.user_gst.gst_verified = True
-            user.user_gst.save()
-        else:
-            if user.user_otp_verification.otp != otp:
-                return Response(data={'message': 'Enter correct otp.', 'status': {'code': 220, 'msg': 'failed'}})
-            user.user_otp_verification.is_otp_used = True
-            user.email_verified = True
-            user.save()
-            user.user_otp_verification.save()
+        purpose = of if of in otp_store.PURPOSES else 'email'
+        if not otp_store.verify(purpose, request.user.id, str(otp).strip()):
+            return Response(data={'message': 'Enter correct otp.', 'status': {'code': 220, 'msg': 'failed'}})
         return Response(data={'message': 'Successfully OTP verified.', 'status': {'code': 200, 'msg': 'success'}})
 
 
 class UserDetailsView(generics.RetrieveAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
+    @responsecache.per_user('user-details')
     def get(self, request, *args, **kwargs):
-        serializer = serializers.UserSerializer(request.user, many=False)
-        return Response(data={'user': serializer.data, 'message': 'Successfully retrieved.',
+        profile = readmodel.get_profile(request.user.id)
+        return Response(data={'user': profile['user'], 'message': 'Successfully retrieved.',
                               'status': {'code': 200, 'msg': 'success'}})
 
 
@@ -111,9 +121,14 @@ class UploadGSTCertificateView(generics.CreateAPIView):
         if gst_certificate is None:
             return Response(
                 data={'message': 'Select GST certificate to upload.', 'status': {'code': 230, 'msg': 'failed'}})
-        seller_id = f'{generate_unique_id(10)}U{request.user.id}'
-        models.SellerGST.objects.get_or_create(user_id=request.user.id, seller_id=seller_id,
-                                               certificate=gst_certificate)
+        user_id = request.user.id
+        # the seller id is only allocated when the row is actually created
+        seller_gst, created = models.SellerGST.objects.get_or_create(
+            user_id=user_id, defaults={'seller_id': lambda: next_seller_id(user_id), 'certificate': gst_certificate})
+        if not created:
+            seller_gst.certificate = gst_certificate
+            seller_gst.save(update_fields=['certificate', 'updated_on'])
+        schedule_variants(seller_gst, 'certificate')
         return Response(
             data={'message': 'Successfully certificate uploaded.', 'status': {'code': 200, 'msg': 'success'}})
 
@@ -128,21 +143,37 @@ class UpdateGSTDetailsView(generics.CreateAPIView):
         legal_name = request.data.get('legal-name')
         business_address = request.data.get('business_address')
 
-        if trade_name is None or trade_name == "" or gst_no is None or gst_no == "" or gst_type is None or gst_type == "" or legal_name is None or legal_name == "" or business_address is None or business_address != "":
+        if gst_no is None or gst_no == "" or gst_type is None or gst_type == "" or business_address is None or business_address == "":
+            return Response(data={'message': 'Enter all details.', 'status': {'code': 230, 'msg': 'failed'}})
+        try:
+            gst_no = gstin.validate(gst_no)
+        except ValidationError as exc:
+            return Response(data={'message': exc.messages[0], 'status': {'code': 230, 'msg': 'failed'}})
+
+        # a listed, active GSTIN is verified from the local registry snapshot and names its holder
+        registered = gstin.lookup(gst_no)
+        if registered is not None and registered['status'] != gstin.STATUS_ACTIVE:
+            return Response(data={'message': f'GST number is {registered["status"].lower()}.',
+                                  'status': {'code': 230, 'msg': 'failed'}})
+        if registered is not None:
+            legal_name = registered['legal_name'] or legal_name
+            trade_name = registered['trade_name'] or trade_name
+        if trade_name is None or trade_name == "" or legal_name is None or legal_name == "":
             return Response(data={'message': 'Enter all details.', 'status': {'code': 230, 'msg': 'failed'}})
 
-        seller_gst = get_object_or_404(models.SellerGST, user=request.user)
-        seller_gst.trade_name = trade_name
-        seller_gst.gst_no = gst_no
-        seller_gst.gst_type = gst_type
-        seller_gst.legal_name = legal_name
-        seller_gst.business_address = business_address
-        seller_gst.save()
-
-        otp = mail.generate_otp()
-        seller_gst.gst_otp = otp
+        with transaction.atomic():
+            seller_gst = get_object_or_404(models.SellerGST, user=request.user)
+            seller_gst.trade_name = trade_name
+            seller_gst.gst_number = gst_no
+            seller_gst.gst_type = gst_type
+            seller_gst.legal_name = legal_name
+            seller_gst.business_address = business_address
+            seller_gst.gst_verified = registered is not None
+            seller_gst.save()
 
-        mail.send_otp(request.user, otp, "gst")
+            if registered is None:
+                otp = otp_store.issue('gst', request.user.id)
+                mail.send_otp(request.user, otp, "gst")
 
         serializer = serializers.SellerGSTDetailsSerializer(seller_gst, many=False)
         return Response(data={'seller_gst': serializer.data, 'message': 'Successfully retrieved.',
@@ -152,19 +183,24 @@ class UpdateGSTDetailsView(generics.CreateAPIView):
 class SellerDetailsView(generics.RetrieveAPIView):
     permission_classes = [permissions.IsAuthenticated, ]
 
+    @responsecache.per_user('seller-details')
     def get(self, request, *args, **kwargs):
-        serializer = serializers.SellerGSTDetailsSerializer(request.user.user_gst, many=False)
-        return Response(data={'seller_gst': serializer.data, 'message': 'Successfully retrieved.',
+        profile = readmodel.get_profile(request.user.id)
+        if profile['seller_gst'] is None:
+            raise Http404
+        return Response(data={'seller_gst': profile['seller_gst'], 'message': 'Successfully retrieved.',
                               'status': {'code': 200, 'msg': 'success'}})
 
 
 class GetBusinessView(generics.ListCreateAPIView):
     permission_classes = [permissions.IsAuthenticated, ]
 
+    @responsecache.per_user('business-details')
     def get(self, request, *args, **kwargs):
-        user_business = get_object_or_404(models.Business, user=request.user)
-        serializer = serializers.BusinessSerializer(user_business, many=False)
-        return Response(data={'business': serializer.data, 'message': 'Successfully retrieved.',
+        profile = readmodel.get_profile(request.user.id)
+        if profile['business'] is None:
+            raise Http404
+        return Response(data={'business': profile['business'], 'message': 'Successfully retrieved.',
                               'status': {'code': 200, 'msg': 'success'}})
 
 
@@ -178,8 +214,10 @@ class UpdateBusinessView(generics.ListCreateAPIView):
 
         if int(upload_file) == 1:
             pic = request.FILES.get('profile-pic')
-            business = models.Business.update_or_create(user_id=request.user.id,
-                                                        defaults={'profile_pic': pic})
+            business, created = models.Business.objects.update_or_create(user_id=request.user.id,
+                                                                         defaults={'profile_pic': pic})
+            if business.profile_pic:
+                schedule_variants(business, 'profile_pic')
             return Response(data={'message': 'Successfully retrieved.', 'status': {'code': 200, 'msg': 'success'}})
         else:
             name = request.data.get('business-name')
@@ -188,12 +226,12 @@ class UpdateBusinessView(generics.ListCreateAPIView):
             contact_number = request.data.get('business-contact_number')
             shipping_method = request.data.get('business-shipping_method')
 
-            business = models.Business.update_or_create(user_id=request.user.id,
-                                                        defaults={'name': name,
-                                                                  'address': address,
-                                                                  'email_address': email,
-                                                                  'phone_number': contact_number,
-                                                                  'shipping_method': shipping_method})
+            business, created = models.Business.objects.update_or_create(user_id=request.user.id,
+                                                                         defaults={'name': name,
+                                                                                   'address': address,
+                                                                                   'email_address': email,
+                                                                                   'phone_number': contact_number,
+                                                                                   'shipping_method': shipping_method})
             serializer = serializers.BusinessSerializer(business, many=False)
             return Response(data={'business': serializer.data, 'message': 'Successfully retrieved.',
                                   'status': {'code': 200, 'msg': 'success'}})
@@ -203,18 +241,20 @@ class BankDetailsView(generics.CreateAPIView):
     permission_classes = [permissions.IsAuthenticated, ]
 
     def post(self, request, *args, **kwargs):
-        if not models.Business.objects.filter(user_id=request.user.id).exists():
+        user_business = models.Business.objects.filter(user_id=request.user.id).only('id', 'user_id').first()
+        if user_business is None:
             return Response(
                 data={'message': 'First create your business profile.', 'status': {'code': 230, 'msg': 'failed'}})
 
         acc_holder_name = request.data.get('acc-holder-name')
         acc_number = request.data.get('acc-number')
-        ifsc = request.data.get('ifsc')
-
-        user_business = get_object_or_404(models.Business, user=request.user)
+        try:
+            ifsc_code = ifsc.validate(request.data.get('ifsc'))
+        except ValidationError as exc:
+            return Response(data={'message': exc.messages[0], 'status': {'code': 230, 'msg': 'failed'}})
 
-        bank_details = models.BanksDetails.objects.create(business_id=user_business.id, acc_holder_name=acc_holder_name,
-                                                          acc_number=acc_number, ifsc=ifsc)
+        bank_details = models.BanksDetails.objects.create(business=user_business, acc_holder_name=acc_holder_name,
+                                                          acc_number=acc_number, ifsc=ifsc_code)
         serializer = serializers.BankDetailsSerializer(bank_details, many=False)
         return Response(data={'bank': serializer.data, 'message': 'Successfully created.',
                               'status': {'code': 200, 'msg': 'success'}})
@@ -226,3 +266,100 @@ class HomeView(generics.RetrieveAPIView):
     def get(self, request, *args, **kwargs):
         return Response(data={'message': 'You are authenticated', 'username': request.user.username},
                         status=status.HTTP_200_OK)
+
+
+class SellerImportView(APIView):
+    """bulk seller onboarding for staff, the same import as `manage.py import_sellers`"""
+    permission_classes = [permissions.IsAdminUser]
+
+    def post(self, request, *args, **kwargs):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response(data={'message': 'Select a CSV or NDJSON file to import.',
+                                  'status': {'code': 230, 'msg': 'failed'}})
+        file_format = request.data.get('format') or (
+            'ndjson' if upload.name.endswith(('.ndjson', '.jsonl')) else 'csv')
+        if file_format not in ('csv', 'ndjson'):
+            return Response(data={'message': 'Format must be csv or ndjson.', 'status': {'code': 230, 'msg': 'failed'}})
+        try:
+            chunk_size = min(max(int(request.data.get('chunk-size') or 500), 1), 5000)
+        except ValueError:
+            chunk_size = 500
+
+        errors = []
+
+        def report(line_number, row_errors):
+            if len(errors) < bulkimport.MAX_REPORTED_ERRORS:
+                errors.append({'line': line_number, 'errors': row_errors})
+
+        upload.open('rb')
+        result = bulkimport.import_sellers(bulkimport.read_rows(upload.file, file_format), chunk_size=chunk_size,
+                                           report=report)
+        return Response(data={'result': result.as_dict(), 'errors': errors,
+                              'message': 'Import finished.', 'status': {'code': 200, 'msg': 'success'}})
+
+
+class SellerDirectoryView(APIView):
+    """
+    read-only seller directory for ops tools, keyset paginated on (created_on, id)
+    so every page costs the same as the first one
+    """
+    permission_classes = [permissions.IsAdminUser]
+    columns = {
+        'id': 'id', 'seller_id': 'seller_id', 'gst_number': 'gst_number', 'gst_type': 'gst_type',
+        'legal_name': 'legal_name', 'trade_name': 'trade_name', 'gst_verified': 'gst_verified',
+        'created_on': 'created_on', 'user_id': 'user_id', 'name': 'user__name', 'email': 'user__email',
+        'is_seller': 'user__user_details__is_seller', 'business_name': 'user__user_business__name',
+        'store_name': 'user__user_business__store_name',
+    }
+    booleans = {'true': True, '1': True, 'false': False, '0': False}
+
+    def get(self, request, *args, **kwargs):
+        params = request.query_params
+        filters = {}
+        for param, lookup in (('gst-verified', 'gst_verified'), ('is-seller', 'user__user_details__is_seller')):
+            if params.get(param):
+                if params[param].lower() not in self.booleans:
+                    return Response(data={'message': f'{param} must be true or false.',
+                                          'status': {'code': 230, 'msg': 'failed'}})
+                filters[lookup] = self.booleans[params[param].lower()]
+        if params.get('gst-type'):
+            filters['gst_type'] = params['gst-type']
+        try:
+            page_size = min(max(int(params.get('page-size') or 50), 1), 200)
+        except ValueError:
+            page_size = 50
+
+        queryset = models.SellerGST.objects.filter(**filters).values(*self.columns.values())
+        try:
+            rows, next_cursor = keyset_page(queryset, params.get('cursor'), page_size)
+        except ValidationError as exc:
+            return Response(data={'message': exc.messages[0], 'status': {'code': 230, 'msg': 'failed'}})
+        sellers = [{name: row[column] for name, column in self.columns.items()} for row in rows]
+        return Response(data={'sellers': sellers, 'next': next_cursor, 'message': 'Successfully retrieved.',
+                              'status': {'code': 200, 'msg': 'success'}})
+
+
+class SellerSearchView(APIView):
+    """typeahead search over trade, legal, business and store names for support staff"""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response(data={'message': 'Enter a name to search for.', 'status': {'code': 230, 'msg': 'failed'}})
+        try:
+            limit = max(int(request.query_params.get('limit') or 0), 0)
+        except ValueError:
+            limit = 0
+        return Response(data={'sellers': search.search_sellers(query, limit), 'message': 'Successfully retrieved.',
+                              'status': {'code': 200, 'msg': 'success'}})
+
+
+class DatabasePoolView(APIView):
+    """connection pool gauges of the worker process that serves the request"""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return Response(data={'pools': pool.stats(), 'message': 'Successfully retrieved.',
+                              'status': {'code': 200, 'msg': 'success'}})
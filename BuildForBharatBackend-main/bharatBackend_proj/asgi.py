@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bharatBackend_proj.settings')
+# async views for the routes listed in api/async_urls.py
+os.environ.setdefault('BHARAT_ROOT_URLCONF', 'bharatBackend_proj.asgi_urls')
 
 application = get_asgi_application()
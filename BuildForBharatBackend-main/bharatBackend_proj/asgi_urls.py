@@ -0,0 +1,13 @@
+"""
+URL configuration used by the ASGI application (see asgi.py).
+
+Routes from api/async_urls.py take precedence over the sync views registered
+under the same paths; everything else falls through to urls.py.
+"""
+from django.urls import include, path
+
+from .urls import urlpatterns as sync_urlpatterns
+
+urlpatterns = [
+    path('api/', include('api.async_urls')),
+] + sync_urlpatterns
@@ -44,6 +44,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
+    'api.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -51,9 +53,45 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.replicas.ReplicaMiddleware',
+    'api.queryinspector.QueryInspectorMiddleware',
 ]
 
-ROOT_URLCONF = 'bharatBackend_proj.urls'
+# request latency, in-flight, database, email and password hashing metrics, served at /metrics in the
+# Prometheus text format, see api/metrics.py. every worker process writes its own memory-mapped files
+# under DIRECTORY, which all workers must share. a scrape folds the files of exited threads and workers
+# into one total, api.metrics.clear() resets everything. without TOKEN only staff users can read /metrics
+METRICS = {
+    'ENABLED': True,
+    # 'DIRECTORY': '/run/bharat/metrics',        # defaults to $METRICS_DIR or <tmp>/bharat-metrics
+    'TOKEN': os.environ.get('METRICS_TOKEN'),      # scrapers send `Authorization: Bearer <token>`
+}
+
+# on-demand profiling of single requests, triggered by a token from `manage.py profile_token` sent in the
+# X-Profile header, see api/profiling.py. a token profiles one request within MAX_AGE seconds; with more
+# than one worker process CACHE_ALIAS has to be a shared cache (redis / memcached), or a token could be
+# replayed once per worker. the collapsed stacks and flamegraphs are kept under DIRECTORY, pruned to the
+# newest MAX_PROFILES and listed in the admin (Request Profiles)
+REQUEST_PROFILING = {
+    'ENABLED': True,
+    'PROFILER': 'sampling',                     # or 'cprofile', exact call counts at several times the cost
+    'INTERVAL': 0.002,
+    # 'DIRECTORY': '/var/lib/bharat/profiles',  # defaults to $PROFILES_DIR or <tmp>/bharat-profiles
+    'MAX_PROFILES': 100,
+    'MAX_AGE': 300,
+    'CACHE_ALIAS': 'default',
+}
+
+# per request query recording, N+1 detection and query budgets (api/urls.py), see api/queryinspector.py
+QUERY_INSPECTOR = {
+    'ENABLED': DEBUG,
+    'N_PLUS_ONE_THRESHOLD': 3,
+    'CAPTURE_STACK': True,
+    'RAISE_ON_BUDGET': DEBUG,
+}
+
+# asgi.py switches to bharatBackend_proj.asgi_urls
+ROOT_URLCONF = os.environ.get('BHARAT_ROOT_URLCONF', 'bharatBackend_proj.urls')
 
 TEMPLATES = [
     {
@@ -78,13 +116,40 @@ WSGI_APPLICATION = 'bharatBackend_proj.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.mysql',
+        # django's MySQL backend with a connection pool, see DATABASE_POOL below
+        'ENGINE': 'api.db.mysql',
         'NAME': 'bharat_backend_db',
         'USER': 'root',
         'PASSWORD': '',
         'HOST': 'localhost',
         'PORT': '3306',
     }
+    # read replicas are extra aliases listed in DATABASE_REPLICAS below, e.g.
+    # 'replica-1': {'ENGINE': 'django.db.backends.mysql', 'HOST': 'replica-1', ..., 'TEST': {'MIRROR': 'default'}},
+}
+
+DATABASE_ROUTERS = ['api.replicas.ReplicaRouter']
+
+# per process connection pool of the api.db.* engines, see api/db/pool.py. a database
+# can override any of these in its own 'POOL' entry. keep CONN_MAX_AGE at 0 so each
+# request gives its connection back to the pool when it finishes
+DATABASE_POOL = {
+    'MIN_SIZE': 2,
+    'MAX_SIZE': 20,                 # per process, keep workers * MAX_SIZE below MySQL's max_connections
+    'TIMEOUT': 5,                   # seconds to wait for a free connection before failing the request
+    'MAX_LIFETIME': 1800,           # below MySQL's wait_timeout
+    'IDLE_TIMEOUT': 300,
+    'PRE_PING': True,
+}
+
+# reads of safe requests go to a replica picked by weight; a user who wrote something
+# reads from the primary for PIN_SECONDS so they see their own writes, see api/replicas.py.
+# with more than one worker process CACHE_ALIAS has to be a shared cache (redis / memcached),
+# the pin set by the worker that handled the write must be seen by whichever serves the read
+DATABASE_REPLICAS = {
+    'REPLICAS': {},                 # alias -> weight, e.g. {'replica-1': 2, 'replica-2': 1}
+    'PIN_SECONDS': 10,              # longer than the worst expected replication lag
+    'CACHE_ALIAS': 'default',
 }
 
 # Password validation
@@ -105,13 +170,114 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+PASSWORD_HASHERS = [
+    'api.hashers.PolicyPBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+
+# password hashing work factor and the pool the async login / register views hash on, see api/hashers.py
+# changing ITERATIONS re-hashes each user's password on their next login
+PASSWORD_HASHER_POLICY = {
+    'ITERATIONS': None,             # None keeps Django's default
+    'EXECUTOR': 'thread',           # or 'process'
+    'WORKERS': 4,
+}
+
 # rest framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.CachedJWTAuthentication',
     ]
 }
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# use a shared backend (redis / memcached) in production so every worker sees the same entries
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# sliding window rate limits per endpoint scope, see api/throttling.py. KEY is what a policy
+# counts by: 'ip', 'email' (from the request body) or 'user' (authenticated user). 'ip' is REMOTE_ADDR
+# unless REST_FRAMEWORK['NUM_PROXIES'] is set to the number of proxies in front of the app, only then
+# is X-Forwarded-For trusted
+THROTTLES = {
+    'CACHE_ALIAS': 'default',
+    'POLICIES': {
+        'login': [
+            {'KEY': 'ip', 'RATE': '30/min'},
+            {'KEY': 'email', 'RATE': '10/min'},
+        ],
+        'register': [
+            {'KEY': 'ip', 'RATE': '10/hour'},
+        ],
+        'verify-otp': [
+            {'KEY': 'user', 'RATE': '10/min'},
+            {'KEY': 'ip', 'RATE': '30/min'},
+        ],
+    },
+}
+
+# sorted, memory mapped GSTIN snapshot used to verify sellers offline, see api/gstin.py.
+# built with `manage.py build_gst_registry`, a missing file just means every GSTIN goes through otp
+GST_REGISTRY = {
+    'PATH': os.path.join(BASE_DIR, 'data', 'gst_registry.bin'),
+    'CHECK_INTERVAL': 60,
+}
+
+# IFSC code -> bank, branch and city, memory mapped and shared by the workers, see api/ifsc.py.
+# built with `manage.py build_ifsc_directory`; without the file only the code format is checked
+IFSC_DIRECTORY = {
+    'PATH': os.path.join(BASE_DIR, 'data', 'ifsc_directory.bin'),
+    'CHECK_INTERVAL': 60,
+    'CACHE_SIZE': 4096,
+}
+
+# seller name search for support staff, see api/search.py. the in-memory backend keeps an index in
+# every worker (about 500 MB per million sellers); past that use 'api.search.MySQLFullTextBackend'
+# after creating its indexes with `manage.py setup_search`
+SEARCH = {
+    'BACKEND': 'api.search.InMemoryBackend',
+    'LIMIT': 20,
+    'MAX_LIMIT': 100,
+    'REFRESH_INTERVAL': 5,
+    'REBUILD_INTERVAL': 3600,
+}
+
+# one time passwords live in the cache only, see api/otp.py. with more than one worker process
+# CACHE_ALIAS has to be a shared cache (redis / memcached), a code issued by one worker must be
+# verifiable by any other
+OTP_STORE = {
+    'CACHE_ALIAS': 'default',
+    'TTL': 600,
+    'MAX_ATTEMPTS': 5,
+}
+
+# authenticated user lookups, see api/authentication.py
+AUTH_USER_CACHE = {
+    'CACHE_ALIAS': 'default',
+    'TIMEOUT': 300,
+    'LOCAL_MAXSIZE': 1024,
+    'LOCAL_TTL': 30,                # seconds another process' write may stay invisible here
+}
+
+# per user, versioned response cache with ETags for the retrieve endpoints, see api/responsecache.py.
+# versions are bumped by the model signals in api/signals.py. with more than one worker process
+# responses every other worker cached; on a per process cache bodies only live LOCAL_TIMEOUT
+# responses every other worker cached; on a per process cache entries only live LOCAL_TIMEOUT
+RESPONSE_CACHE = {
+    'CACHE_ALIAS': 'default',
+    'TIMEOUT': 3600,
+    'LOCAL_TIMEOUT': 5,
+}
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(hours=2),
     'REFRESH_TOKEN_LIFETIME': timedelta(hours=30),
@@ -144,6 +310,14 @@ SIMPLE_JWT = {
     'SLIDING_TOKEN_REFRESH_LIFETIME': timedelta(days=1),
 }
 
+# in-memory filter in front of the token_blacklist tables, see api/tokens.py
+# expired tokens are removed by `manage.py purge_tokens` (run it from cron or with --loop)
+TOKEN_BLACKLIST_FILTER = {
+    'CAPACITY': 100000,
+    'ERROR_RATE': 0.001,
+    'SYNC_INTERVAL': 2,             # seconds another process' blacklist entry may go unseen
+}
+
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = 'smtp.gmail.com'
 EMAIL_USE_TLS = True
@@ -151,6 +325,18 @@ EMAIL_PORT = 587
 EMAIL_HOST_USER = ''                # sender-email
 EMAIL_HOST_PASSWORD = ''            # sender-email-password
 
+# outbox delivery, see api/outbox.py. with DISPATCH_ON_COMMIT each process delivers its own mail
+# and retries failed sends on a timer; otherwise run `manage.py drain_outbox --loop` next to the app
+EMAIL_OUTBOX = {
+    'WORKERS': 2,                   # in-process delivery threads
+    'BATCH_SIZE': 50,
+    'MAX_ATTEMPTS': 5,
+    'BACKOFF_BASE': 30,             # seconds, doubled after every failed attempt
+    'BACKOFF_MAX': 3600,
+    'LEASE': 300,                   # seconds before an unfinished claim is retried
+    'DISPATCH_ON_COMMIT': True,     # False when a separate `manage.py drain_outbox` process delivers mail
+}
+
 # Internationalization
 # https://docs.djangoproject.com/en/4.2/topics/i18n/
 
@@ -167,6 +353,56 @@ USE_TZ = False
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media/')  # 'media' is my media folder
 MEDIA_URL = '/media/'
 
+# uploads above this size are streamed to a temporary file in chunks instead of held in memory
+FILE_UPLOAD_MAX_MEMORY_SIZE = 512 * 1024
+
+# uploads are hashed while they stream in, so the content addressed storage never reads them twice
+FILE_UPLOAD_HANDLERS = [
+    'api.storage.HashingMemoryFileUploadHandler',
+    'api.storage.HashingTemporaryFileUploadHandler',
+]
+
+# gst certificates and business pictures are stored once per distinct content, see api/storage.py
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+    'uploads': {
+        'BACKEND': 'api.storage.ContentAddressedStorage',
+        'OPTIONS': {
+            'prefix': 'cas',
+        },
+    },
+}
+
+# seller ids are reserved from a database sequence in blocks per process, see api/sellerids.py
+SELLER_IDS = {
+    'BLOCK_SIZE': 100,
+}
+
+# media is served by api.media.MediaView after an access check. 'BACKEND': 'nginx' hands the
+# bytes to nginx with X-Accel-Redirect (needs an `internal` location at INTERNAL_PREFIX aliased
+# to MEDIA_ROOT), 'xsendfile' to apache / lighttpd with X-Sendfile.
+MEDIA_SENDFILE = {
+    'BACKEND': None,
+    'INTERNAL_PREFIX': '/protected-media/',
+    'MAX_AGE': 365 * 24 * 3600,
+    'MUTABLE_MAX_AGE': 3600,
+}
+
+# downscaled copies of gst certificates and business pictures, see api/imaging.py
+IMAGE_VARIANTS = {
+    'SIZES': {
+        'thumb': (240, 240),
+        'display': (1080, 1080),
+    },
+    'QUALITY': 80,
+    'WORKERS': 2,
+}
+
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/5.0/howto/static-files/
 
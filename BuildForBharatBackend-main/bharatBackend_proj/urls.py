@@ -17,11 +17,15 @@ Including another URLconf
 from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
+
+from api.media import MediaView
+from api.metrics import MetricsView
 
 urlpatterns = [
                   path('admin/', admin.site.urls),
                   path('api/', include('api.urls')),
+                  path('metrics', MetricsView.as_view(), name='metrics'),
+                  re_path(rf'^{settings.MEDIA_URL.strip("/")}/(?P<path>.*)$', MediaView.as_view(), name='media'),
               ] \
-              + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT) \
               + static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)